@@ -0,0 +1,33 @@
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import org.obolibrary.robot.CommandLineInterface;
+
+/**
+ * Run ROBOT commands sent over stdin in one long-lived JVM.
+ *
+ * <p>Each job is one line of tab-separated ROBOT arguments. When the job is done, one line is
+ * written to stdout: "OK", or "ERROR" followed by the message. Anything ROBOT prints goes to
+ * stderr. The worker exits when stdin is closed.
+ */
+public class RobotWorker {
+  public static void main(String[] args) throws Exception {
+    PrintStream replies = System.out;
+    System.setOut(System.err);
+    BufferedReader jobs = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+    String line;
+    while ((line = jobs.readLine()) != null) {
+      if (line.isEmpty()) {
+        continue;
+      }
+      try {
+        CommandLineInterface.execute(line.split("\t"));
+        replies.println("OK");
+      } catch (Exception e) {
+        String message = String.valueOf(e.getMessage()).replace('\n', ' ');
+        replies.println("ERROR " + e.getClass().getSimpleName() + ": " + message);
+      }
+      replies.flush();
+    }
+  }
+}
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+'''Generate synthetic inputs for the benchmarks, in the same formats as the
+IEDB exports and the UniProt downloads:
+
+	parent_protein.tsv   IEDB parent proteins (convert-parent-proteins.py)
+	source_parent.tsv    IEDB sources (convert-source-parents.py)
+	proteomes.tsv        species keys, groups and proteome IDs
+	proteomes/<ID>.rdf.gz  UniProt-style proteome RDF/XML for each species
+
+The data only depends on the scale and the seed, so the same scale always
+gives the same files. Protein names are drawn from a small pool, so that some
+labels are duplicated under the same species.
+
+Usage: generate.py [options] <out_dir>'''
+
+import argparse, gzip, os, random, sys
+
+# the species groups of update-branches.py
+groups = ['archeobacterium', 'bacterium', 'other-eukaryote', 'plant',
+	'vertebrate', 'virus']
+
+amino_acids = 'ACDEFGHIKLMNPQRSTVWY'
+
+# share of parent proteins from GenPept (the rest are UniProt)
+genpept_share = 0.1
+
+# sources per parent protein
+sources_per_protein = 2
+
+parent_columns = ['Accession', 'Database', 'Name', 'Title', 'Proteome ID',
+	'Proteome Label', 'Sequence']
+
+source_columns = ['Source ID', 'Accession', 'Database', 'Name', 'Aliases',
+	'Synonyms', 'Taxon ID', 'Taxon Name', 'Species ID', 'Species Label',
+	'Proteome ID', 'Proteome Label', 'Protein Strategy', 'Parent IRI',
+	'Parent Protein Database', 'Parent Protein Accession',
+	'Parent Sequence Length', 'Sequence']
+
+rdf_header = '''<?xml version='1.0' encoding='UTF-8'?>
+<rdf:RDF xml:base="http://purl.uniprot.org/uniprot/" \
+xmlns="http://purl.uniprot.org/core/" \
+xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" \
+xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#" \
+xmlns:faldo="http://biohackathon.org/resource/faldo#">
+'''
+
+def main(args):
+	parser = argparse.ArgumentParser(
+		description='Generate synthetic benchmark inputs')
+	parser.add_argument('out_dir')
+	add_scale_arguments(parser)
+	opts = parser.parse_args(args[1:])
+	scale = Scale(opts.species, opts.proteins, opts.features, opts.length,
+		opts.seed)
+	generate(scale, opts.out_dir)
+	print('generated %s in %s' % (scale, opts.out_dir))
+
+def add_scale_arguments(parser):
+	'''Add the scale options to an argument parser.'''
+	parser.add_argument('--species', type=int, default=10,
+		help='number of species (default: %(default)s)')
+	parser.add_argument('--proteins', type=int, default=100,
+		help='proteins per species (default: %(default)s)')
+	parser.add_argument('--features', type=int, default=2,
+		help='features (chains) per UniProt protein (default: %(default)s)')
+	parser.add_argument('--length', type=int, default=300,
+		help='sequence length (default: %(default)s)')
+	parser.add_argument('--seed', type=int, default=1,
+		help='random seed (default: %(default)s)')
+
+class Scale:
+	'''The size of a synthetic data set.'''
+
+	def __init__(self, species, proteins, features, length, seed=1):
+		self.species = species
+		self.proteins = proteins
+		self.features = features
+		self.length = length
+		self.seed = seed
+
+	def __str__(self):
+		return '%d species x %d proteins x %d features, length %d' \
+			% (self.species, self.proteins, self.features, self.length)
+
+	def name(self):
+		'''Get a directory name for the scale.'''
+		return 's%d-p%d-f%d-l%d-r%d' % (self.species, self.proteins,
+			self.features, self.length, self.seed)
+
+class Species:
+	'''A synthetic species and its proteins.'''
+
+	def __init__(self, n, scale, rand):
+		self.taxon_id = str(100000 + n)
+		self.label = 'Synthetic species %d' % n
+		self.key = '%s-synthetic-species-%d' % (self.taxon_id, n)
+		self.proteome_id = 'UP%09d' % (n + 1)
+		self.group = groups[n % len(groups)]
+		# a small pool of names, so that some labels are duplicated
+		names = ['Protein %s' % rand.choice(amino_acids) + str(i)
+			for i in range(max(1, scale.proteins // 4))]
+		self.proteins = []
+		for j in range(scale.proteins):
+			if rand.random() < genpept_share:
+				database = 'GenPept'
+				accession = 'XP_%06d%03d.1' % (n, j)
+			else:
+				database = 'UniProt'
+				accession = 'S%05d%04d' % (n, j)
+			sequence = ''.join(rand.choice(amino_acids)
+				for _ in range(scale.length))
+			self.proteins.append(
+				(accession, database, rand.choice(names), sequence))
+
+def generate(scale, out_dir):
+	'''Write all the synthetic inputs for a scale to a directory.'''
+	os.makedirs('%s/proteomes' % out_dir, exist_ok=True)
+	rand = random.Random(scale.seed)
+	species = [Species(n, scale, rand) for n in range(scale.species)]
+	write_parent_proteins(species, '%s/parent_protein.tsv' % out_dir)
+	write_source_parents(species, '%s/source_parent.tsv' % out_dir)
+	write_proteomes(species, '%s/proteomes.tsv' % out_dir)
+	for s in species:
+		write_proteome_rdf(s, scale,
+			'%s/proteomes/%s.rdf.gz' % (out_dir, s.proteome_id))
+
+def write_parent_proteins(species, path):
+	'''Write the parent protein export (TSV, with float proteome IDs).'''
+	with open(path, 'w') as f:
+		f.write('\t'.join(parent_columns) + '\n')
+		for s in species:
+			for accession, database, name, sequence in s.proteins:
+				f.write('\t'.join([
+					accession,
+					database,
+					'sp|%s|%s' % (accession, name.replace(' ', '_').upper()),
+					'%s OS=%s OX=%s' % (name, s.label, s.taxon_id),
+					'%s.0' % s.taxon_id,
+					'%s Reference Proteome' % s.label,
+					sequence]) + '\n')
+
+def write_source_parents(species, path):
+	'''Write the source export (TSV). Most sources have a parent protein;
+	the rest go under the "Other <species> protein" class.'''
+	source_id = 0
+	with open(path, 'w') as f:
+		f.write('\t'.join(source_columns) + '\n')
+		for s in species:
+			for accession, database, name, sequence in s.proteins:
+				for k in range(sources_per_protein):
+					source_id += 1
+					if k == 0 or database == 'UniProt':
+						parent_iri = 'https://www.uniprot.org/uniprot/%s' \
+							% accession
+						parent_database = database
+						parent_accession = accession
+					else:
+						parent_iri = 'http://iedb.org/taxon-protein/%s-other' \
+							% s.taxon_id
+						parent_database = ''
+						parent_accession = ''
+					f.write('\t'.join([
+						'%d.0' % source_id,
+						'SRC%08d' % source_id,
+						'GenPept',
+						'%s isoform %d' % (name, k),
+						'',
+						'%s synonym %d' % (name, k),
+						'%s.0' % s.taxon_id,
+						s.label,
+						s.taxon_id,
+						s.label,
+						s.taxon_id,
+						'%s Reference Proteome' % s.label,
+						'Reference proteome',
+						parent_iri,
+						parent_database,
+						parent_accession,
+						str(len(sequence)),
+						sequence]) + '\n')
+
+def write_proteomes(species, path):
+	'''Write the proteomes table used by update-branches.py.'''
+	with open(path, 'w') as f:
+		f.write('Species Key\tSpecies ID\tSpecies Label\tActive Taxa\tGroup'
+			'\tProteome ID\n')
+		for s in species:
+			f.write('\t'.join([s.key, s.taxon_id, s.label, s.taxon_id,
+				s.group, s.proteome_id]) + '\n')
+
+def write_proteome_rdf(s, scale, path):
+	'''Write a gzipped UniProt-style proteome with the UniProt proteins of a
+	species, each with its sequence and chain features.'''
+	with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as f:
+		f.write(rdf_header)
+		for accession, database, name, sequence in s.proteins:
+			if database != 'UniProt':
+				continue
+			f.write('<rdf:Description rdf:about="%s">' % accession)
+			f.write('<rdf:type rdf:resource='
+				'"http://purl.uniprot.org/core/Protein"/>')
+			f.write('<reviewed rdf:datatype='
+				'"http://www.w3.org/2001/XMLSchema#boolean">true</reviewed>')
+			for k in range(scale.features):
+				f.write('<annotation rdf:resource='
+					'"http://purl.uniprot.org/annotation/PRO_%s_%d"/>'
+					% (accession, k))
+			f.write('<sequence rdf:resource='
+				'"http://purl.uniprot.org/isoforms/%s-1"/>' % accession)
+			f.write('</rdf:Description>\n')
+			f.write('<rdf:Description rdf:about='
+				'"http://purl.uniprot.org/isoforms/%s-1">'
+				'<rdf:value>%s</rdf:value></rdf:Description>\n'
+				% (accession, sequence))
+			step = max(1, len(sequence) // max(1, scale.features))
+			for k in range(scale.features):
+				begin = k * step + 1
+				end = min(len(sequence), begin + step - 1)
+				annotation = 'http://purl.uniprot.org/annotation/PRO_%s_%d' \
+					% (accession, k)
+				positions = 'http://purl.uniprot.org/position/%s_%d' \
+					% (accession, k)
+				f.write('<Chain_Annotation rdf:about="%s">'
+					'<rdfs:comment>%s chain %d</rdfs:comment><range>'
+					'<rdf:Description rdf:about="%s_range">'
+					'<faldo:begin rdf:resource="%s_begin"/>'
+					'<faldo:end rdf:resource="%s_end"/>'
+					'</rdf:Description></range></Chain_Annotation>\n'
+					% (annotation, name, k, positions, positions, positions))
+				for suffix, value in (('begin', begin), ('end', end)):
+					f.write('<rdf:Description rdf:about="%s_%s">'
+						'<faldo:position rdf:datatype='
+						'"http://www.w3.org/2001/XMLSchema#int">%d'
+						'</faldo:position></rdf:Description>\n'
+						% (positions, suffix, value))
+		f.write('</rdf:RDF>\n')
+
+if __name__ == '__main__':
+	main(sys.argv)
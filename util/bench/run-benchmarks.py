@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+'''Run the pipeline scripts on synthetic data (see generate.py) at one or
+more scales, and append the wall time, CPU time and peak memory of each stage
+to a results table. Each stage runs as its own process, in the same order and
+with the same arguments as the Makefile. Proteomes are served to
+update-branches.py from a local HTTP server.
+
+Usage: run-benchmarks.py [options]
+       run-benchmarks.py --report [--results FILE]'''
+
+import argparse, datetime, http.server, os, shutil, subprocess, sys, \
+	threading, time
+from urllib.parse import parse_qs, urlparse
+
+import generate
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(os.path.dirname(bench_dir))
+scripts = os.path.join(repo_dir, 'util', 'scripts')
+
+results_file = 'build/bench/results.tsv'
+results_columns = ['Date', 'Commit', 'Stage', 'Species', 'Proteins',
+	'Features', 'Length', 'Seconds', 'CPU Seconds', 'Max RSS MB', 'Status']
+
+# stage name -> arguments ({data} is the generated data directory, {url}
+# the proteome server); each stage runs in a fresh directory, after the
+# stages before it
+stages = [
+	('convert-parent-proteins', ['convert-parent-proteins.py',
+		'{data}/parent_protein.tsv', 'parent-proteins.csv']),
+	('convert-source-parents', ['convert-source-parents.py',
+		'{data}/source_parent.tsv', 'source-parents.csv']),
+	('get-active-proteins', ['get-active-proteins.py',
+		'active-proteins.csv', 'parent-proteins.csv',
+		'parent-proteins-last.digests', 'protein-changes.csv',
+		'--digests', 'parent-proteins.digests']),
+	('parse-parents', ['parse-parents.py',
+		'parent-proteins.csv', 'iedb-proteins.ttl']),
+	('add-synonyms', ['add-synonyms.py',
+		'source-parents.csv', 'parent-proteins.csv', 'source-synonyms.ttl']),
+	('update-branches', ['update-branches.py', '--jobs', '{jobs}',
+		'--uniprot-url', '{url}', '--delta', 'protein-changes.csv',
+		'active-proteins.csv', '{data}/proteomes.tsv']),
+]
+
+def main(args):
+	parser = argparse.ArgumentParser(
+		description='Benchmark the pipeline on synthetic data')
+	parser.add_argument('--scales', default='10x100',
+		help='comma-separated SPECIESxPROTEINS scales (default: %(default)s)')
+	parser.add_argument('--features', type=int, default=2,
+		help='features per UniProt protein (default: %(default)s)')
+	parser.add_argument('--length', type=int, default=300,
+		help='sequence length (default: %(default)s)')
+	parser.add_argument('--seed', type=int, default=1,
+		help='random seed (default: %(default)s)')
+	parser.add_argument('--stages',
+		help='comma-separated stages to record (default: all)')
+	parser.add_argument('-j', '--jobs', type=int, default=1,
+		help='jobs for update-branches.py (default: %(default)s)')
+	parser.add_argument('--repeat', type=int, default=1,
+		help='number of runs at each scale (default: %(default)s)')
+	parser.add_argument('--work-dir', default='build/bench',
+		help='directory for the data and runs (default: %(default)s)')
+	parser.add_argument('--results', default=results_file,
+		help='results table to append to (default: %(default)s)')
+	parser.add_argument('--report', action='store_true',
+		help='print the results of the last two commits and exit')
+	opts = parser.parse_args(args[1:])
+
+	if opts.report:
+		print_report(opts.results)
+		return
+
+	names = [name for name, _ in stages]
+	selected = names
+	if opts.stages:
+		selected = opts.stages.split(',')
+		unknown = [s for s in selected if s not in names]
+		if unknown:
+			parser.error('unknown stages: %s' % ', '.join(unknown))
+
+	scales = []
+	for spec in opts.scales.split(','):
+		try:
+			species, proteins = [int(n) for n in spec.split('x')]
+		except ValueError:
+			parser.error('bad scale "%s" (expected SPECIESxPROTEINS)' % spec)
+		scales.append(generate.Scale(
+			species, proteins, opts.features, opts.length, opts.seed))
+
+	commit = get_commit()
+	server = ProteomeServer()
+	try:
+		for scale in scales:
+			scale_dir = os.path.abspath(
+				os.path.join(opts.work_dir, scale.name()))
+			data_dir = get_data(scale, scale_dir)
+			for _ in range(opts.repeat):
+				for result in run_stages(scale_dir, data_dir, selected,
+					opts.jobs, server.url(data_dir)):
+					stage, seconds, cpu, rss, status = result
+					print('%-24s %-36s %8.2fs %8.2fs cpu %8.1f MB%s'
+						% (stage, scale, seconds, cpu, rss,
+						'' if status == 0 else ' (exit %d)' % status))
+					append_result(opts.results, [
+						datetime.datetime.now().isoformat(timespec='seconds'),
+						commit, stage, scale.species, scale.proteins,
+						scale.features, scale.length, '%.3f' % seconds,
+						'%.3f' % cpu, '%.1f' % rss, status])
+	finally:
+		server.close()
+
+def get_commit():
+	'''Get the short hash of the checked-out commit, marked if the tree has
+	changes.'''
+	try:
+		return subprocess.check_output(
+			['git', 'describe', '--always', '--dirty'], cwd=repo_dir,
+			stderr=subprocess.DEVNULL).decode('utf-8').strip()
+	except (OSError, subprocess.CalledProcessError):
+		return ''
+
+def get_data(scale, scale_dir):
+	'''Generate the data for a scale, unless it is already there.'''
+	data_dir = os.path.join(scale_dir, 'data')
+	marker = os.path.join(data_dir, '.complete')
+	if not os.path.exists(marker):
+		print('generating %s' % scale)
+		generate.generate(scale, data_dir)
+		open(marker, 'w').close()
+	return data_dir
+
+def run_stages(scale_dir, data_dir, selected, jobs, url):
+	'''Run the stages in a fresh run directory, up to the last selected
+	stage. Yield (stage, seconds, CPU seconds, max RSS in MB, exit status)
+	for each selected stage.'''
+	run_dir = os.path.join(scale_dir, 'run')
+	if os.path.exists(run_dir):
+		shutil.rmtree(run_dir)
+	os.makedirs(run_dir)
+	# update-branches.py reads util/queries/build-branch.rq
+	os.symlink(os.path.join(repo_dir, 'util'), os.path.join(run_dir, 'util'))
+	# nothing was built before
+	open(os.path.join(run_dir, 'parent-proteins-last.digests'), 'w').close()
+
+	last = max(i for i, (name, _) in enumerate(stages) if name in selected)
+	for name, arguments in stages[:last + 1]:
+		cmd = [sys.executable, os.path.join(scripts, arguments[0])]
+		cmd.extend(a.format(data=data_dir, url=url, jobs=jobs)
+			for a in arguments[1:])
+		seconds, cpu, rss, status = measure(cmd, run_dir, name)
+		if name in selected:
+			yield name, seconds, cpu, rss, status
+
+def measure(cmd, cwd, name):
+	'''Run a command and get its wall time, CPU time (with its children) and
+	peak memory in MB. The output goes to <name>.log in the run directory.'''
+	with open(os.path.join(cwd, name + '.log'), 'w') as log:
+		start = time.perf_counter()
+		p = subprocess.Popen(cmd, cwd=cwd, stdout=log, stderr=log)
+		_, status, usage = os.wait4(p.pid, 0)
+		seconds = time.perf_counter() - start
+	# the process was reaped by wait4
+	if os.WIFSIGNALED(status):
+		p.returncode = -os.WTERMSIG(status)
+	else:
+		p.returncode = os.WEXITSTATUS(status)
+	cpu = usage.ru_utime + usage.ru_stime
+	return seconds, cpu, usage.ru_maxrss / 1024, p.returncode
+
+def append_result(path, values):
+	'''Append a row to the results table, with a header for a new table.'''
+	new = not os.path.exists(path)
+	os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+	with open(path, 'a') as f:
+		if new:
+			f.write('\t'.join(results_columns) + '\n')
+		f.write('\t'.join(str(v) for v in values) + '\n')
+
+def print_report(path):
+	'''Print, for each stage, the time and memory at each scale for the last
+	two commits in the results table, so that changes in scaling stand out.
+	Times are also given per 1000 proteins.'''
+	if not os.path.exists(path):
+		print('no results in %s' % path)
+		return
+	rows = []
+	with open(path, 'r') as f:
+		columns = next(f).rstrip('\n').split('\t')
+		for line in f:
+			rows.append(dict(zip(columns, line.rstrip('\n').split('\t'))))
+	commits = []
+	for row in rows:
+		if row['Commit'] in commits:
+			commits.remove(row['Commit'])
+		commits.append(row['Commit'])
+	commits = commits[-2:]
+
+	# (stage, scale, commit) -> best (seconds, MB) of the runs
+	best = {}
+	for row in rows:
+		if row['Commit'] not in commits or row['Status'] != '0':
+			continue
+		scale = tuple(int(row[c])
+			for c in ('Species', 'Proteins', 'Features', 'Length'))
+		key = (row['Stage'], scale, row['Commit'])
+		value = (float(row['Seconds']), float(row['Max RSS MB']))
+		if key not in best or value < best[key]:
+			best[key] = value
+
+	for stage, _ in stages:
+		scales = sorted(set(k[1] for k in best if k[0] == stage),
+			key=lambda s: (s[0] * s[1], s))
+		if not scales:
+			continue
+		print('\n%s' % stage)
+		print('%-24s %-16s %10s %12s %10s'
+			% ('scale', 'commit', 'seconds', 's/1000 prot', 'MB'))
+		for scale in scales:
+			for commit in commits:
+				value = best.get((stage, scale, commit))
+				if value is None:
+					continue
+				proteins = scale[0] * scale[1]
+				print('%-24s %-16s %10.2f %12.3f %10.1f'
+					% ('%dx%d f%d l%d' % scale, commit, value[0],
+					value[0] * 1000 / proteins, value[1]))
+
+class ProteomeServer:
+	'''A local HTTP server for the generated proteomes, answering the
+	UniProt download URLs of downloads.py.'''
+
+	def __init__(self):
+		self.server = http.server.ThreadingHTTPServer(
+			('127.0.0.1', 0), ProteomeHandler)
+		self.thread = threading.Thread(target=self.server.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def url(self, data_dir):
+		'''Get the base URL for the proteomes of a data directory.'''
+		return 'http://127.0.0.1:%d%s' \
+			% (self.server.server_address[1], data_dir)
+
+	def close(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+class ProteomeHandler(http.server.BaseHTTPRequestHandler):
+	'''Serve <data_dir>/proteomes/<proteome ID>.rdf.gz for
+	<data_dir>/uniprot/?query=proteome:<proteome ID>&...'''
+	protocol_version = 'HTTP/1.1'
+
+	def do_GET(self):
+		url = urlparse(self.path)
+		data_dir = url.path.rsplit('/uniprot', 1)[0]
+		query = parse_qs(url.query).get('query', [''])[0]
+		proteome_id = query.split(':', 1)[-1]
+		path = '%s/proteomes/%s.rdf.gz' \
+			% (data_dir, os.path.basename(proteome_id))
+		if not os.path.exists(path):
+			self.send_response(404)
+			self.send_header('Content-Length', '0')
+			self.end_headers()
+			return
+		with open(path, 'rb') as f:
+			data = f.read()
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/gzip')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def log_message(self, *args):
+		pass
+
+if __name__ == '__main__':
+	main(sys.argv)
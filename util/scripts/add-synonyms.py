@@ -1,171 +1,167 @@
 #!/usr/bin/env python3
 
-import csv, rdflib, sys
-from rdflib import URIRef, BNode, Literal, RDF, RDFS, XSD, OWL
+import argparse, sys
+
+import ntriples, shards, tables, tracing
 
 rdfs = 'http://www.w3.org/2000/01/rdf-schema#'
 rdf = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
 owl = 'http://www.w3.org/2002/07/owl#'
+xsd_string = 'http://www.w3.org/2001/XMLSchema#string'
 iedb = 'http://iedb.org/'
 
-# global maps
-parent_synonyms = {}
-other_proteins = {}
-other_protein_labels = {}
+# predicates
+rdf_type = ntriples.iri(rdf + 'type')
+subclass_of = ntriples.iri(rdfs + 'subClassOf')
+label_of = ntriples.iri(rdfs + 'label')
+synonym_of = ntriples.iri(iedb + 'protein-synonym')
+accession_of = ntriples.iri(iedb + 'has-accession')
+accession_iri_of = ntriples.iri(iedb + 'has-accession-iri')
+database_of = ntriples.iri(iedb + 'has-source-database')
+source_id_of = ntriples.iri(iedb + 'has-source-id')
+owl_class = ntriples.iri(owl + 'Class')
+
+# the columns of the source table that are used
+columns = ['Source ID', 'Accession', 'Database', 'Name', 'Species Label',
+	'Proteome ID', 'Parent IRI', 'Parent Protein Accession']
 
 def main(args):
-	'''Parse the source file into the two maps, then use the maps to create 
-	protein synonym triples in an RDF graph. New classes will be created for 
-	"other X protein" parents & children. Write the triples to the out file.'''
-	global parent_synonyms, other_proteins, other_protein_labels
-
-	source_file = args[1]
-	active_proteins_file = args[2]
-	out_file = args[3]
-
-	active_proteins = get_active_proteins(active_proteins_file)
-	parse_sources(source_file, active_proteins)
-
-	gout = rdflib.Graph()
-	gout.bind('owl', owl)
-	gout.bind('obo', 'http://purl.obolibrary.org/obo/')
-	gout.bind('iedb', iedb)
-
-	add_protein_synonyms(gout)
-	add_other_proteins(gout)
-
-	with open(out_file, 'wb') as f:
-		gout.serialize(f, format='ttl')
-
-def add_other_proteins(gout):
-	'''Add "other X protein" classes to the graph as subclass of "X protein". 
-	For each child of that protein, create a child class instead of adding as a 
-	synonym.'''
-	global other_proteins, other_protein_labels
-
-	for parent,children in other_proteins.items():
-		# create the "Other X protein" parent class
-		label = 'Other %s protein' % other_protein_labels[parent]
-		# add subclass statement
-		gout.add((URIRef(parent), 
-			URIRef(rdfs + 'subClassOf'), 
-			URIRef(parent[:-6])))
-		# add label
-		gout.add((URIRef(parent), 
-			URIRef(rdfs + 'label'), 
-			Literal(label, datatype=XSD.string)))
-		# add the children
-		for c in children:
-			iri = c['iri']
-			sid = c['source_id']
-			source = c['source']
-			accession = c['accession']
-			label = '%s [%s]' % (c['label'], accession)
-			# create accession IRI based on source DB
-			if source == 'GenPept':
-				accession_iri = 'http://www.ncbi.nlm.nih.gov/protein/' \
-					+ accession
-			elif source == 'UniProt':
-				accession_iri = 'http://www.uniprot.org/uniprot/' + accession
-			else:
-				print('Unknown source for "%s": %s' % (label, source))
-				continue
-			# add subclass statement
-			gout.add((URIRef(iri), URIRef(rdfs + 'subClassOf'), URIRef(parent)))
-			# add label
-			gout.add((URIRef(iri), 
-				URIRef(rdfs + 'label'), 
-				Literal(label, datatype=XSD.string)))
-			# add accession
-			gout.add((URIRef(iri), 
-				URIRef(iedb + 'has-accession'), 
-				Literal(accession, datatype=XSD.string)))
-			# add accession IRI
-			gout.add((URIRef(iri), 
-				URIRef(iedb + 'has-accession-iri'), 
-				URIRef(accession_iri)))
-			# add source DB
-			gout.add((URIRef(iri), 
-				URIRef(iedb + 'has-source-database'), 
-				Literal(source, datatype=XSD.string)))
-			# add source ID
-			gout.add((URIRef(iri), 
-				URIRef(iedb + 'has-source-id'), 
-				Literal(sid, datatype=XSD.string)))
-
-def add_protein_synonyms(gout):
-	'''Add child protein labels as synonyms to the parent proteins. Include a 
-	declaration so it is properly loaded by OWLAPI.'''
-	global parent_synonyms
-
-	for iri,syns in parent_synonyms.items():
-		for s in syns:
-			# add declaration
-			gout.add((URIRef(iri), URIRef(rdf + 'type'), URIRef(owl + 'Class')))
-			# add synonym
-			gout.add((URIRef(iri), 
-				URIRef(iedb + 'protein-synonym'), 
-				Literal(s, datatype=XSD.string)))
-
-def parse_source_row(row):
-	'''Parse a row from the source table. Use the IRI to find the parent to add 
-	a synonym to. If the IRI references an "other" protein, add the IRI and 
-	synonyms as children to the other_proteins map. Otherwise, add the IRI and 
-	synonyms to the parent_synonyms map.'''
-	global parent_synonyms, other_proteins, other_protein_labels
-
-	# possibly - add code to ignore uniprot parents that aren't in tree
-
+	'''Read the source file one row at a time and write protein synonym
+	triples for the rows of active proteins. New classes will be created for
+	"other X protein" parents & children. The triples are written to the out
+	file as they are made, one per line (Turtle), or as sorted N-Triples if
+	the out file ends with .nt or .nt.gz. With --shards, one sorted N-Triples
+	shard is kept per proteome ID and only the shards whose rows changed are
+	regenerated before they are merged into the output.'''
+	parser = argparse.ArgumentParser(
+		description='Create protein synonyms from the source table')
+	parser.add_argument('source_file')
+	parser.add_argument('active_proteins_file')
+	parser.add_argument('out_file')
+	parser.add_argument('--shards', metavar='DIR',
+		help='directory of the per-species shards')
+	opts = parser.parse_args(args[1:])
+
+	source_file = opts.source_file
+	out_file = opts.out_file
+
+	active_proteins = get_active_proteins(opts.active_proteins_file)
+	if opts.shards:
+		# every shard declares its own parents; the union drops the repeats
+		files = shards.update_shards(
+			opts.shards,
+			lambda: active_rows(source_file, active_proteins),
+			lambda row: row['Proteome ID'],
+			row_triples,
+			shards.script_digest(__file__),
+			lambda species: active_rows(
+				source_file, active_proteins, species))
+		ntriples.union(out_file, files)
+		return
+	triples = source_triples(source_file, active_proteins)
+
+	if ntriples.is_ntriples(out_file):
+		ntriples.write_sorted(triples, out_file)
+		return
+	with open(out_file, 'w') as f:
+		for t in triples:
+			f.write(t)
+
+def string(value):
+	'''Format an xsd:string literal.'''
+	return ntriples.literal(value, xsd_string)
+
+def other_protein_triples(iri, row):
+	'''Get the triples of the "Other X protein" parent class, as a subclass of
+	"X protein".'''
+	parent = ntriples.iri(iri)
+	label = 'Other %s protein' % row['Species Label']
+	return [
+		ntriples.triple(parent, subclass_of, ntriples.iri(iri[:-6])),
+		ntriples.triple(parent, label_of, string(label))]
+
+def child_protein_triples(iri, row):
+	'''Get the triples of a child of an "Other X protein" class. The child is
+	created as a class instead of being added as a synonym.'''
+	sid = row['Source ID']
+	source = row['Database']
+	accession = row['Accession']
+	label = '%s [%s]' % (row['Name'], accession)
+	# create accession IRI based on source DB
+	if source == 'GenPept':
+		accession_iri = 'http://www.ncbi.nlm.nih.gov/protein/' + accession
+	elif source == 'UniProt':
+		accession_iri = 'http://www.uniprot.org/uniprot/' + accession
+	else:
+		print('Unknown source for "%s": %s' % (label, source))
+		return []
+	child = ntriples.iri('http://iedb.org/source/' + sid)
+	return [
+		ntriples.triple(child, subclass_of, ntriples.iri(iri)),
+		ntriples.triple(child, label_of, string(label)),
+		ntriples.triple(child, accession_of, string(accession)),
+		ntriples.triple(child, accession_iri_of, ntriples.iri(accession_iri)),
+		ntriples.triple(child, database_of, string(source)),
+		ntriples.triple(child, source_id_of, string(sid))]
+
+def synonym_triples(iri, row, declare):
+	'''Get the triples that add the row's protein label as a synonym of the
+	parent protein. Include a declaration (once per parent) so it is properly
+	loaded by OWLAPI.'''
+	parent = ntriples.iri(iri)
+	triples = []
+	if declare:
+		triples.append(ntriples.triple(parent, rdf_type, owl_class))
+	triples.append(ntriples.triple(parent, synonym_of, string(row['Name'])))
+	return triples
+
+def row_triples(row, seen=None):
+	'''Get the triples of a source row. If a set of the parent IRIs seen so
+	far is given, the parent's own triples are only included the first time
+	it is seen.'''
 	iri = row['Parent IRI']
 	# replace HTTPS with HTTP
 	if 'https' in iri:
 		iri = iri.replace('https', 'http')
+	first = seen is None or iri not in seen
+	if seen is not None:
+		seen.add(iri)
 	if 'other' in iri:
-		# accession should be in brackets after label
-		other_protein_labels[iri] = row['Species Label']
-		if iri in other_proteins:
-			children = other_proteins[iri]
-		else:
-			children = []
-		label = row['Name']
-		source = row['Database']
-		accession = row['Accession']
-		protein_iri = 'http://iedb.org/source/' + row['Source ID']
-		child = {'iri': protein_iri, 
-				 'source_id': row['Source ID'], 
-				 'label': label, 
-				 'source': source, 
-				 'accession': accession}
-		children.append(child)
-		other_proteins[iri] = children
-
+		triples = []
+		if first:
+			triples.extend(other_protein_triples(iri, row))
+		triples.extend(child_protein_triples(iri, row))
+		return triples
+	return synonym_triples(iri, row, first)
+
+def active_rows(source_file, active_proteins, species=None):
+	'''Yield the rows of the source table whose parent protein is active
+	(or that have no parent protein), only for the given species (proteome
+	IDs) if any.'''
+	if species is None:
+		rows = tables.read_rows(source_file, columns)
 	else:
-		if iri in parent_synonyms:
-			synonyms = parent_synonyms[iri]
-		else:
-			synonyms = []
-		synonyms.append(row['Name'])
-		parent_synonyms[row['Parent IRI']] = synonyms
+		rows = tables.read_species(source_file, species, 'Proteome ID', columns)
+	for row in rows:
+		accession = row['Parent Protein Accession']
+		if accession == '' or accession in active_proteins:
+			yield row
+
+def source_triples(source_file, active_proteins):
+	'''Yield the triples for each active row of the source table. Only the
+	IRIs of the parents seen so far are kept, so memory does not grow with
+	the number of rows.'''
+	seen = set()
+	for row in active_rows(source_file, active_proteins):
+		yield from row_triples(row, seen)
 
 def get_active_proteins(active_proteins_file):
-	''''''
-	proteins = []
-	with open(active_proteins_file, 'r') as f:
-		rows = csv.DictReader(f)
-		for row in rows:
-			proteins.append(row['Accession'])
+	'''Get the set of accessions in the active proteins table.'''
+	proteins = set()
+	for row in tables.read_rows(active_proteins_file, ['Accession']):
+		proteins.add(row['Accession'])
 	return proteins
 
-def parse_sources(source_file, active_proteins):
-	'''Parse a source table into parent_synonym and other_proteins maps.'''
-	global parent_synonyms, other_proteins
-
-	with open(source_file, 'r') as f:
-		rows = csv.DictReader(f)
-		for row in rows:
-			if (row['Parent Protein Accession'] == '')\
-			 or (row['Parent Protein Accession'] in active_proteins):
-				parse_source_row(row)
-
 if __name__ == '__main__':
-	main(sys.argv)
+	with tracing.script(sys.argv):
+		main(sys.argv)
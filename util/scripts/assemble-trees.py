@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+'''Write the gzipped protein tree and molecule tree in one pass over the
+merged protein tree (RDF/XML from ROBOT), without parsing it as OWL.
+
+Both outputs are block gzip files (see bgzip.py), indexed by the IRI of each
+entity. The body of the protein tree (all of it but the root element and the
+ontology header) is compressed once, and the same blocks are written to both
+files. The molecule tree gets its own header: the namespaces of both trees
+and a new ontology element with the given IRIs. The body of the non-peptide
+tree is spliced in after the protein tree body; its own ontology element is
+dropped, as with ROBOT merge. The non-peptide tree is small and is read
+whole.
+
+Usage: assemble-trees.py [options] <merged.owl> <non-peptide-tree.owl>
+       <protein-tree.owl.gz> <molecule-tree.owl.gz>'''
+
+import argparse, re, sys
+from xml.sax.saxutils import quoteattr
+
+import bgzip, tracing
+
+# the comment that the OWL API writes before each entity
+entity_comment = re.compile(r'^\s*<!-- (\S+) -->\s*$')
+
+# the root start tag (with its attributes)
+root_start = re.compile(r'''<rdf:RDF((?:[^>"']|"[^"]*"|'[^']*')*)>''')
+
+# the attributes of a start tag
+attribute = re.compile(r'''([^\s=]+)\s*=\s*("[^"]*"|'[^']*')''')
+
+# comments, CDATA sections and tags of an XML fragment
+tag = re.compile(r'''<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>'''
+	r'''|<(/?)([^\s/>!?]+)((?:[^>"']|"[^"]*"|'[^']*')*?)(/?)>''', re.S)
+
+def main(args):
+	parser = argparse.ArgumentParser(
+		description='Write the protein and molecule trees in one pass')
+	parser.add_argument('merged_file')
+	parser.add_argument('np_file')
+	parser.add_argument('protein_file')
+	parser.add_argument('molecule_file')
+	parser.add_argument('--ontology-iri', required=True,
+		help='ontology IRI of the molecule tree')
+	parser.add_argument('--version-iri', required=True,
+		help='version IRI of the molecule tree')
+	parser.add_argument('--compress-level', type=int, default=6,
+		help='gzip compression level (default: %(default)s)')
+	parser.add_argument('-j', '--jobs', type=int, default=None,
+		help='compression threads (default: all cores)')
+	opts = parser.parse_args(args[1:])
+
+	assemble(opts.merged_file, opts.np_file, opts.protein_file,
+		opts.molecule_file, opts.ontology_iri, opts.version_iri,
+		opts.compress_level, opts.jobs)
+
+class Document:
+	'''An RDF/XML file split into its prolog (the XML declaration and
+	anything else before the root element), the attributes of the root
+	element, the ontology element, the body and what follows the root.'''
+
+	def __init__(self, f):
+		self.f = f
+		self.prolog, self.root, self.attributes = read_root(f)
+		self.ontology, self.first = read_ontology(f)
+		self.trailer = ''
+
+	def header(self):
+		'''Get the text of the prolog, root start tag and ontology element.'''
+		return self.prolog + self.root + self.ontology
+
+	def body(self):
+		'''Yield the lines of the body. The end of the root element and the
+		rest of the file are kept as the trailer.'''
+		lines = self.f
+		if self.first is not None:
+			lines = prepend(self.first, lines)
+		for line in lines:
+			if line.strip() == '</rdf:RDF>':
+				self.trailer = line[line.index('</rdf:RDF>'):] + self.f.read()
+				return
+			yield line
+		raise ValueError('no end of the rdf:RDF element')
+
+def prepend(line, lines):
+	yield line
+	yield from lines
+
+def read_root(f):
+	'''Read up to the end of the root start tag. Return the text before it,
+	its text, and its attributes as a list of (name, value) pairs.'''
+	text = ''
+	for line in f:
+		text += line
+		start = text.find('<rdf:RDF')
+		if start < 0:
+			continue
+		m = root_start.match(text, start)
+		if m:
+			# anything after the root tag on the same line is kept with it
+			return text[:start], text[start:], \
+				attribute.findall(m.group(1))
+	raise ValueError('no rdf:RDF root element')
+
+def read_ontology(f):
+	'''Read the ontology element that follows the root start tag, with the
+	blank lines before it. Return its text and the first line of the body
+	if it was read instead (there is no ontology element).'''
+	text = ''
+	for line in f:
+		if not line.strip():
+			text += line
+			continue
+		if not line.lstrip().startswith('<owl:Ontology'):
+			return text, line
+		text += line
+		if line.rstrip().endswith('/>'):
+			return text, None
+		for line in f:
+			text += line
+			if '</owl:Ontology>' in line:
+				return text, None
+		break
+	raise ValueError('no end of the owl:Ontology element')
+
+def merge_attributes(attributes, others):
+	'''Add the namespace declarations (and xml:base) of another root
+	element. Return the merged attributes and the attributes of the other
+	root that conflict with them (the same name with another value).'''
+	merged = list(attributes)
+	values = dict(attributes)
+	conflicts = []
+	for name, value in others:
+		if name not in values:
+			merged.append((name, value))
+			values[name] = value
+		elif values[name] != value:
+			conflicts.append((name, value))
+	return merged, conflicts
+
+def root_tag(attributes):
+	'''Format a root start tag in the layout of the OWL API.'''
+	return '<rdf:RDF %s>\n' % '\n     '.join(
+		'%s=%s' % (name, value) for name, value in attributes)
+
+def ontology_element(ontology_iri, version_iri):
+	'''Format an ontology element with its IRI and version IRI.'''
+	return '''    <owl:Ontology rdf:about=%s>
+        <owl:versionIRI rdf:resource=%s/>
+    </owl:Ontology>
+''' % (quoteattr(ontology_iri), quoteattr(version_iri))
+
+def scope_declarations(text, declarations):
+	'''Add declarations to every top-level start tag of an XML fragment,
+	so that they apply to it and its children only.'''
+	if not declarations:
+		return text
+	extra = ''.join(' %s=%s' % d for d in declarations)
+	parts = []
+	depth = 0
+	last = 0
+	for m in tag.finditer(text):
+		closing, name, _, empty = m.groups()
+		if name is None:
+			continue
+		if closing:
+			depth -= 1
+			continue
+		if depth == 0:
+			insert = m.start(2) + len(name)
+			parts.append(text[last:insert])
+			parts.append(extra)
+			last = insert
+		if not empty:
+			depth += 1
+	parts.append(text[last:])
+	return ''.join(parts)
+
+def write_body(writer, lines):
+	'''Write the lines of a body, with a record for each entity: from the
+	comment before it to the next entity.'''
+	for line in lines:
+		if line.startswith('    <!--'):
+			m = entity_comment.match(line)
+			if m:
+				writer.begin_record(m.group(1))
+		writer.write(line)
+	writer.end_record()
+
+def assemble(merged_file, np_file, protein_file, molecule_file, ontology_iri,
+	version_iri, level=6, threads=None):
+	'''Write the protein tree and molecule tree.'''
+	with open(np_file, 'r', encoding='utf-8') as f:
+		np_tree = Document(f)
+		np_body = ''.join(np_tree.body())
+	with open(merged_file, 'r', encoding='utf-8') as f, \
+		bgzip.Writer(protein_file, threads, level, index=True) as protein, \
+		bgzip.Writer(molecule_file, threads, level, index=True) as molecule:
+		merged = Document(f)
+		attributes, conflicts = merge_attributes(
+			merged.attributes, np_tree.attributes)
+		protein.write(merged.header())
+		molecule.write(merged.prolog + root_tag(attributes)
+			+ ontology_element(ontology_iri, version_iri))
+
+		# the protein tree body is compressed once for both files
+		with protein.tee(molecule):
+			write_body(protein, merged.body())
+
+		protein.write(merged.trailer)
+		write_body(molecule, scope_declarations(np_body, conflicts)
+			.splitlines(True))
+		molecule.write(merged.trailer)
+	print('wrote %s and %s' % (protein_file, molecule_file))
+
+if __name__ == '__main__':
+	with tracing.script(sys.argv):
+		main(sys.argv)
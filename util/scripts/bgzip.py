@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+'''Block gzip: write gzip files as a series of independent gzip members
+(blocks), compressed on all cores, with an optional index of records. Like
+BGZF, the result is one valid gzip file that any gzip reader can decompress,
+but each block can also be decompressed on its own.
+
+A writer can mark the start of a record (such as a class or the triples of a
+subject) with a key. The index (<file>.idx) has one line per record, sorted by
+key: the key, the offset of the block the record starts in, the offset of the
+record in the uncompressed block and the length of the record. A record can
+span several blocks. To read one record, seek to its block and decompress
+from there.
+
+Usage:
+  bgzip.py compress [-j N] <input> <output>  compress a file in blocks
+  bgzip.py get <file.gz> <key>...           print records using the index'''
+
+import argparse, collections, concurrent.futures, gzip, mmap, os, sys
+
+import tracing
+
+# uncompressed bytes in each block
+block_size = 1024 * 1024
+
+def main(args):
+	parser = argparse.ArgumentParser(description='Block gzip files')
+	parser.add_argument('command', choices=['compress', 'get'])
+	parser.add_argument('file')
+	parser.add_argument('args', nargs='+', metavar='output|key')
+	parser.add_argument('-j', '--jobs', type=int, default=None,
+		help='compression threads (default: all cores)')
+	parser.add_argument('--level', type=int, default=6,
+		help='compression level (default: %(default)s)')
+	opts = parser.parse_intermixed_args(args[1:])
+
+	if opts.command == 'compress':
+		if len(opts.args) != 1:
+			parser.error('compress takes one output file')
+		with Writer(opts.args[0], opts.jobs, opts.level) as w, \
+			open(opts.file, 'rb') as f:
+			for chunk in iter(lambda: f.read(block_size), b''):
+				w.write(chunk)
+		return
+	for key in opts.args:
+		record = read_record(opts.file, key)
+		if record is None:
+			print('not found: %s' % key, file=sys.stderr)
+			sys.exit(1)
+		sys.stdout.buffer.write(record)
+
+def index_path(path):
+	return path + '.idx'
+
+def compress(data, level):
+	'''Compress one block as a gzip member.'''
+	return gzip.compress(data, compresslevel=level, mtime=0)
+
+class Writer:
+	'''Write a block gzip file, replacing it in one step when the writer is
+	closed. Blocks are compressed by a pool of threads and written in
+	order. With index=True, the records started with begin_record() are
+	written to the index.'''
+
+	def __init__(self, path, threads=None, level=6, size=block_size,
+		index=False):
+		self.path = path
+		self.tmp_file = '%s.%d.tmp' % (path, os.getpid())
+		self.f = open(self.tmp_file, 'wb')
+		self.level = level
+		self.size = size
+		threads = threads or os.cpu_count() or 1
+		self.pool = concurrent.futures.ThreadPoolExecutor(threads)
+		# blocks being compressed: (future, size, records, writers)
+		self.pending = collections.deque()
+		self.max_pending = 2 * threads
+		# the uncompressed data of the current block
+		self.chunks = []
+		self.length = 0
+		# records that start in the current block: [key, offset, length]
+		self.records = []
+		# the record being written, and its uncompressed start
+		self.record = None
+		self.start = 0
+		# uncompressed offset of the current block
+		self.position = 0
+		# compressed offset of the next block
+		self.offset = 0
+		# (record, block offset) of each record, if indexed
+		self.entries = [] if index else None
+		# other writers that the blocks are also written to
+		self.tees = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, *exc):
+		if exc_type is None:
+			self.close()
+		else:
+			self.abort()
+
+	def write(self, data):
+		'''Write text or bytes.'''
+		if isinstance(data, str):
+			data = data.encode('utf-8')
+		self.chunks.append(data)
+		self.length += len(data)
+		if self.length >= self.size:
+			self.flush()
+
+	def begin_record(self, key):
+		'''Start a record at the current position. The last record ends
+		here.'''
+		self.end_record()
+		self.record = [key, self.length, None]
+		self.start = self.position + self.length
+		self.records.append(self.record)
+
+	def end_record(self):
+		'''End the current record (if any) at the current position.'''
+		if self.record is not None:
+			self.record[2] = self.position + self.length - self.start
+			self.record = None
+
+	def flush(self):
+		'''End the current block, so that the next write starts a new
+		one.'''
+		if self.length == 0:
+			return
+		data = b''.join(self.chunks)
+		self.pending.append((self.pool.submit(compress, data, self.level),
+			len(data), self.records, [self] + self.tees))
+		self.position += len(data)
+		self.chunks = []
+		self.length = 0
+		self.records = []
+		while self.pending and (len(self.pending) > self.max_pending
+			or self.pending[0][0].done()):
+			self.write_block()
+
+	def drain(self):
+		'''Write all the blocks that are being compressed.'''
+		self.flush()
+		while self.pending:
+			self.write_block()
+
+	def write_block(self):
+		'''Write the oldest compressed block to its writers.'''
+		future, size, records, writers = self.pending.popleft()
+		data = future.result()
+		for w in writers:
+			if w.entries is not None:
+				w.entries.extend((r, w.offset) for r in records)
+			w.f.write(data)
+			w.offset += len(data)
+			if w is not self:
+				w.position += size
+
+	def tee(self, other):
+		'''Also write the blocks to another writer, in a with block: the
+		blocks are compressed once and written to both files, and the
+		records are indexed in both. Both writers start a new block.'''
+		return Tee(self, other)
+
+	def close(self):
+		'''Write the last block and the index, and move the file into
+		place.'''
+		self.end_record()
+		self.drain()
+		self.pool.shutdown()
+		self.f.close()
+		os.replace(self.tmp_file, self.path)
+		if self.entries is not None:
+			write_index(index_path(self.path), self.entries)
+
+	def abort(self):
+		'''Stop writing and remove the partial file.'''
+		for future, _, _, _ in self.pending:
+			future.cancel()
+		self.pending.clear()
+		self.pool.shutdown()
+		self.f.close()
+		os.remove(self.tmp_file)
+
+class Tee:
+	'''A with block in which the blocks of a writer also go to another.'''
+
+	def __init__(self, writer, other):
+		self.writer = writer
+		self.other = other
+
+	def __enter__(self):
+		self.other.drain()
+		self.writer.flush()
+		self.writer.tees.append(self.other)
+		return self.writer
+
+	def __exit__(self, *exc):
+		self.writer.end_record()
+		self.writer.drain()
+		self.writer.tees.remove(self.other)
+
+def write_index(path, entries):
+	'''Write the index of a block gzip file, sorted by key, in one step.'''
+	lines = []
+	for (key, offset, length), block in entries:
+		lines.append(('%s\t%d\t%d\t%d\n' % (key, block, offset, length))
+			.encode('utf-8'))
+	lines.sort(key=lambda line: line[:line.index(b'\t')])
+	tmp_file = path + '.tmp'
+	with open(tmp_file, 'wb') as f:
+		f.writelines(lines)
+	os.replace(tmp_file, path)
+
+def lookup(path, key):
+	'''Find a key in the index of a block gzip file, with a binary search of
+	the index file. Return (block offset, offset in block, length), or None
+	if the key is not in the index.'''
+	key = key.encode('utf-8')
+	index_file = index_path(path)
+	if not os.path.exists(index_file) or os.path.getsize(index_file) == 0:
+		return None
+	with open(index_file, 'rb') as f, \
+		mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+		# find the first line with a key that is not less than the key
+		lo, hi = 0, len(m)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			start = m.rfind(b'\n', 0, mid) + 1
+			end = m.find(b'\n', start)
+			if end < 0:
+				end = len(m)
+			if m[start:m.find(b'\t', start)] < key:
+				lo = end + 1
+			else:
+				hi = start
+		if lo >= len(m):
+			return None
+		end = m.find(b'\n', lo)
+		fields = m[lo:end if end >= 0 else len(m)].split(b'\t')
+		if fields[0] != key:
+			return None
+		return int(fields[1]), int(fields[2]), int(fields[3])
+
+def read_at(path, block, offset, length):
+	'''Read length bytes from offset in the block at a compressed offset,
+	continuing into the next blocks if needed.'''
+	with open(path, 'rb') as f:
+		f.seek(block)
+		with gzip.GzipFile(fileobj=f, mode='rb') as g:
+			g.seek(offset)
+			return g.read(length)
+
+def read_record(path, key):
+	'''Read the record for a key, or None if it is not in the index.'''
+	found = lookup(path, key)
+	if found is None:
+		return None
+	return read_at(path, *found)
+
+if __name__ == '__main__':
+	with tracing.script(sys.argv):
+		main(sys.argv)
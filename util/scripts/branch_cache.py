@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+'''Content-addressed cache of species branches. A branch is stored under a
+hash of everything it is built from: the proteome file, the sorted active
+accessions, the rendered branch query and the way the branch is built. The
+catalog (see catalog.py) records the latest key for each species.
+
+Usage: branch_cache.py gc
+Remove the cached branches that are no longer the latest for any species.'''
+
+import hashlib, os, shutil, sys
+
+import catalog
+
+cache_dir = 'build/cache'
+branch_template = 'util/queries/build-branch.rq'
+
+# the catalog of this process (pid, Catalog), see file_digest()
+connection = None
+
+def main(args):
+	if len(args) < 2 or args[1] != 'gc':
+		print(__doc__.split('\n\n')[-1])
+		return
+	removed = collect_garbage()
+	print('removed %d stale branches' % removed)
+
+def file_digest(path):
+	'''Get the SHA-256 of a file. The digest is cached in the catalog and only
+	recomputed when the size or modification time changes.'''
+	global connection
+	if connection is None or connection[0] != os.getpid():
+		connection = (os.getpid(), catalog.Catalog())
+	return connection[1].file_digest(path)
+
+def text_digest(text):
+	'''Get the SHA-256 of a string.'''
+	return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def branch_key(proteome_file, accessions, query, method):
+	'''Get the cache key for a branch from the proteome file, the active
+	accessions, the rendered query and the build method.'''
+	h = hashlib.sha256()
+	h.update(file_digest(proteome_file).encode('utf-8'))
+	h.update(b'\0')
+	h.update('\n'.join(sorted(set(accessions))).encode('utf-8'))
+	h.update(b'\0')
+	h.update(query.encode('utf-8'))
+	h.update(b'\0')
+	h.update(method.encode('utf-8'))
+	return h.hexdigest()
+
+def entry_path(key):
+	'''Get the path of the cached branch for a key.'''
+	return '%s/branches/%s/%s.ttl' % (cache_dir, key[:2], key)
+
+def get(key, out_file):
+	'''Copy the cached branch for key to the out file. Return False if the
+	branch is not cached.'''
+	path = entry_path(key)
+	if not os.path.exists(path):
+		return False
+	copy_file(path, out_file)
+	return True
+
+def put(key, branch_file):
+	'''Add a branch file to the cache.'''
+	path = entry_path(key)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	copy_file(branch_file, path)
+
+def copy_file(src, dst):
+	'''Copy a file so that the destination is replaced in one step.'''
+	tmp = '%s.%d.tmp' % (dst, os.getpid())
+	shutil.copyfile(src, tmp)
+	os.replace(tmp, dst)
+
+def template_digest():
+	'''Get the digest of the current branch query template.'''
+	if not os.path.exists(branch_template):
+		return ''
+	with open(branch_template, 'r') as f:
+		return text_digest(f.read())
+
+def existing_species():
+	'''Get the set of species IDs that have a cached branch that was built
+	with the current branch query template.'''
+	c = catalog.Catalog()
+	try:
+		branches = c.done_branches(template_digest())
+	finally:
+		c.close()
+	return set(species_id for species_id, key in branches
+		if os.path.exists(entry_path(key)))
+
+def collect_garbage():
+	'''Remove cached branches that are not the latest for any species.
+	Return the number of branches removed.'''
+	if not os.path.exists(cache_dir):
+		return 0
+	c = catalog.Catalog()
+	try:
+		live = c.cache_keys()
+	finally:
+		c.close()
+	removed = 0
+	branches_dir = cache_dir + '/branches'
+	if os.path.exists(branches_dir):
+		for d in os.listdir(branches_dir):
+			for name in os.listdir('%s/%s' % (branches_dir, d)):
+				key = name.split('.')[0]
+				if key not in live:
+					os.remove('%s/%s/%s' % (branches_dir, d, name))
+					removed += 1
+	return removed
+
+if __name__ == '__main__':
+	main(sys.argv)
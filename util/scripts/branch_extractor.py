@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+
+'''Build a species branch directly from a gzipped UniProt proteome RDF/XML
+file. The output is the same as the build-branch.rq CONSTRUCT, but the RDF is
+parsed incrementally (nothing is decompressed to disk and no triple store is
+built) and only the values needed for the branch are kept.'''
+
+import gzip, os, sys
+import xml.etree.ElementTree as ET
+from urllib.parse import urljoin
+
+import iri_rewrite
+
+# namespaces
+rdf = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+rdfs = 'http://www.w3.org/2000/01/rdf-schema#'
+xsd = 'http://www.w3.org/2001/XMLSchema#'
+xml = 'http://www.w3.org/XML/1998/namespace'
+uc = 'http://purl.uniprot.org/core/'
+faldo = 'http://biohackathon.org/resource/faldo#'
+uniprot = 'http://purl.uniprot.org/uniprot/'
+
+# the feature types that become protein children
+feature_types = {uc + 'Chain_Annotation', uc + 'Propeptide_Annotation'}
+
+# the predicates that link a node to the nodes it needs in a branch
+# (protein -> annotations -> ranges -> positions)
+links = {uc + 'annotation', uc + 'range', faldo + 'begin', faldo + 'end'}
+
+ttl_header = """@prefix iedb: <http://iedb.org/> .
+@prefix obo: <http://purl.obolibrary.org/obo/> .
+@prefix owl: <http://www.w3.org/2002/07/owl#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+"""
+
+# expects: IRI, label, taxon ID, browser link
+ttl_taxon = """
+<{0}> a owl:Class ;
+	rdfs:label {1} ;
+	iedb:has-taxon-id {2} ;
+	iedb:has-taxonomic-level ":species" ;
+	iedb:has-taxonomic-rank "species" ;
+	obo:NCBITaxon_browser_link {3} .
+"""
+
+# expects: IRI, parent IRI, accession, reviewed
+ttl_protein = """
+<{0}> a owl:Class ;
+	rdfs:subClassOf <{1}> ;
+	iedb:has-accession {2} ;
+	iedb:has-accession-iri <{0}> ;
+	iedb:has-category "uniprot-reviewed-protein"^^xsd:string ;
+	iedb:has-source-database "UniProt"^^xsd:string ;
+	iedb:is-reviewed {3} .
+"""
+
+# expects: IRI, parent IRI, label, begin, end
+ttl_feature = """
+<{0}> a owl:Class ;
+	rdfs:subClassOf <{1}> ;
+	rdfs:label {2} ;
+	iedb:has-category "protein feature"^^xsd:string ;
+	iedb:has-start-position {3} ;
+	iedb:has-end-position {4} .
+"""
+
+class Proteome:
+	'''The parts of a UniProt proteome that are used in a branch. If a set of
+	protein IRIs is given, only those proteins and the annotations, ranges and
+	positions they link to are kept. A node is only known to be linked once
+	the node that links to it has been read, and in UniProt RDF a protein
+	comes before its annotations.'''
+
+	def __init__(self, keep=None):
+		self.keep = keep
+		# nodes linked from the kept proteins, if only some are kept
+		self.linked = set()
+		# protein IRIs, in document order
+		self.proteins = {}
+		# subject IRI : [reviewed literals]
+		self.reviewed = {}
+		# protein IRI : [sequence IRIs]
+		self.sequences = {}
+		# subjects that have an rdf:value (i.e., sequences with a value)
+		self.valued = set()
+		# protein IRI : [annotation IRIs]
+		self.annotations = {}
+		# annotation IRI : set of feature types
+		self.feature_types = {}
+		# annotation IRI : ([comment literals], [range IRIs])
+		self.features = {}
+		# range IRI : ([begin IRIs], [end IRIs])
+		self.ranges = {}
+		# position IRI : [position literals]
+		self.positions = {}
+
+	def add_node(self, subject, triples):
+		'''Keep the branch values from the triples about one subject.'''
+		if self.keep is not None and subject not in self.keep \
+		and subject not in self.linked:
+			# sequence values are still needed for the kept proteins
+			if any(p == rdf + 'value' for p, o in triples):
+				self.valued.add(subject)
+			return
+		if self.keep is not None:
+			self.linked.update(o for p, o in triples if p in links)
+		types = [o for p, o in triples if p == rdf + 'type']
+		is_feature = False
+		for t in types:
+			if t == uc + 'Protein':
+				self.proteins[subject] = True
+			elif t in feature_types:
+				self.feature_types.setdefault(subject, set()).add(t)
+				is_feature = True
+		# comments can be long, so only keep them for features (or for nodes
+		# that are not typed here, in case they are typed elsewhere)
+		keep_comments = is_feature or not types
+		for p, o in triples:
+			if p == uc + 'reviewed':
+				self.reviewed.setdefault(subject, []).append(o)
+			elif p == uc + 'sequence':
+				self.sequences.setdefault(subject, []).append(o)
+			elif p == rdf + 'value':
+				self.valued.add(subject)
+			elif p == uc + 'annotation':
+				self.annotations.setdefault(subject, []).append(o)
+			elif p == rdfs + 'comment' and keep_comments:
+				self.features.setdefault(subject, ([], []))[0].append(o)
+			elif p == uc + 'range':
+				self.features.setdefault(subject, ([], []))[1].append(o)
+			elif p == faldo + 'begin':
+				self.ranges.setdefault(subject, ([], []))[0].append(o)
+			elif p == faldo + 'end':
+				self.ranges.setdefault(subject, ([], []))[1].append(o)
+			elif p == faldo + 'position':
+				self.positions.setdefault(subject, []).append(o)
+
+	def reviewed_proteins(self):
+		'''Yield (protein IRI, [reviewed literals]) for each protein that has a
+		reviewed status and a sequence with a value.'''
+		for protein in self.proteins:
+			if self.keep is not None and protein not in self.keep:
+				continue
+			reviewed = self.reviewed.get(protein)
+			if not reviewed:
+				continue
+			seqs = self.sequences.get(protein, [])
+			if not any(s in self.valued for s in seqs):
+				continue
+			yield protein, reviewed
+
+	def protein_features(self, protein):
+		'''Yield (annotation IRI, comment, begin, end) for each Chain or
+		Propeptide feature of a protein.'''
+		for annotation in self.annotations.get(protein, []):
+			if annotation not in self.feature_types:
+				continue
+			comments, ranges = self.features.get(annotation, ([], []))
+			for comment in comments:
+				for r in ranges:
+					begins, ends = self.ranges.get(r, ([], []))
+					for b in begins:
+						for e in ends:
+							for begin in self.positions.get(b, []):
+								for end in self.positions.get(e, []):
+									yield annotation, comment, begin, end
+
+def main(args):
+	'''Usage: branch_extractor.py <proteome.rdf.gz> <taxon_id> <taxon_label>
+	<branch.ttl> [accession ...]'''
+	accessions = None
+	if len(args) > 5:
+		accessions = args[5:]
+	extract_branch(args[1], args[2], args[3], args[4], accessions)
+
+def extract_branch(gz_proteome_file, taxon_id, taxon_label, out_file,
+	accessions=None):
+	'''Read a gzipped proteome RDF/XML file and write the species branch to the
+	out file as Turtle. If a list of UniProt accessions is given, only those
+	proteins (with their features and the taxon root) are included. Return the
+	number of proteins in the branch.'''
+	keep = None
+	if accessions is not None:
+		keep = set(uniprot + a for a in accessions)
+	proteome = read_proteome(gz_proteome_file, keep)
+	return write_branch(proteome, taxon_id, taxon_label, out_file)
+
+def read_proteome(gz_proteome_file, keep=None):
+	'''Parse a gzipped proteome RDF/XML file into a Proteome, one top-level node
+	at a time. Only the proteins with IRIs in keep are used, if it is given.'''
+	proteome = Proteome(keep)
+	with gzip.open(gz_proteome_file, 'rb') as f:
+		context = ET.iterparse(f, events=('start', 'end'))
+		depth = 0
+		root = None
+		base = None
+		blank_ids = iter(range(sys.maxsize))
+		for event, elem in context:
+			if event == 'start':
+				if depth == 0:
+					root = elem
+					base = elem.get('{%s}base' % xml)
+				depth += 1
+				continue
+			depth -= 1
+			if depth == 1:
+				parse_node(elem, proteome, base, blank_ids)
+				# drop the parsed node
+				root.clear()
+	return proteome
+
+def parse_node(elem, proteome, base, blank_ids, subject=None):
+	'''Parse an RDF/XML node element and any nested node elements, adding the
+	triples to the proteome. Return the subject of the node.'''
+	if subject is None:
+		subject = get_subject(elem, base, blank_ids)
+	triples = []
+	# nested node elements and their subjects
+	nested = []
+	if elem.tag != '{%s}Description' % rdf:
+		# typed node element
+		triples.append((rdf + 'type', tag_iri(elem.tag)))
+	for k, v in elem.attrib.items():
+		if k.startswith('{%s}' % rdf) or k.startswith('{%s}' % xml):
+			continue
+		triples.append((tag_iri(k), (v, None, None)))
+	for prop in elem:
+		predicate = tag_iri(prop.tag)
+		resource = prop.get('{%s}resource' % rdf)
+		node_id = prop.get('{%s}nodeID' % rdf)
+		parse_type = prop.get('{%s}parseType' % rdf)
+		if resource is not None:
+			triples.append((predicate, resolve(resource, base)))
+		elif node_id is not None:
+			triples.append((predicate, '_:' + node_id))
+		elif parse_type == 'Resource':
+			# the property element is itself a blank node description
+			blank = ET.Element('{%s}Description' % rdf)
+			blank.extend(list(prop))
+			nested.append((blank, get_subject(blank, base, blank_ids)))
+			triples.append((predicate, nested[-1][1]))
+		elif len(prop) > 0:
+			nested.append((prop[0], get_subject(prop[0], base, blank_ids)))
+			triples.append((predicate, nested[-1][1]))
+		else:
+			datatype = prop.get('{%s}datatype' % rdf)
+			lang = prop.get('{%s}lang' % xml)
+			triples.append((predicate, (prop.text or '', datatype, lang)))
+	proteome.add_node(subject, triples)
+	# nested nodes are added after the node that links to them
+	for node, node_subject in nested:
+		parse_node(node, proteome, base, blank_ids, node_subject)
+	return subject
+
+def get_subject(elem, base, blank_ids):
+	'''Get the IRI (or blank node ID) for a node element.'''
+	about = elem.get('{%s}about' % rdf)
+	if about is not None:
+		return resolve(about, base)
+	node_id = elem.get('{%s}nodeID' % rdf)
+	if node_id is not None:
+		return '_:' + node_id
+	return '_:b%d' % next(blank_ids)
+
+def resolve(iri, base):
+	'''Resolve a (possibly relative) IRI against the document base.'''
+	if base and ':' not in iri:
+		return urljoin(base, iri)
+	return iri
+
+def tag_iri(tag):
+	'''Convert an ElementTree '{namespace}local' tag to an IRI.'''
+	if tag.startswith('{'):
+		ns, local = tag[1:].split('}', 1)
+		return ns + local
+	return tag
+
+def write_branch(proteome, taxon_id, taxon_label, out_file):
+	'''Write the branch for a proteome to a Turtle file. The file is written
+	to a temporary path first, so a partial branch is never left behind.'''
+	taxon_iri = 'http://iedb.org/taxon-protein/%s' % taxon_id
+	count = 0
+	tmp_file = out_file + '.tmp'
+	with open(tmp_file, 'w') as f:
+		f.write(ttl_header)
+		for protein, reviewed in proteome.reviewed_proteins():
+			if count == 0:
+				# like the CONSTRUCT, only add the root if there are proteins
+				write_taxon(f, taxon_iri, taxon_id, taxon_label)
+			count += 1
+			write_protein(f, proteome, protein, reviewed, taxon_iri)
+	os.replace(tmp_file, out_file)
+	return count
+
+def write_taxon(f, taxon_iri, taxon_id, taxon_label):
+	'''Write the 'species protein' root of a branch.'''
+	f.write(ttl_taxon.format(
+		taxon_iri,
+		literal('%s protein' % taxon_label),
+		literal(taxon_id),
+		literal('http://www.ncbi.nlm.nih.gov/Taxonomy/Browser/'
+			'wwwtax.cgi?id=%s' % taxon_id)))
+
+def write_protein(f, proteome, protein, reviewed, parent):
+	'''Write a protein and its features.'''
+	accession = protein
+	if accession.startswith(uniprot):
+		accession = accession[len(uniprot):]
+	iri = fix_iri(protein)
+	f.write(ttl_protein.format(
+		iri, parent, literal(accession),
+		' , '.join(term(r) for r in reviewed)))
+	features = {}
+	for annotation, comment, begin, end in proteome.protein_features(protein):
+		label = '%s (%s-%s)' % (comment[0], begin[0], end[0])
+		features.setdefault(annotation, []).append((label, begin, end))
+	for annotation, values in features.items():
+		f.write(ttl_feature.format(
+			fix_iri(annotation), iri,
+			' , '.join(unique(literal(v[0]) for v in values)),
+			' , '.join(unique(term(v[1]) for v in values)),
+			' , '.join(unique(term(v[2]) for v in values))))
+
+def is_native_branch(branch_file):
+	'''Check if a branch file was written by this extractor.'''
+	with open(branch_file, 'r') as f:
+		return f.read(len(ttl_header)) == ttl_header
+
+def read_blocks(branch_file):
+	'''Yield (subject, parent, text) for each class block in a branch written 
+	by this extractor. The parent of the taxon root is None.'''
+	with open(branch_file, 'r') as f:
+		f.read(len(ttl_header))
+		lines = []
+		for line in f:
+			if line.strip():
+				lines.append(line)
+				continue
+			if lines:
+				yield parse_block(lines)
+				lines = []
+		if lines:
+			yield parse_block(lines)
+
+def parse_block(lines):
+	'''Get the (subject, parent, text) of a class block.'''
+	subject = lines[0].split('>', 1)[0][1:]
+	parent = None
+	for line in lines[1:]:
+		if line.startswith('\trdfs:subClassOf <'):
+			parent = line.split('<', 1)[1].split('>', 1)[0]
+			break
+	return subject, parent, '\n' + ''.join(lines)
+
+def branch_accessions(branch_file):
+	'''Get the set of UniProt accessions of the proteins in a branch.'''
+	prefix = fix_iri(uniprot)
+	accessions = set()
+	for subject, parent, text in read_blocks(branch_file):
+		if subject.startswith(prefix):
+			accessions.add(subject[len(prefix):])
+	return accessions
+
+def patch_branch(branch_file, gz_proteome_file, taxon_id, taxon_label, 
+	out_file, added, removed):
+	'''Patch a branch written by this extractor: remove the proteins (and 
+	their features) with the removed UniProt accessions, and add the proteins 
+	with the added accessions from the proteome. The proteome is only read if 
+	there are proteins to add. Return the number of proteins in the branch.'''
+	taxon_iri = 'http://iedb.org/taxon-protein/%s' % taxon_id
+	removed_iris = set(fix_iri(uniprot + a) for a in removed)
+	kept = []
+	count = 0
+	for subject, parent, text in read_blocks(branch_file):
+		if subject in removed_iris or parent in removed_iris:
+			continue
+		if parent == taxon_iri:
+			count += 1
+		kept.append((subject, parent, text))
+	present = set(subject for subject, parent, text in kept)
+	added = [a for a in added if fix_iri(uniprot + a) not in present]
+
+	proteome = None
+	if added:
+		proteome = read_proteome(
+			gz_proteome_file, set(uniprot + a for a in added))
+
+	tmp_file = out_file + '.tmp'
+	with open(tmp_file, 'w') as f:
+		f.write(ttl_header)
+		new_proteins = []
+		if proteome is not None:
+			new_proteins = list(proteome.reviewed_proteins())
+		total = count + len(new_proteins)
+		for subject, parent, text in kept:
+			if subject == taxon_iri and total == 0:
+				# like the CONSTRUCT, there is no root without proteins
+				continue
+			f.write(text)
+		if taxon_iri not in present and new_proteins:
+			write_taxon(f, taxon_iri, taxon_id, taxon_label)
+		for protein, reviewed in new_proteins:
+			write_protein(f, proteome, protein, reviewed, taxon_iri)
+	os.replace(tmp_file, out_file)
+	return total
+
+# use the www.uniprot.org IRIs instead of purl.uniprot.org
+fix_iri = iri_rewrite.rewriter(['UNIPROT'])
+
+def unique(values):
+	'''Return a list of values without duplicates, in order.'''
+	return list(dict.fromkeys(values))
+
+def term(value):
+	'''Format an RDF object (IRI string or literal tuple) as Turtle.'''
+	if isinstance(value, tuple):
+		return literal(*value)
+	if value.startswith('_:'):
+		return value
+	return '<%s>' % fix_iri(value)
+
+def literal(value, datatype=None, lang=None):
+	'''Format a literal as Turtle.'''
+	value = value.replace('\\', '\\\\').replace('"', '\\"') \
+		.replace('\n', '\\n').replace('\r', '\\r')
+	if datatype is not None:
+		return '"%s"^^<%s>' % (value, datatype)
+	if lang is not None:
+		return '"%s"@%s' % (value, lang)
+	return '"%s"' % value
+
+if __name__ == '__main__':
+	main(sys.argv)
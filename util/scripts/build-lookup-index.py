@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+'''Compile the protein tree into an SQLite lookup index (see
+protein-lookup.py). The tree (RDF/XML, gzipped or not) is parsed as a stream
+of class elements, and each class is stored with its accession, label,
+synonyms, parent, source database and taxon. The taxon of a class is its own
+taxon ID if it is a taxon protein, otherwise the taxon of its parent, so a
+protein has the taxon of its species and a protein feature the taxon of its
+protein.
+
+Usage: build-lookup-index.py <protein-tree.owl.gz> <index.sqlite>'''
+
+import gzip, json, os, sqlite3, sys
+import xml.etree.ElementTree as ET
+
+import tracing
+
+rdf = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+rdfs = '{http://www.w3.org/2000/01/rdf-schema#}'
+owl = '{http://www.w3.org/2002/07/owl#}'
+iedb = '{http://iedb.org/}'
+
+taxon_protein = 'http://iedb.org/taxon-protein/'
+
+# number of classes inserted at a time
+batch_size = 10000
+
+schema = '''
+CREATE TABLE classes (
+	iri TEXT PRIMARY KEY,
+	accession TEXT,
+	label TEXT,
+	synonyms TEXT,
+	parent TEXT,
+	taxon_id TEXT,
+	source_database TEXT
+);
+'''
+
+# created after the classes are loaded
+indexes = '''
+CREATE INDEX accession_index ON classes (accession);
+CREATE INDEX parent_index ON classes (parent);
+'''
+
+def main(args):
+	if len(args) != 3:
+		print(__doc__.split('\n\n')[-1])
+		sys.exit(1)
+	count = build_index(args[1], args[2])
+	print('indexed %d classes in %s' % (count, args[2]))
+
+def read_classes(tree_file):
+	'''Yield (IRI, accession, label, synonyms, parent, taxon ID, source
+	database) for each class of an RDF/XML file. Only one class element is
+	kept in memory at a time.'''
+	opener = gzip.open if tree_file.endswith('.gz') else open
+	with opener(tree_file, 'rb') as f:
+		depth = 0
+		root = None
+		for event, elem in ET.iterparse(f, events=('start', 'end')):
+			if event == 'start':
+				if root is None:
+					root = elem
+				depth += 1
+				continue
+			depth -= 1
+			if depth != 1:
+				continue
+			if elem.tag == owl + 'Class' and elem.get(rdf + 'about'):
+				yield class_row(elem)
+			root.clear()
+
+def class_row(elem):
+	'''Get the row of a class element.'''
+	iri = elem.get(rdf + 'about')
+	values = {}
+	synonyms = []
+	parent = None
+	for child in elem:
+		if child.tag == rdfs + 'subClassOf':
+			if parent is None:
+				parent = child.get(rdf + 'resource')
+		elif child.tag == iedb + 'protein-synonym':
+			synonyms.append(child.text or '')
+		elif child.tag not in values:
+			values[child.tag] = child.text
+	taxon_id = values.get(iedb + 'has-taxon-id') or get_taxon_id(iri) \
+		or get_taxon_id(parent)
+	return (iri, values.get(iedb + 'has-accession'),
+		values.get(rdfs + 'label'),
+		json.dumps(synonyms) if synonyms else None, parent, taxon_id,
+		values.get(iedb + 'has-source-database'))
+
+def get_taxon_id(iri):
+	'''Get the taxon ID of a taxon protein IRI, or None.'''
+	if iri and iri.startswith(taxon_protein) \
+	and iri[len(taxon_protein):].isdigit():
+		return iri[len(taxon_protein):]
+	return None
+
+def build_index(tree_file, index_file):
+	'''Write the lookup index of a tree, replacing it in one step. Return
+	the number of classes.'''
+	tmp_file = index_file + '.tmp'
+	if os.path.exists(tmp_file):
+		os.remove(tmp_file)
+	db = sqlite3.connect(tmp_file)
+	try:
+		db.execute('PRAGMA journal_mode=OFF')
+		db.execute('PRAGMA synchronous=OFF')
+		db.executescript(schema)
+		count = 0
+		batch = []
+		for row in read_classes(tree_file):
+			batch.append(row)
+			if len(batch) >= batch_size:
+				count += insert(db, batch)
+				batch = []
+		count += insert(db, batch)
+		db.executescript(indexes)
+		set_taxa(db)
+		db.commit()
+		db.execute('VACUUM')
+	finally:
+		db.close()
+	os.replace(tmp_file, index_file)
+	return count
+
+def insert(db, rows):
+	'''Insert class rows. A class that is repeated keeps its first row.'''
+	db.executemany(
+		'INSERT OR IGNORE INTO classes VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+	return len(rows)
+
+def set_taxa(db):
+	'''Give the classes without a taxon the taxon of their parent, one
+	level of the tree at a time.'''
+	while True:
+		updated = db.execute(
+			'''UPDATE classes SET taxon_id = (
+				SELECT p.taxon_id FROM classes p WHERE p.iri = classes.parent)
+			WHERE taxon_id IS NULL AND parent IN (
+				SELECT iri FROM classes WHERE taxon_id IS NOT NULL)''').rowcount
+		if updated == 0:
+			break
+
+if __name__ == '__main__':
+	with tracing.script(sys.argv):
+		main(sys.argv)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+'''Catalog of the species branches, kept in an SQLite database. For each
+species it records the proteome ID, a digest of the inputs of its branch, its
+status (pending, done or failed), the cache key of the branch, timings, errors
+and the path of the branch file.
+
+update-branches.py marks each species as pending before it starts, and done or
+failed as soon as its result comes back. Only the main process writes species
+results, and every result is committed on its own, so an interrupted run
+leaves the finished species marked done and the rest pending. The worker
+processes and download threads write file digests (see below), each over its
+own connection; the busy timeout (600 s) makes those writes wait for each
+other.
+
+The catalog also keeps the state of the pipeline stages (see pipeline.py):
+the digest of the inputs each stage was last run with, and a cache of file
+digests that is only refreshed when the size or modification time of a file
+changes. The same table records which downloaded proteomes passed their gzip
+check (see downloads.py).
+
+Usage: catalog.py status
+Print the number of species in each status and the errors of failed species.'''
+
+import hashlib, os, sqlite3, sys
+
+catalog_file = 'build/catalog.sqlite'
+
+schema = '''
+CREATE TABLE IF NOT EXISTS species (
+	species_key TEXT PRIMARY KEY,
+	species_id TEXT NOT NULL,
+	proteome_id TEXT,
+	group_name TEXT,
+	status TEXT NOT NULL,
+	inputs_digest TEXT,
+	cache_key TEXT,
+	template_digest TEXT,
+	proteome_digest TEXT,
+	branch_file TEXT,
+	started REAL,
+	finished REAL,
+	errors TEXT
+);
+CREATE INDEX IF NOT EXISTS species_id_index ON species (species_id);
+CREATE INDEX IF NOT EXISTS status_index ON species (status);
+CREATE TABLE IF NOT EXISTS stages (
+	name TEXT PRIMARY KEY,
+	status TEXT NOT NULL,
+	inputs_digest TEXT,
+	started REAL,
+	finished REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+	path TEXT PRIMARY KEY,
+	size INTEGER NOT NULL,
+	mtime_ns INTEGER NOT NULL,
+	digest TEXT NOT NULL,
+	verified INTEGER NOT NULL DEFAULT 0
+);
+'''
+
+def main(args):
+	if len(args) != 2 or args[1] != 'status':
+		print(__doc__.split('\n\n')[-1])
+		sys.exit(1)
+	catalog = Catalog()
+	try:
+		for status, count in catalog.counts():
+			print('%-8s %d' % (status, count))
+		for species_key, errors in catalog.failures():
+			print('\n%s\n%s' % (species_key, errors))
+	finally:
+		catalog.close()
+
+class Catalog:
+	'''A connection to the catalog database.'''
+
+	def __init__(self, path=catalog_file):
+		os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+		# several update-branches.py processes may write at once
+		self.db = sqlite3.connect(path, timeout=600)
+		self.db.execute('PRAGMA journal_mode=WAL')
+		self.db.execute('PRAGMA synchronous=NORMAL')
+		self.db.executescript(schema)
+
+	def close(self):
+		self.db.close()
+
+	def is_done(self, species_key, inputs_digest):
+		'''Check if a species was done from the same inputs, and its branch
+		file is still there.'''
+		row = self.db.execute(
+			'''SELECT branch_file FROM species
+			WHERE species_key = ? AND status = 'done' AND inputs_digest = ?''',
+			(species_key, inputs_digest)).fetchone()
+		return row is not None and row[0] is not None \
+			and os.path.exists(row[0])
+
+	def start(self, species):
+		'''Mark species as pending. species is a list of (species key, species
+		ID, proteome ID, group, inputs digest). The cache key and digests of
+		the last branch are kept, so that it can be patched.'''
+		with self.db:
+			self.db.executemany(
+				'''INSERT INTO species (species_key, species_id, proteome_id,
+				group_name, status, inputs_digest)
+				VALUES (?, ?, ?, ?, 'pending', ?)
+				ON CONFLICT (species_key) DO UPDATE SET
+				species_id = excluded.species_id,
+				proteome_id = excluded.proteome_id,
+				group_name = excluded.group_name,
+				status = 'pending',
+				inputs_digest = excluded.inputs_digest,
+				started = NULL, finished = NULL, errors = NULL''',
+				species)
+
+	def done(self, species_key, cache_key, template_digest, proteome_digest,
+		branch_file, started, finished, errors):
+		'''Mark a species as done, with the cache key of its branch.'''
+		with self.db:
+			self.db.execute(
+				'''UPDATE species SET status = 'done', cache_key = ?,
+				template_digest = ?, proteome_digest = ?, branch_file = ?,
+				started = ?, finished = ?, errors = ?
+				WHERE species_key = ?''',
+				(cache_key, template_digest, proteome_digest, branch_file,
+				started, finished, '\n'.join(errors) or None, species_key))
+
+	def failed(self, species_key, started, finished, errors):
+		'''Mark a species as failed. The inputs digest is cleared so that the
+		species is tried again on the next run.'''
+		with self.db:
+			self.db.execute(
+				'''UPDATE species SET status = 'failed', inputs_digest = NULL,
+				started = ?, finished = ?, errors = ?
+				WHERE species_key = ?''',
+				(started, finished, '\n'.join(errors) or None, species_key))
+
+	def branch_index(self):
+		'''Get a map of species key -> (species ID, cache key, template
+		digest, proteome digest) of the last branch of each species.'''
+		index = {}
+		for row in self.db.execute(
+			'''SELECT species_key, species_id, cache_key, template_digest,
+			proteome_digest FROM species WHERE cache_key IS NOT NULL'''):
+			index[row[0]] = tuple(row[1:])
+		return index
+
+	def done_branches(self, template_digest):
+		'''Get the (species ID, cache key) of the species that are done with
+		a branch built from the given query template.'''
+		return self.db.execute(
+			'''SELECT species_id, cache_key FROM species
+			WHERE status = 'done' AND template_digest = ?''',
+			(template_digest,)).fetchall()
+
+	def cache_keys(self):
+		'''Get the set of cache keys of the last branch of each species.'''
+		return set(row[0] for row in self.db.execute(
+			'SELECT cache_key FROM species WHERE cache_key IS NOT NULL'))
+
+	def stage_digest(self, name):
+		'''Get the inputs digest of the last successful run of a stage, or
+		None.'''
+		row = self.db.execute(
+			'''SELECT inputs_digest FROM stages
+			WHERE name = ? AND status = 'done' ''', (name,)).fetchone()
+		return row[0] if row else None
+
+	def record_stage(self, name, status, inputs_digest, started, finished):
+		'''Record the result of a stage run.'''
+		with self.db:
+			self.db.execute(
+				'''INSERT OR REPLACE INTO stages (name, status, inputs_digest,
+				started, finished) VALUES (?, ?, ?, ?, ?)''',
+				(name, status, inputs_digest, started, finished))
+
+	def file_digest(self, path):
+		'''Get the SHA-256 of a file, from the cache if the file has the same
+		size and modification time.'''
+		stat = os.stat(path)
+		row = self.db.execute(
+			'SELECT size, mtime_ns, digest FROM files WHERE path = ?',
+			(path,)).fetchone()
+		if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+			return row[2]
+		h = hashlib.sha256()
+		with open(path, 'rb') as f:
+			for chunk in iter(lambda: f.read(1024 * 1024), b''):
+				h.update(chunk)
+		digest = h.hexdigest()
+		with self.db:
+			self.db.execute(
+				'''INSERT OR REPLACE INTO files (path, size, mtime_ns, digest)
+				VALUES (?, ?, ?, ?)''',
+				(path, stat.st_size, stat.st_mtime_ns, digest))
+		return digest
+
+	def is_verified(self, path):
+		'''Check if a file was verified (see set_verified) and has the same
+		size and modification time.'''
+		stat = os.stat(path)
+		row = self.db.execute(
+			'SELECT size, mtime_ns, verified FROM files WHERE path = ?',
+			(path,)).fetchone()
+		return row is not None and row[0] == stat.st_size \
+			and row[1] == stat.st_mtime_ns and bool(row[2])
+
+	def set_verified(self, path):
+		'''Record that a file was checked as complete (e.g., a downloaded
+		proteome that passed the gzip check), with its digest.'''
+		self.file_digest(path)
+		with self.db:
+			self.db.execute(
+				'UPDATE files SET verified = 1 WHERE path = ?', (path,))
+
+	def counts(self):
+		'''Get the (status, number of species) pairs.'''
+		return self.db.execute(
+			'''SELECT status, COUNT(*) FROM species GROUP BY status
+			ORDER BY status''').fetchall()
+
+	def failures(self):
+		'''Get the (species key, errors) of the failed species.'''
+		return self.db.execute(
+			'''SELECT species_key, errors FROM species WHERE status = 'failed'
+			ORDER BY species_key''').fetchall()
+
+if __name__ == '__main__':
+	main(sys.argv)
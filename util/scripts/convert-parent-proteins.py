@@ -3,6 +3,8 @@
 import csv
 import sys
 
+import tracing
+
 columns = [
   'Accession',
   'Database',
@@ -65,4 +67,5 @@ def format_title(title):
   return " ".join(label_words)
 
 if __name__ == '__main__':
-	main(sys.argv)
+	with tracing.script(sys.argv):
+		main(sys.argv)
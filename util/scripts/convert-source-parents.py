@@ -3,6 +3,8 @@
 import csv
 import sys
 
+import tracing
+
 columns = [
   'Source ID',
   'Accession',
@@ -67,4 +69,5 @@ def main(args):
 
 
 if __name__ == '__main__':
-	main(sys.argv)
+	with tracing.script(sys.argv):
+		main(sys.argv)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+'''Download UniProt proteome files. Downloads run on a pool of threads that
+each keep their own keep-alive connections, partial downloads are resumed,
+and a file is only moved into place after it passes a size check and a gzip
+integrity check. With a catalog, the size and modification time of each
+checked file are recorded, so that a file that is already there is only
+checked again if it has changed.'''
+
+import gzip, http.client, os, threading, time, urllib.parse, zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import catalog, tracing
+
+# UniProt reference proteome download (base URL can be overridden so that a
+# local HTTP server can stand in for UniProt)
+uniprot_base = os.environ.get('UNIPROT_URL', 'http://www.uniprot.org')
+uniprot_path = '/uniprot/?query=proteome:%s&compress=yes&force=true&format=%s'
+
+chunk_size = 1024 * 1024
+max_redirects = 5
+
+class DownloadError(Exception):
+	'''A proteome file could not be downloaded.'''
+	pass
+
+class Downloader:
+	'''Fetch proteome files over a pool of persistent HTTP connections.'''
+
+	def __init__(self, base_url=None, connections=4, retries=5, timeout=300,
+		catalog_file=None):
+		self.base_url = (base_url or uniprot_base).rstrip('/')
+		self.retries = retries
+		self.timeout = timeout
+		self.catalog_file = catalog_file
+		self.executor = ThreadPoolExecutor(connections)
+		self.futures = []
+		# set by abort() to stop the downloads that are running
+		self.stopped = threading.Event()
+		self.local = threading.local()
+
+	def url(self, proteome_id, fmt='rdf'):
+		'''Get the download URL for a proteome in the given format.'''
+		return self.base_url + uniprot_path % (proteome_id, fmt)
+
+	def submit(self, proteome_id, out_file, fmt='rdf'):
+		'''Queue a download and return a future that is True when the file is
+		complete, or raises DownloadError.'''
+		future = self.executor.submit(self.fetch, proteome_id, out_file, fmt)
+		self.futures.append(future)
+		return future
+
+	def fetch(self, proteome_id, out_file, fmt='rdf'):
+		'''Download a proteome file, resuming any partial download left in
+		<out_file>.part. Retry with a backoff if the transfer fails.'''
+		if os.path.exists(out_file):
+			if self.is_checked(out_file):
+				return True
+			if is_complete(out_file):
+				self.checked(out_file)
+				return True
+			# a file left by an interrupted (unchecked) download, resume it
+			os.replace(out_file, out_file + '.part')
+		url = self.url(proteome_id, fmt)
+		cause = None
+		with tracing.span('download', proteome=proteome_id) as s:
+			for attempt in range(self.retries):
+				if self.stopped.is_set():
+					break
+				if attempt > 0:
+					time.sleep(min(2 ** attempt, 60))
+				try:
+					self.transfer(url, out_file)
+					s.wrote(out_file)
+					s.attrs['attempts'] = attempt + 1
+					return True
+				except (OSError, http.client.HTTPException, DownloadError) as e:
+					cause = e
+			raise DownloadError(
+				'%s (%d attempts): %s' % (url, self.retries, cause))
+
+	def transfer(self, url, out_file):
+		'''Make one attempt at transferring url to out_file.'''
+		part_file = out_file + '.part'
+		offset = 0
+		if os.path.exists(part_file):
+			offset = os.path.getsize(part_file)
+
+		response, url = self.request(url, offset)
+		try:
+			if response.status == 206:
+				total = content_range_total(response, offset)
+				mode = 'ab'
+			elif response.status == 200:
+				# the server ignored the range, start over
+				total = response.getheader('Content-Length')
+				if total is not None:
+					total = int(total)
+				offset = 0
+				mode = 'wb'
+			elif response.status == 416:
+				# the partial file is already as long as the resource
+				response.read()
+				total = None
+				mode = None
+			else:
+				response.read()
+				raise DownloadError('HTTP %d' % response.status)
+
+			if mode is not None:
+				with open(part_file, mode) as f:
+					while True:
+						if self.stopped.is_set():
+							raise DownloadError('stopped')
+						chunk = response.read(chunk_size)
+						if not chunk:
+							break
+						f.write(chunk)
+		except Exception:
+			self.drop_connection(url)
+			raise
+		finally:
+			response.close()
+
+		size = os.path.getsize(part_file)
+		if total is not None and size != total:
+			raise DownloadError(
+				'incomplete transfer (%d of %d bytes)' % (size, total))
+		if not is_complete(part_file):
+			# the data is corrupt, so resuming would not help
+			os.remove(part_file)
+			raise DownloadError('%s failed the gzip check' % out_file)
+		os.replace(part_file, out_file)
+		self.checked(out_file)
+
+	def catalog(self):
+		'''Get this thread's catalog, or None if there is no catalog.'''
+		if self.catalog_file is None:
+			return None
+		db = getattr(self.local, 'catalog', None)
+		if db is None:
+			db = catalog.Catalog(self.catalog_file)
+			self.local.catalog = db
+		return db
+
+	def is_checked(self, out_file):
+		'''Check if a file passed the gzip check and has not changed since.'''
+		db = self.catalog()
+		return db is not None and db.is_verified(out_file)
+
+	def checked(self, out_file):
+		'''Record that a file passed the gzip check.'''
+		db = self.catalog()
+		if db is not None:
+			db.set_verified(out_file)
+
+	def request(self, url, offset):
+		'''Send a GET for url (from byte offset) and follow any redirects.
+		Return the response, with the body not yet read, and the final URL.'''
+		for i in range(max_redirects + 1):
+			headers = {'Accept-Encoding': 'identity'}
+			if offset > 0:
+				headers['Range'] = 'bytes=%d-' % offset
+			conn = self.get_connection(url)
+			parts = urllib.parse.urlsplit(url)
+			path = parts.path or '/'
+			if parts.query:
+				path += '?' + parts.query
+			try:
+				conn.request('GET', path, headers=headers)
+				response = conn.getresponse()
+			except (OSError, http.client.HTTPException):
+				# stale keep-alive connections are dropped by the server
+				self.drop_connection(url)
+				raise
+			if response.status in (301, 302, 303, 307, 308):
+				location = response.getheader('Location')
+				response.read()
+				if response.will_close:
+					self.drop_connection(url)
+				url = urllib.parse.urljoin(url, location)
+				continue
+			if response.will_close:
+				# do not try to reuse this connection for the next request
+				self.forget_connection(url)
+			return response, url
+		raise DownloadError('too many redirects for %s' % url)
+
+	def get_connection(self, url):
+		'''Get this thread's open connection for the host of url.'''
+		conns = getattr(self.local, 'conns', None)
+		if conns is None:
+			conns = {}
+			self.local.conns = conns
+		parts = urllib.parse.urlsplit(url)
+		key = (parts.scheme, parts.netloc)
+		conn = conns.get(key)
+		if conn is None:
+			if parts.scheme == 'https':
+				conn = http.client.HTTPSConnection(
+					parts.netloc, timeout=self.timeout)
+			else:
+				conn = http.client.HTTPConnection(
+					parts.netloc, timeout=self.timeout)
+			conns[key] = conn
+		return conn
+
+	def forget_connection(self, url):
+		'''Stop reusing this thread's connection for the host of url.'''
+		conns = getattr(self.local, 'conns', {})
+		parts = urllib.parse.urlsplit(url)
+		return conns.pop((parts.scheme, parts.netloc), None)
+
+	def drop_connection(self, url):
+		'''Close and forget this thread's connection for the host of url.'''
+		conn = self.forget_connection(url)
+		if conn is not None:
+			conn.close()
+
+	def close(self):
+		'''Wait for queued downloads and stop the threads.'''
+		self.executor.shutdown(wait=True)
+
+	def abort(self):
+		'''Cancel the queued downloads, stop the running ones (a partial
+		download is kept to be resumed) and stop the threads.'''
+		self.stopped.set()
+		for future in self.futures:
+			future.cancel()
+		self.executor.shutdown(wait=True)
+
+def content_range_total(response, offset):
+	'''Get the total size from a 206 response, checking that it starts at the
+	requested offset.'''
+	content_range = response.getheader('Content-Range', '')
+	# bytes <start>-<end>/<total>
+	try:
+		span, total = content_range.split(' ', 1)[1].split('/')
+		start = int(span.split('-')[0])
+	except (IndexError, ValueError):
+		raise DownloadError('bad Content-Range "%s"' % content_range)
+	if start != offset:
+		raise DownloadError(
+			'server resumed at byte %d instead of %d' % (start, offset))
+	if total == '*':
+		return None
+	return int(total)
+
+def is_complete(gz_file):
+	'''Check that a gzipped file exists and can be fully decompressed (which
+	also checks the CRC and length recorded in the gzip trailer).'''
+	if not os.path.exists(gz_file) or os.path.getsize(gz_file) == 0:
+		return False
+	try:
+		with gzip.open(gz_file, 'rb') as f:
+			while f.read(chunk_size):
+				pass
+	except (OSError, EOFError, zlib.error):
+		return False
+	return True
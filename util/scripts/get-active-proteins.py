@@ -1,83 +1,97 @@
 #!/usr/bin/env python3
 
-import csv, os, sys
+import argparse, csv, sys
 
-build_dirs = ['build/archeobacterium', 
-			  'build/bacterium', 
-			  'build/other-eukaryote', 
-			  'build/plant', 
-			  'build/vertebrate',
-			  'build/virus']
+import branch_cache, protein_manifest, tracing
 
 def main(args):
 	'''Usage:
-	get-active-species.py <active-proteins> <proteins-current> <proteins-last> 
-	Compares the current protein table to the last protein table to build a 
-	table containing only the updated proteins (active proteins).'''
-	protein_table_current = args[2]
-	protein_table_last = args[3]
-	active_proteins_table = args[1]
+	get-active-proteins.py [--digests <manifest>] <active-proteins> 
+	<proteins-current> <proteins-last-digests> [<protein-changes>]
+	Compares the current protein table to the digest manifest of the last 
+	protein table (see protein_manifest.py) to build a table containing only 
+	the updated proteins (active proteins). The current table is read once to 
+	hash its rows, and then only the rows of the active species are copied. 
+	If a fourth argument is given, the added, removed and changed proteins of 
+	each active species are written to that table. With --digests, the 
+	manifest of the current table is written for the next build.'''
+	parser = argparse.ArgumentParser(
+		description='Build a table of the proteins of the updated species')
+	parser.add_argument('active_proteins_table')
+	parser.add_argument('protein_table_current')
+	parser.add_argument('protein_digests_last')
+	parser.add_argument('protein_changes_table', nargs='?')
+	parser.add_argument('--digests', metavar='MANIFEST',
+		help='write the digest manifest of the current table')
+	opts = parser.parse_args(args[1:])
 
-	# { species_id : { protein_id : line } }
-	current_proteins = read_proteins(protein_table_current)
-	last_proteins = read_proteins(protein_table_last)
+	# { species_id : { protein_id : (database, digest, offset, length) } }
+	current_proteins = read_proteins(opts.protein_table_current)
+	# { species_id : { protein_id : (database, digest) } }
+	last_proteins = protein_manifest.read_manifest(opts.protein_digests_last)
 
 	existing_species = get_existing_species()
 
+	protein_changes = get_protein_changes(current_proteins, last_proteins)
 	active_proteins = get_active_proteins(
-		current_proteins, last_proteins, existing_species)
+		current_proteins, last_proteins, existing_species, protein_changes)
 
-	write_active_proteins(active_proteins, active_proteins_table)
+	write_active_proteins(
+		opts.protein_table_current, active_proteins, 
+		opts.active_proteins_table)
+	if opts.protein_changes_table:
+		write_protein_changes(
+			protein_changes, active_proteins, opts.protein_changes_table)
+	if opts.digests:
+		protein_manifest.write_manifest(opts.digests, (
+			(species, protein, values[0], values[1])
+			for species, species_proteins in current_proteins.items()
+			for protein, values in species_proteins.items()))
 
 def read_proteins(table_file):
-	'''Read in a parent-proteins CSV file to generate a map of the species IDs 
-	to all their proteins.'''
+	'''Read a parent-proteins CSV file in one pass to generate a map of the 
+	species IDs to all their proteins, with the database, the row digest and 
+	the byte range of each row. The rows themselves are not kept.'''
 	proteins = {}
-	# if the file is empty, just return the empty map
-	if os.path.getsize(table_file) is 0:
-		return proteins
-	with open(table_file, 'r') as f:
-		next(f)
-		reader = csv.reader(f)
-		for row in reader:
-			species_id = row[4]
-			protein_id = row[0]
-			if protein_id == '':
-				continue
-			if species_id in proteins:
-				species_proteins = proteins[species_id]
-			else:
-				species_proteins = {}
-			if protein_id in species_proteins:
-				# ERROR!
-				print('Duplicate protein %s for %s' % (protein_id, row[5]))
-				continue
-			species_proteins[protein_id] = row
-			proteins[species_id] = species_proteins
+	for species_id, protein_id, database, digest, offset, length \
+	in protein_manifest.read_table(table_file):
+		proteins.setdefault(species_id, {})[protein_id] = \
+			(database, digest, offset, length)
 	return proteins
 
 def get_existing_species():
-	'''Get a list of the species that have a fully-generated branch. If the 
-	branch file does not exist, the species is not included. If the build-
-	branch query still exists, the species is not included as the branch was 
-	not built successfully.'''
-	species = []
-	for d in build_dirs:
-		if os.path.exists(d) and os.path.isdir(d):
-			for subdir in os.listdir(d):
-				if os.path.isdir('%s/%s' % (d, subdir)):
-					files = os.listdir('%s/%s' % (d, subdir))
-					if 'branch.ttl' not in files:
-						continue
-					if 'build-branch.rq' in files:
-						continue
-					sid = subdir.split('-')[0]
-					species.append(sid)
-	return species
+	'''Get the set of species that have a fully-generated branch, according to 
+	the build catalog. If the branch is not in the cache, or it was built 
+	with a different build-branch query, the species is not included.'''
+	return branch_cache.existing_species()
 
-def get_active_proteins(current_proteins, last_proteins, existing_species):
-	'''Compare the current proteins to the last proteins to get a map of active
-	proteins. Also check if the species is NOT in the built branches.'''
+def get_protein_changes(current_proteins, last_proteins):
+	'''Compare the current proteins to the last proteins to get a map of 
+	species ID -> change -> { protein_id : database }, for the 'added', 
+	'removed' and 'changed' proteins of each species that has any changes. 
+	A protein has changed if the digest of its row has changed.'''
+	protein_changes = {}
+	for species in set(current_proteins) | set(last_proteins):
+		species_proteins = current_proteins.get(species, {})
+		last_species_proteins = last_proteins.get(species, {})
+		changes = {'added': {}, 'removed': {}, 'changed': {}}
+		for protein, values in species_proteins.items():
+			if protein not in last_species_proteins:
+				changes['added'][protein] = values[0]
+			elif values[1] != last_species_proteins[protein][1]:
+				changes['changed'][protein] = values[0]
+		for protein, values in last_species_proteins.items():
+			if protein not in species_proteins:
+				changes['removed'][protein] = values[0]
+		if any(changes.values()):
+			protein_changes[species] = changes
+	return protein_changes
+
+def get_active_proteins(
+	current_proteins, last_proteins, existing_species, protein_changes):
+	'''Get a map of active proteins: all proteins of each species that has 
+	added, removed or changed proteins. Also check if the species is NOT in 
+	the built branches.'''
 	active_proteins = {}
 	for species, species_proteins in current_proteins.items():
 		if species not in last_proteins:
@@ -86,31 +100,40 @@ def get_active_proteins(current_proteins, last_proteins, existing_species):
 		if species not in existing_species:
 			active_proteins[species] = species_proteins
 			continue
-		last_species_proteins = last_proteins[species]
-		update = False
-		for protein, row in species_proteins.items():
-			if protein not in last_species_proteins:
-				update = True
-				break
-			last_row = last_species_proteins[protein]
-			diff = list(set(row) - set(last_row))
-			if len(diff) > 0:
-				update = True
-				break
-		if update:
+		if species in protein_changes:
 			active_proteins[species] = species_proteins
 	return active_proteins
 
-def write_active_proteins(active_proteins, active_proteins_table):
-	'''Write the active proteins to a new table.'''
-	with open(active_proteins_table, 'w') as f:
+def write_active_proteins(table_file, active_proteins, active_proteins_table):
+	'''Write the active proteins to a new table, copying their rows from the 
+	current table by byte range.'''
+	with open(table_file, 'rb') as fin, \
+	open(active_proteins_table, 'wb') as f:
 		f.write(
-			'Accession,Database,Name,Title,'
-			'Proteome ID,Proteome Label,Sequence\n')
-		writer = csv.writer(f, delimiter=',', quoting=csv.QUOTE_MINIMAL)
+			b'Accession,Database,Name,Title,'
+			b'Proteome ID,Proteome Label,Sequence\n')
 		for species, species_proteins in active_proteins.items():
-			for protein, row in species_proteins.items():
-				writer.writerow(row)
+			for protein, values in species_proteins.items():
+				_, _, offset, length = values
+				fin.seek(offset)
+				record = fin.read(length)
+				if not record.endswith(b'\n'):
+					record += b'\n'
+				f.write(record)
+
+def write_protein_changes(
+	protein_changes, active_proteins, protein_changes_table):
+	'''Write the protein changes of the active species to a new table.'''
+	with open(protein_changes_table, 'w') as f:
+		f.write('Species ID,Accession,Database,Change\n')
+		writer = csv.writer(f, delimiter=',', quoting=csv.QUOTE_MINIMAL)
+		for species, changes in protein_changes.items():
+			if species not in active_proteins:
+				continue
+			for change, proteins in changes.items():
+				for protein, database in proteins.items():
+					writer.writerow([species, protein, database, change])
 
 if __name__ == '__main__':
-	main(sys.argv)
+	with tracing.script(sys.argv):
+		main(sys.argv)
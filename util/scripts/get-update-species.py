@@ -1,22 +1,21 @@
 #!/usr/bin/env python3
 
-import csv, sys
+import sys
+
+import tables, tracing
 
 def main(args):
 	update_species_file = args[1]
 	active_proteins_table = args[2]
 
-	update_species = []
-	with open(active_proteins_table, 'r') as f:
-		next(f)
-		reader = csv.reader(f)
-		for row in reader:
-			species_id = row[4]
-			if species_id not in update_species:
-				update_species.append(species_id)
+	# species IDs in table order, without duplicates
+	update_species = {}
+	for row in tables.read_rows(active_proteins_table, ['Proteome ID']):
+		update_species[row['Proteome ID']] = None
 
 	with open(update_species_file, 'w') as f:
 		f.write(' '.join(update_species))
 
 if __name__ == '__main__':
-	main(sys.argv)
\ No newline at end of file
+	with tracing.script(sys.argv):
+		main(sys.argv)
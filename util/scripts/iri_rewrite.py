@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+'''Rewrite IRIs in a file in one streaming pass. All rules are applied
+together, line by line, so the result is the same as running one 'sed' pass
+per rule, in order. Files ending in .gz are read and written with gzip, and
+'-' means stdin or stdout.
+
+Usage: iri_rewrite.py [--rules NAME,...] <input> <output>'''
+
+import argparse, gzip, io, re, sys
+
+import tracing
+
+iedb = 'http://iedb.org/taxon-protein/'
+
+# name, old IRI base, new IRI base
+# (DOUBLE_NCBIT must come before NCBIT, which would match its start)
+rules = [
+	('DOUBLE_NCBIT',
+		'http://purl.obolibrary.org/obo/NCBITaxon_/NCBITaxon_', iedb),
+	('NCBIT', 'http://purl.obolibrary.org/obo/NCBITaxon_', iedb),
+	('BAD_IEDB', 'http://iedb.org/taxon/', iedb),
+	('UNIPROT', 'purl.uniprot', 'www.uniprot'),
+]
+
+def main(args):
+	parser = argparse.ArgumentParser(
+		description='Rewrite IRIs (%s)' % ', '.join(r[0] for r in rules))
+	parser.add_argument('in_file')
+	parser.add_argument('out_file')
+	parser.add_argument('--rules', default=None,
+		help='comma-separated rule names to apply (default: all)')
+	opts = parser.parse_args(args[1:])
+
+	names = None
+	if opts.rules:
+		names = opts.rules.split(',')
+	try:
+		rewriter(names)
+	except ValueError as e:
+		parser.error(str(e))
+	rewrite_file(opts.in_file, opts.out_file, names)
+
+def rewriter(names=None):
+	'''Get a function that applies the named rules (default: all) to a
+	string.'''
+	selected = [r for r in rules if names is None or r[0] in names]
+	if names is not None:
+		unknown = set(names) - set(r[0] for r in rules)
+		if unknown:
+			raise ValueError('unknown rules: %s' % ', '.join(sorted(unknown)))
+	replacements = dict((old, new) for name, old, new in selected)
+	pattern = re.compile('|'.join(re.escape(old) for name, old, new in selected))
+	def rewrite(text):
+		return pattern.sub(lambda m: replacements[m.group(0)], text)
+	return rewrite
+
+def open_text(path, mode):
+	'''Open a (possibly gzipped) text file, or stdin/stdout for '-'.'''
+	if path == '-':
+		stream = sys.stdin.buffer if mode == 'r' else sys.stdout.buffer
+		return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+	if path.endswith('.gz'):
+		return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+	return open(path, mode, encoding='utf-8', newline='')
+
+def rewrite_file(in_file, out_file, names=None):
+	'''Copy the input file to the output file, rewriting IRIs with the named
+	rules (default: all).'''
+	rewrite = rewriter(names)
+	with open_text(in_file, 'r') as fin:
+		with open_text(out_file, 'w') as fout:
+			for line in fin:
+				fout.write(rewrite(line))
+
+if __name__ == '__main__':
+	with tracing.script(sys.argv):
+		main(sys.argv)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+'''Merge species branches (or any RDF files) into one file as a stream of
+triples. Each input is a group directory (all of its */branch.ttl files) or an
+RDF file. Inputs are read in parallel, one species file at a time, and each
+is sorted on disk into a part without duplicate triples. The parts are then
+merged, so each triple is written once. The output is sorted N-Triples (see
+ntriples.py) for .nt or .nt.gz, otherwise Turtle with one triple per line, in
+the same order, and the same prefixes for every input. Gzipped output is block gzip (see bgzip.py); with --index, a
+sorted N-Triples output also gets an index of the triples of each subject.'''
+
+import argparse, contextlib, glob, multiprocessing, os, re, sys, tempfile
+
+import bgzip, ntriples, tracing
+
+# the prefixes used in merged Turtle output
+prefixes = [
+	('iedb', 'http://iedb.org/'),
+	('obo', 'http://purl.obolibrary.org/obo/'),
+	('owl', 'http://www.w3.org/2002/07/owl#'),
+	('rdf', 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'),
+	('rdfs', 'http://www.w3.org/2000/01/rdf-schema#'),
+	('xsd', 'http://www.w3.org/2001/XMLSchema#'),
+	('UniProt', 'http://www.uniprot.org/uniprot/'),
+]
+
+rdf_type = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+
+# local names that can be written as prefix:name
+local_name = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_-]*$')
+
+def main(args):
+	parser = argparse.ArgumentParser(
+		description='Merge branches into one file without duplicate triples')
+	parser.add_argument('out_file')
+	parser.add_argument('inputs', nargs='+',
+		help='group directories or RDF files')
+	parser.add_argument('-j', '--jobs', type=int, default=1,
+		help='number of inputs to read at once (default: 1)')
+	parser.add_argument('--index', action='store_true',
+		help='index the triples of each subject (sorted N-Triples output)')
+	opts = parser.parse_args(args[1:])
+
+	out_dir = os.path.dirname(os.path.abspath(opts.out_file))
+	with tempfile.TemporaryDirectory(dir=out_dir) as tmp_dir:
+		jobs = [(i, '%s/%d.nt.gz' % (tmp_dir, n))
+			for n, i in enumerate(opts.inputs)]
+		if opts.jobs > 1:
+			pool = multiprocessing.Pool(min(opts.jobs, len(jobs)))
+			parts = pool.imap(write_part, jobs)
+		else:
+			pool = None
+			parts = map(write_part, jobs)
+		try:
+			count = write_merged(opts.out_file, parts, opts.index)
+		finally:
+			if pool:
+				pool.close()
+				pool.join()
+	print('wrote %d triples to %s' % (count, opts.out_file))
+
+def get_files(path):
+	'''Get the RDF files of an input: the species branches of a group
+	directory, or the input itself.'''
+	if os.path.isdir(path):
+		return sorted(glob.glob('%s/*/branch.ttl' % path))
+	return [path]
+
+def read_input(span, path):
+	'''Yield the triples of each RDF file of an input as N-Triples lines.'''
+	for file in get_files(path):
+		span.read(file)
+		yield from ntriples.read_triples(file)
+
+def write_part(job):
+	'''Write the distinct triples of one input to a sorted N-Triples part
+	file. Return the part file.'''
+	path, part_file = job
+	with tracing.span('merge-part', input=path) as s:
+		ntriples.write_sorted(read_input(s, path), part_file)
+		s.wrote(part_file)
+	return part_file
+
+def write_merged(out_file, parts, index=False):
+	'''Write the distinct triples of the sorted part files to the out file.
+	Return the number of triples written.'''
+	lines = ntriples.merge_sorted(ntriples.read_lines(p) for p in list(parts))
+	if ntriples.is_ntriples(out_file):
+		return ntriples.write_lines(lines, out_file, index)
+	count = 0
+	with open_output(out_file) as f:
+		for prefix, namespace in prefixes:
+			f.write('@prefix %s: <%s> .\n' % (prefix, namespace))
+		f.write('\n')
+		for line in lines:
+			f.write(turtle_line(line))
+			count += 1
+	return count
+
+@contextlib.contextmanager
+def open_output(out_file):
+	'''Open a Turtle output, replaced in one step when it is closed.'''
+	if out_file.endswith('.gz'):
+		with bgzip.Writer(out_file) as f:
+			yield f
+		return
+	tmp_file = out_file + '.tmp'
+	with open(tmp_file, 'w', encoding='utf-8') as f:
+		yield f
+	os.replace(tmp_file, out_file)
+
+def turtle_line(line):
+	'''Convert an N-Triples line to Turtle with the merge prefixes.'''
+	s, p, o = line.rstrip()[:-1].rstrip().split(' ', 2)
+	if p == rdf_type:
+		p = 'a'
+	else:
+		p = abbreviate(p)
+	if o.startswith('<'):
+		o = abbreviate(o)
+	elif o.endswith('>') and '"^^<' in o:
+		lexical, _, datatype = o.rpartition('^^')
+		o = '%s^^%s' % (lexical, abbreviate(datatype))
+	return '%s %s %s .\n' % (abbreviate(s), p, o)
+
+def abbreviate(term):
+	'''Write an IRI term (<...>) as prefix:name when possible.'''
+	if not term.startswith('<'):
+		return term
+	iri = term[1:-1]
+	for prefix, namespace in prefixes:
+		if iri.startswith(namespace) \
+		and local_name.match(iri[len(namespace):]):
+			return '%s:%s' % (prefix, iri[len(namespace):])
+	return term
+
+if __name__ == '__main__':
+	with tracing.script(sys.argv):
+		main(sys.argv)
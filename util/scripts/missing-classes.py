@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import sys
+
+import ntriples, tables, tracing
+
+ncbitaxon = 'http://purl.obolibrary.org/obo/NCBITaxon'
+rdf_type = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+owl_class = '<http://www.w3.org/2002/07/owl#Class>'
+
+# the databases that parse-parents.py creates classes for
+databases = ['GenPept', 'UniProt']
+
+def main(args):
+	'''Expects: parent proteins table, organism proteins file, excluded
+	classes file, output file. Write the NCBITaxon classes that are used as
+	proteome IDs by the IEDB proteins, but are not included in the organism
+	proteins (less the excluded classes), one per line.'''
+	proteins_file = args[1]
+	organism_file = args[2]
+	excluded_file = args[3]
+	out_file = args[4]
+
+	used = get_used_classes(proteins_file)
+	excluded = get_excluded_classes(excluded_file)
+	included = get_included_classes(organism_file, excluded)
+	missing = used - included
+
+	with open(out_file, 'w') as f:
+		for iri in sorted(missing):
+			f.write(iri + '\n')
+	print('%d of %d NCBITaxon classes missing from %s'
+		% (len(missing), len(used), organism_file))
+
+def get_used_classes(proteins_file):
+	'''Get the set of NCBITaxon class IRIs used as parents (proteome IDs) of
+	the IEDB proteins.'''
+	used = set()
+	for row in tables.read_rows(proteins_file, ['Database', 'Proteome ID']):
+		if row['Database'] in databases and row['Proteome ID'] != '':
+			used.add('%s_%s' % (ncbitaxon, row['Proteome ID']))
+	return used
+
+def get_excluded_classes(excluded_file):
+	'''Get the set of class IRIs that are not counted as included.'''
+	excluded = set()
+	with open(excluded_file, 'r') as f:
+		for line in f:
+			line = line.strip()
+			if line and not line.startswith('#'):
+				excluded.add(line)
+	return excluded
+
+def get_included_classes(organism_file, excluded):
+	'''Get the set of NCBITaxon class IRIs in the organism proteins, less the
+	excluded classes.'''
+	included = set()
+	for line in ntriples.read_triples(organism_file):
+		s, p, o = line.split(' ', 2)
+		if p == rdf_type and o.startswith(owl_class) \
+		and s.startswith('<' + ncbitaxon):
+			iri = s[1:-1]
+			if iri not in excluded:
+				included.add(iri)
+	return included
+
+if __name__ == '__main__':
+	with tracing.script(sys.argv):
+		main(sys.argv)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+'''Sorted N-Triples: the canonical intermediate format of the build. A sorted
+N-Triples file has one triple per line, sorted, with no duplicate lines, and
+is written as block gzip (see bgzip.py), compressed on all cores and
+optionally with an index of the triples of each subject. Because every file
+is sorted the same way, union and diff are streaming k-way merges that keep
+only one line per input in memory.
+
+Usage:
+  ntriples.py sort <output> <input>...   convert any RDF files to sorted N-Triples
+  ntriples.py union <output> <input>...  merge sorted N-Triples files
+  ntriples.py diff <output> <a> <b>      triples in sorted file a but not in b
+Add --index after the command to index the triples of each subject.'''
+
+import gzip, heapq, os, sys, tempfile
+
+import bgzip, tracing
+
+# number of lines in each sorted run of the external sort
+chunk_size = 1000000
+
+def main(args):
+	index = len(args) > 2 and args[2] == '--index'
+	if index:
+		args = args[:2] + args[3:]
+	if len(args) < 4 or args[1] not in ('sort', 'union', 'diff'):
+		print(__doc__.split('\n\n')[-1])
+		sys.exit(1)
+	command, out_file, inputs = args[1], args[2], args[3:]
+	if command == 'sort':
+		count = write_sorted(
+			(line for i in inputs for line in read_triples(i)), out_file, index)
+	elif command == 'union':
+		count = union(out_file, inputs, index)
+	else:
+		if len(inputs) != 2:
+			print(__doc__.split('\n\n')[-1])
+			sys.exit(1)
+		count = diff(out_file, inputs[0], inputs[1], index)
+	print('wrote %d triples to %s' % (count, out_file))
+
+def iri(value):
+	'''Format an IRI term.'''
+	return '<%s>' % value
+
+def literal(value, datatype=None):
+	'''Format a literal term, with an optional datatype IRI.'''
+	value = value.replace('\\', '\\\\').replace('"', '\\"') \
+		.replace('\n', '\\n').replace('\r', '\\r')
+	if datatype:
+		return '"%s"^^<%s>' % (value, datatype)
+	return '"%s"' % value
+
+def triple(subject, predicate, obj):
+	'''Format an N-Triples line from three formatted terms.'''
+	return '%s %s %s .\n' % (subject, predicate, obj)
+
+def is_ntriples(path):
+	'''Check if a file name is for (gzipped) N-Triples.'''
+	return path.endswith('.nt') or path.endswith('.nt.gz')
+
+def read_lines(path):
+	'''Yield the triple lines of a (gzipped) N-Triples file.'''
+	opener = gzip.open if path.endswith('.gz') else open
+	with opener(path, 'rt', encoding='utf-8') as f:
+		for line in f:
+			if line.strip() and not line.startswith('#'):
+				if not line.endswith('\n'):
+					line += '\n'
+				yield line
+
+def read_triples(path):
+	'''Yield each triple of an RDF file as an N-Triples line. N-Triples files
+	are read line by line, anything else is parsed (one file at a time) with
+	rdflib.'''
+	if is_ntriples(path):
+		yield from read_lines(path)
+		return
+
+	import rdflib
+	rdf_format = 'turtle' if '.ttl' in path else rdflib.util.guess_format(
+		path[:-3] if path.endswith('.gz') else path)
+	graph = rdflib.Graph()
+	if path.endswith('.gz'):
+		with gzip.open(path, 'rb') as f:
+			graph.parse(f, format=rdf_format)
+	else:
+		graph.parse(path, format=rdf_format)
+	data = graph.serialize(format='nt')
+	if isinstance(data, bytes):
+		data = data.decode('utf-8')
+	for line in data.splitlines(True):
+		if line.strip():
+			yield line
+
+def write_lines(lines, out_file, index=False):
+	'''Write lines (already sorted and distinct) to a sorted N-Triples file,
+	replacing it in one step. With index=True, a gzipped file gets an index
+	of the triples of each subject (keyed by the subject IRI). Return the
+	number of lines written.'''
+	count = 0
+	if not out_file.endswith('.gz'):
+		tmp_file = '%s.%d.tmp' % (out_file, os.getpid())
+		with open(tmp_file, 'w', encoding='utf-8') as f:
+			for line in lines:
+				f.write(line)
+				count += 1
+		os.replace(tmp_file, out_file)
+		return count
+	with bgzip.Writer(out_file, index=index) as f:
+		subject = None
+		for line in lines:
+			if index and (subject is None or not line.startswith(subject)):
+				# lines are sorted, so the triples of a subject are together
+				subject = line[:line.index(' ') + 1]
+				f.begin_record(subject.rstrip().strip('<>'))
+			f.write(line)
+			count += 1
+	return count
+
+def write_sorted(lines, out_file, index=False):
+	'''Sort N-Triples lines on disk, drop the duplicates and write a sorted
+	N-Triples file (see write_lines). Return the number of triples
+	written.'''
+	out_dir = os.path.dirname(os.path.abspath(out_file))
+	with tempfile.TemporaryDirectory(dir=out_dir) as tmp_dir:
+		runs = []
+		chunk = []
+		for line in lines:
+			chunk.append(line)
+			if len(chunk) >= chunk_size:
+				runs.append(write_run(chunk, tmp_dir))
+				chunk = []
+		if chunk or not runs:
+			runs.append(write_run(chunk, tmp_dir))
+		return write_lines(merge_sorted(read_lines(r) for r in runs), out_file,
+			index)
+
+def write_run(chunk, tmp_dir):
+	'''Sort and write one run of distinct lines.'''
+	fd, path = tempfile.mkstemp(dir=tmp_dir, suffix='.nt.gz')
+	os.close(fd)
+	with gzip.open(path, 'wt', encoding='utf-8', compresslevel=1) as f:
+		f.writelines(sorted(set(chunk)))
+	return path
+
+def merge_sorted(inputs):
+	'''Merge sorted streams of lines into one sorted stream without
+	duplicates.'''
+	last = None
+	for line in heapq.merge(*inputs):
+		if line != last:
+			yield line
+			last = line
+
+def union(out_file, inputs, index=False):
+	'''Write the union of sorted N-Triples files. Return the number of
+	triples written.'''
+	return write_lines(merge_sorted(read_lines(i) for i in inputs), out_file,
+		index)
+
+def difference(a, b):
+	'''Yield the lines of sorted stream a that are not in sorted stream b.'''
+	b = iter(b)
+	other = next(b, None)
+	for line in a:
+		while other is not None and other < line:
+			other = next(b, None)
+		if other != line:
+			yield line
+
+def diff(out_file, a, b, index=False):
+	'''Write the triples of sorted N-Triples file a that are not in b. Return
+	the number of triples written.'''
+	return write_lines(difference(read_lines(a), read_lines(b)), out_file,
+		index)
+
+if __name__ == '__main__':
+	with tracing.script(sys.argv):
+		main(sys.argv)
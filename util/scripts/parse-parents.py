@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 
-import csv
-import sys
+import argparse, hashlib, sys
+
+import ntriples, shards, tables, tracing
 
 # protein database IRI bases
 uniprot = 'http://www.uniprot.org/uniprot/{0}'
@@ -50,22 +51,151 @@ ttl_template_full = """
 	iedb:has-source-database \"{5}\" .
 """
 
+# the columns of the parent proteins table that are used
+columns = ['Accession', 'Database', 'Name', 'Title', 'Proteome ID',
+	'Proteome Label']
+
+# predicates for N-Triples output
+rdf_type = ntriples.iri('http://www.w3.org/1999/02/22-rdf-syntax-ns#type')
+owl_class = ntriples.iri('http://www.w3.org/2002/07/owl#Class')
+subclass_of = ntriples.iri('http://www.w3.org/2000/01/rdf-schema#subClassOf')
+label_of = ntriples.iri('http://www.w3.org/2000/01/rdf-schema#label')
+synonym_of = ntriples.iri('http://iedb.org/protein-synonym')
+accession_of = ntriples.iri('http://iedb.org/has-accession')
+accession_iri_of = ntriples.iri('http://iedb.org/has-accession-iri')
+database_of = ntriples.iri('http://iedb.org/has-source-database')
+
 def main(args):
-	in_file = args[1]
-	out_file = args[2]
-	lines = []
-	with open(in_file, mode='r') as f:
-		reader = csv.DictReader(f)
-		# use rows to create ttl
-		for row in reader:
-			lines.append(parse_row(row))
-	# write to file
+	'''Expects: parent proteins table, output file. The output is Turtle, or
+	sorted N-Triples if the output file ends with .nt or .nt.gz. With
+	--shards, one sorted N-Triples shard is kept per proteome ID and only the
+	shards whose rows changed are regenerated before they are merged into the
+	output.
+
+	Sibling UniProt proteins (with the same parent) that have the same label,
+	ignoring case, get the database and accession appended to their label.'''
+	parser = argparse.ArgumentParser(
+		description='Create classes for the parent proteins')
+	parser.add_argument('in_file')
+	parser.add_argument('out_file')
+	parser.add_argument('--shards', metavar='DIR',
+		help='directory of the per-species shards')
+	opts = parser.parse_args(args[1:])
+
+	in_file = opts.in_file
+	out_file = opts.out_file
+	labels = LabelIndex()
+	if opts.shards:
+		def read_shard_rows(species):
+			# siblings are in the same shard, so only the labels of the
+			# changed shards are needed
+			labels.add_rows(tables.read_species(
+				in_file, species, 'Proteome ID', columns))
+			return tables.read_species(
+				in_file, species, 'Proteome ID', columns)
+		files = shards.update_shards(
+			opts.shards,
+			lambda: read_rows(in_file),
+			lambda row: row['Proteome ID'],
+			lambda row: row_triples(row, labels),
+			shards.script_digest(__file__),
+			read_shard_rows)
+		ntriples.union(out_file, files)
+		return
+	labels.add_rows(read_rows(in_file))
+	if ntriples.is_ntriples(out_file):
+		# no ontology header: N-Triples files are merged before annotation
+		ntriples.write_sorted(
+			(t for row in read_rows(in_file) for t in row_triples(row, labels)),
+			out_file)
+		return
+	# write each class as its row is read
 	with open(out_file, 'w') as f:
 		f.write(ttl_header)
-		for l in lines:
-			f.write(l)
+		for row in read_rows(in_file):
+			f.write(parse_row(row, labels))
+
+def read_rows(in_file):
+	'''Yield the rows of the parent proteins table (only the used columns).'''
+	return tables.read_rows(in_file, columns)
+
+class LabelIndex:
+	'''Index of the labels of the UniProt proteins under each parent, to find
+	the siblings that share a label. Keys are digests of the parent and the
+	lowercase label.'''
+
+	def __init__(self):
+		# key -> accession of the first protein with the key
+		self.first = {}
+		# keys used by more than one protein
+		self.duplicates = set()
+
+	def add_rows(self, rows):
+		for row in rows:
+			self.add(row)
+
+	def add(self, row):
+		'''Add the label of a row.'''
+		if row['Database'] != 'UniProt':
+			return
+		label, _ = get_labels(row)
+		if label == '':
+			return
+		key = get_key(format_parent(row['Proteome ID']), label)
+		if self.first.setdefault(key, row['Accession']) != row['Accession']:
+			self.duplicates.add(key)
+
+	def label(self, row, label):
+		'''Get the label of a row's class: with the database and accession
+		appended if a sibling has the same label.'''
+		if row['Database'] != 'UniProt' or label == '':
+			return label
+		if get_key(format_parent(row['Proteome ID']), label) \
+		in self.duplicates:
+			return '%s (%s %s)' % (label, row['Database'], row['Accession'])
+		return label
 
-def parse_row(row):
+def get_key(parent, label):
+	'''Get a compact key for a parent plus child label.'''
+	key = parent + ' ' + label.lower()
+	return hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+
+def get_labels(row):
+	'''Get the label and synonym of a row. The name is used as the label
+	when there is no title.'''
+	label = row['Title']
+	synonym = row['Name']
+	if label == '':
+		return synonym, ''
+	return label, synonym
+
+def row_triples(row, labels):
+	'''Get the N-Triples lines of the class for a row (the same triples as
+	parse_row).'''
+	database = row['Database']
+	id_num = row['Accession']
+	iri = format_iri(database, id_num, row['Proteome Label'])
+	if iri is None:
+		return []
+	label, synonym = get_labels(row)
+	label = labels.label(row, label)
+	subject = ntriples.iri(iri)
+	triples = [
+		ntriples.triple(subject, rdf_type, owl_class),
+		ntriples.triple(subject, subclass_of,
+			ntriples.iri(format_parent(row['Proteome ID']))),
+		ntriples.triple(subject, accession_of, ntriples.literal(id_num)),
+		ntriples.triple(subject, accession_iri_of, subject),
+		ntriples.triple(subject, database_of, ntriples.literal(database))]
+	if label != '':
+		triples.append(
+			ntriples.triple(subject, label_of, ntriples.literal(label)))
+	if synonym != '':
+		triples.append(
+			ntriples.triple(subject, synonym_of, ntriples.literal(synonym)))
+	return triples
+
+def parse_row(row, labels):
 	# create an IRI from Accession and Database cells
 	database = row['Database']
 	id_num = row['Accession']
@@ -74,15 +204,12 @@ def parse_row(row):
 	if iri is None:
 		return ''
 	# build a class
-	label = row['Title']
-	synonym = row['Name']
+	label, synonym = get_labels(row)
+	label = labels.label(row, label)
 	parent = format_parent(row['Proteome ID'])
 	if label == '':
-		# missing label, check if there is a synonym
-		if synonym == '':
-			return ttl_template_lite.format(iri, parent, id_num, database)
-		else:
-			return ttl_template.format(iri, parent, synonym, id_num, database)
+		# missing label and synonym
+		return ttl_template_lite.format(iri, parent, id_num, database)
 	elif synonym == '':
 		# only label, no synonym
 		return ttl_template.format(iri, parent, label, id_num, database)
@@ -109,4 +236,5 @@ def format_parent(proteome_id):
 	return 'http://purl.obolibrary.org/obo/NCBITaxon_{0}'.format(proteome_id)
 
 if __name__ == '__main__':
-	main(sys.argv)
+	with tracing.script(sys.argv):
+		main(sys.argv)
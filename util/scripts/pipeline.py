@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+
+'''Run the protein-tree build as a graph of stages. Each stage is a shell
+command with input and output files (the same recipes as the Makefile), and
+starts as soon as the stages that make its inputs are done. Independent
+stages run at the same time, as long as the CPUs and memory they declare fit
+in the budget. A stage is skipped if its outputs exist and the digest of its
+command and input files is the same as on its last successful run (kept in
+the build catalog, see catalog.py).
+
+The species branches are updated one group at a time (update-branches.py
+--group), so the merge of a group starts as soon as its own species are done,
+while the other groups are still being updated.
+
+Usage: pipeline.py [options] [<stage> ...]
+Build the given stages (default: the protein and molecule trees) and the
+stages they depend on.'''
+
+import argparse, glob, hashlib, os, subprocess, sys, time
+
+import catalog
+
+scripts = 'util/scripts'
+queries = 'util/queries'
+robot = os.environ.get('ROBOT', 'java -Xmx8G -jar util/robot.jar')
+base = 'https://ontology.iedb.org/ontology'
+
+# IEDB files
+org_tree = 'dependencies/organism-tree.owl'
+sub_tree = 'dependencies/subspecies-tree.owl'
+np_tree = 'dependencies/non-peptide-tree.owl'
+sources = 'dependencies/source-parents.csv'
+proteins = 'dependencies/parent-proteins.csv'
+proteomes = 'dependencies/proteomes.tsv'
+protein_digests = 'dependencies/parent-proteins-last.digests'
+active_proteins = 'temp/active-proteins.csv'
+protein_changes = 'temp/protein-changes.csv'
+
+# species groups, each with a build/<group> directory of species branches
+groups = ['archeobacterium', 'bacterium', 'other-eukaryote', 'plant',
+	'vertebrate', 'virus']
+
+# memory (GB) of a ROBOT stage
+robot_memory = 8
+
+log_dir = 'build/logs'
+
+class Stage:
+	'''A step of the build. Inputs may be glob patterns (for the files of a
+	directory); after lists the stages that must be done first, in addition
+	to those that make the inputs. The memory is in GB.'''
+
+	def __init__(self, name, command, inputs=(), outputs=(), after=(),
+		cpus=1, memory=1):
+		self.name = name
+		self.command = command
+		self.inputs = list(inputs)
+		self.outputs = list(outputs)
+		self.after = list(after)
+		self.cpus = cpus
+		self.memory = memory
+
+def get_stages(jobs):
+	'''Get the stages of the build, in the order they are started when
+	several are ready. jobs is the number of species processes for each
+	group.'''
+	today = time.strftime('%Y-%m-%d')
+	stages = [
+		Stage('subspecies-tree',
+			'curl -Lk https://10.0.7.92/organisms/latest/temp/'
+			'subspecies-tree.owl > %s' % sub_tree,
+			outputs=[sub_tree]),
+		Stage('organism-tree',
+			'curl -Lk https://10.0.7.92/organisms/latest/temp/'
+			'organism-tree.owl > %s' % org_tree,
+			outputs=[org_tree]),
+		Stage('non-peptide-tree',
+			'curl -Lk https://10.0.7.92/arborist/results/'
+			'non-peptide-tree.owl > %s' % np_tree,
+			outputs=[np_tree]),
+		Stage('parent-proteins',
+			'%s/convert-parent-proteins.py dependencies/parent_protein.tsv %s'
+			% (scripts, proteins),
+			inputs=['dependencies/parent_protein.tsv'], outputs=[proteins]),
+		Stage('source-parents',
+			'%s/convert-source-parents.py dependencies/source_parent.tsv %s'
+			% (scripts, sources),
+			inputs=['dependencies/source_parent.tsv'], outputs=[sources]),
+		Stage('protein-digests',
+			'if [ -f dependencies/parent-proteins-last.csv ]; then '
+			'%s/protein_manifest.py dependencies/parent-proteins-last.csv %s; '
+			'else touch %s; fi' % (scripts, protein_digests, protein_digests),
+			outputs=[protein_digests]),
+		Stage('active-proteins',
+			'%s/get-active-proteins.py --digests temp/parent-proteins.digests '
+			'%s %s %s %s' % (scripts, active_proteins, proteins,
+			protein_digests, protein_changes),
+			inputs=[proteins, protein_digests],
+			outputs=[active_proteins, protein_changes,
+			'temp/parent-proteins.digests']),
+	]
+
+	# update and merge the branches of each group
+	for group in groups:
+		stages.append(Stage('branches-%s' % group,
+			'%s/update-branches.py --group %s --jobs %d --delta %s %s %s'
+			% (scripts, group, jobs, protein_changes, active_proteins,
+			proteomes),
+			inputs=[active_proteins, protein_changes, proteomes,
+			'%s/build-branch.rq' % queries],
+			cpus=jobs, memory=jobs))
+		stages.append(Stage('merge-%s' % group,
+			'%s/merge-branches.py --index build/branches/%s.nt.gz build/%s'
+			% (scripts, group, group),
+			inputs=['build/%s/*/branch.ttl' % group],
+			outputs=['build/branches/%s.nt.gz' % group],
+			after=['branches-%s' % group], memory=2))
+	group_branches = ['build/branches/%s.nt.gz' % g for g in groups]
+	stages.append(Stage('branches',
+		'%s/ntriples.py union --index build/branches.nt.gz %s'
+		% (scripts, ' '.join(group_branches)),
+		inputs=group_branches, outputs=['build/branches.nt.gz']))
+
+	stages.extend([
+		Stage('organism-proteins',
+			'%s filter --input %s --term OBI:0100026 '
+			'--select "descendants annotations" '
+			'query --update %s/rename.ru '
+			'remove --term oboInOwl:hasLabelSource --trim true '
+			'--output temp/organism-proteins.ttl' % (robot, org_tree, queries),
+			inputs=[org_tree, '%s/rename.ru' % queries],
+			outputs=['temp/organism-proteins.ttl'], memory=robot_memory),
+		Stage('upper',
+			'%s query --input temp/organism-proteins.ttl '
+			'--query %s/construct-upper.rq temp/upper.ttl' % (robot, queries),
+			inputs=['temp/organism-proteins.ttl',
+			'%s/construct-upper.rq' % queries],
+			outputs=['temp/upper.ttl'], memory=robot_memory),
+		Stage('source-synonyms',
+			'%s/add-synonyms.py --shards build/shards/source-synonyms '
+			'%s %s temp/source-synonyms.nt.gz' % (scripts, sources, proteins),
+			inputs=[sources, proteins],
+			outputs=['temp/source-synonyms.nt.gz'], memory=2),
+		Stage('iedb-proteins',
+			'%s/parse-parents.py --shards build/shards/iedb-proteins '
+			'%s temp/iedb-proteins.nt.gz' % (scripts, proteins),
+			inputs=[proteins], outputs=['temp/iedb-proteins.nt.gz'],
+			memory=2),
+		Stage('missing-classes',
+			'%s/missing-classes.py %s temp/organism-proteins.ttl '
+			'util/excluded-classes.txt temp/missing-classes.txt'
+			% (scripts, proteins),
+			inputs=[proteins, 'temp/organism-proteins.ttl',
+			'util/excluded-classes.txt'],
+			outputs=['temp/missing-classes.txt'], memory=2),
+		Stage('taxonomy',
+			'%s/taxonomy.py build %s build/taxonomy.idx' % (scripts, sub_tree),
+			inputs=[sub_tree], outputs=['build/taxonomy.idx'], memory=4),
+		Stage('taxon-proteins',
+			'%s/taxon-proteins.py build/taxonomy.idx temp/missing-classes.txt '
+			'temp/taxon-proteins.nt.gz' % scripts,
+			inputs=['build/taxonomy.idx', 'temp/missing-classes.txt'],
+			outputs=['temp/taxon-proteins.nt.gz']),
+	])
+	for name in ['organism-proteins', 'upper']:
+		stages.append(Stage('%s-nt' % name,
+			'%s/ntriples.py sort temp/%s.nt.gz temp/%s.ttl'
+			% (scripts, name, name),
+			inputs=['temp/%s.ttl' % name],
+			outputs=['temp/%s.nt.gz' % name], memory=2))
+
+	merged_inputs = ['temp/taxon-proteins.nt.gz',
+		'temp/organism-proteins.nt.gz', 'temp/upper.nt.gz',
+		'temp/iedb-proteins.nt.gz', 'temp/source-synonyms.nt.gz',
+		'build/branches.nt.gz']
+	stages.extend([
+		Stage('merged-nt',
+			'%s/ntriples.py union temp/merged.nt.gz %s'
+			% (scripts, ' '.join(merged_inputs)),
+			inputs=merged_inputs, outputs=['temp/merged.nt.gz']),
+		Stage('merged',
+			'%s merge --input temp/merged.nt.gz '
+			'annotate --ontology-iri %s/protein-tree.owl '
+			'--version-iri %s/%s/protein-tree.owl '
+			'--output temp/merged-raw.owl && '
+			'%s/iri_rewrite.py temp/merged-raw.owl temp/merged.owl && '
+			'rm -f temp/merged-raw.owl' % (robot, base, base, today, scripts),
+			inputs=['temp/merged.nt.gz'], outputs=['temp/merged.owl'],
+			memory=robot_memory),
+		Stage('trees',
+			'%s/assemble-trees.py --ontology-iri %s/molecule-tree.owl.gz '
+			'--version-iri %s/%s/molecule-tree.owl.gz temp/merged.owl %s '
+			'protein-tree.owl.gz molecule-tree.owl.gz'
+			% (scripts, base, base, today, np_tree),
+			inputs=['temp/merged.owl', np_tree],
+			outputs=['protein-tree.owl.gz', 'molecule-tree.owl.gz']),
+		Stage('lookup-index',
+			'%s/build-lookup-index.py protein-tree.owl.gz '
+			'build/protein-lookup.sqlite' % scripts,
+			inputs=['protein-tree.owl.gz'],
+			outputs=['build/protein-lookup.sqlite']),
+	])
+	return stages
+
+def main(args):
+	parser = argparse.ArgumentParser(
+		description='Build the protein tree as a graph of stages')
+	parser.add_argument('targets', nargs='*', metavar='stage',
+		help='stages to build (default: trees lookup-index)')
+	parser.add_argument('--cpus', type=int, default=os.cpu_count(),
+		help='CPUs that running stages may use (default: %(default)s)')
+	parser.add_argument('--memory', type=float, default=total_memory(),
+		help='GB of memory that running stages may use (default: %(default)s)')
+	parser.add_argument('-j', '--jobs', type=int, default=1,
+		help='species processed at once in each group (default: 1)')
+	parser.add_argument('--force', action='store_true',
+		help='run the stages even if their inputs are unchanged')
+	parser.add_argument('--dry-run', action='store_true',
+		help='print the stages that would run')
+	parser.add_argument('--clean', action='store_true',
+		help='after the build, keep the protein digests and remove temp')
+	opts = parser.parse_args(args[1:])
+
+	stages = get_stages(opts.jobs)
+	by_name = dict((s.name, s) for s in stages)
+	targets = opts.targets or ['trees', 'lookup-index']
+	unknown = [t for t in targets if t not in by_name]
+	if unknown:
+		parser.error('unknown stages: %s (stages: %s)'
+			% (', '.join(unknown), ', '.join(by_name)))
+	deps = get_dependencies(stages)
+	selected = set()
+	todo = list(targets)
+	while todo:
+		name = todo.pop()
+		if name not in selected:
+			selected.add(name)
+			todo.extend(deps[name])
+	stages = [s for s in stages if s.name in selected]
+
+	for d in ['build/branches', 'dependencies', 'temp', log_dir] \
+		+ ['build/%s' % g for g in groups]:
+		os.makedirs(d, exist_ok=True)
+	db = catalog.Catalog()
+	try:
+		ok = Runner(stages, deps, db, opts.cpus, opts.memory, opts.force,
+			opts.dry_run).run()
+	finally:
+		db.close()
+	if not ok:
+		sys.exit(1)
+	if opts.clean and not opts.dry_run:
+		os.replace('temp/parent-proteins.digests', protein_digests)
+		subprocess.check_call(['rm', '-rf', 'temp'])
+
+def total_memory():
+	'''Get the physical memory in GB.'''
+	try:
+		pages = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+	except (ValueError, OSError):
+		return 16
+	return round(pages / 1024 ** 3, 1)
+
+def get_dependencies(stages):
+	'''Get a map of stage name -> names of the stages that must be done
+	first: the stages that make its inputs, and its after stages.'''
+	producers = {}
+	for s in stages:
+		for output in s.outputs:
+			producers[output] = s.name
+	deps = {}
+	for s in stages:
+		names = set(s.after)
+		for i in s.inputs:
+			if i in producers:
+				names.add(producers[i])
+		deps[s.name] = names
+	return deps
+
+def exit_code(status):
+	'''Get the exit code of a wait status, negative for a signal as with
+	subprocess.'''
+	if os.WIFSIGNALED(status):
+		return -os.WTERMSIG(status)
+	return os.WEXITSTATUS(status)
+
+class Runner:
+	'''Start the stages as their dependencies finish, within the CPU and
+	memory budget.'''
+
+	def __init__(self, stages, deps, db, cpus, memory, force=False,
+		dry_run=False):
+		self.stages = stages
+		self.deps = deps
+		self.db = db
+		self.cpus = cpus
+		self.memory = memory
+		self.force = force
+		self.dry_run = dry_run
+		self.done = set()
+		self.failed = []
+		# pid -> (stage, process, log, inputs digest, start time)
+		self.running = {}
+
+	def run(self):
+		'''Run all the stages. Return False if any stage failed.'''
+		pending = list(self.stages)
+		while pending or self.running:
+			if not self.failed:
+				pending = self.start_ready(pending)
+			if not self.running:
+				break
+			self.wait()
+		if pending and not self.failed:
+			self.failed.extend(s.name for s in pending)
+			print('could not run: %s' % ', '.join(s.name for s in pending))
+		return not self.failed
+
+	def start_ready(self, pending):
+		'''Skip or start the pending stages that are ready and fit in the
+		budget. Return the stages still pending.'''
+		started = True
+		while started:
+			started = False
+			for stage in pending:
+				if not self.deps[stage.name] <= self.done:
+					continue
+				digest = self.inputs_digest(stage)
+				if not self.force and self.is_current(stage, digest):
+					print('%-24s up to date' % stage.name)
+					self.done.add(stage.name)
+				elif self.dry_run:
+					print('%-24s would run: %s' % (stage.name, stage.command))
+					self.done.add(stage.name)
+				elif self.fits(stage):
+					self.start(stage, digest)
+				else:
+					continue
+				pending.remove(stage)
+				started = True
+				break
+		return pending
+
+	def is_current(self, stage, digest):
+		'''Check if the outputs of a stage exist and were made from the same
+		inputs. Like make, a stage without inputs (such as a download) is
+		current as soon as its outputs exist.'''
+		if not all(os.path.exists(o) for o in stage.outputs):
+			return False
+		if not stage.inputs:
+			return bool(stage.outputs) \
+				or self.db.stage_digest(stage.name) == digest
+		return digest is not None \
+			and self.db.stage_digest(stage.name) == digest
+
+	def fits(self, stage):
+		'''Check if a stage fits in the budget next to the running stages.
+		A stage that is larger than the budget runs on its own.'''
+		if not self.running:
+			return True
+		cpus = sum(s.cpus for s, _, _, _, _ in self.running.values())
+		memory = sum(s.memory for s, _, _, _, _ in self.running.values())
+		return cpus + stage.cpus <= self.cpus \
+			and memory + stage.memory <= self.memory
+
+	def inputs_digest(self, stage):
+		'''Get the digest of the command and input files of a stage, or None
+		if an input is missing.'''
+		h = hashlib.sha256(stage.command.encode('utf-8'))
+		for pattern in stage.inputs:
+			if glob.has_magic(pattern):
+				paths = sorted(glob.glob(pattern))
+			else:
+				paths = [pattern]
+			for path in paths:
+				if not os.path.isfile(path):
+					return None
+				h.update(b'\0' + path.encode('utf-8') + b'\0')
+				h.update(self.db.file_digest(path).encode('utf-8'))
+		return h.hexdigest()
+
+	def start(self, stage, digest):
+		'''Start the command of a stage, with its output going to a log.'''
+		print('%-24s started' % stage.name)
+		log = open('%s/%s.log' % (log_dir, stage.name), 'w')
+		p = subprocess.Popen(
+			['bash', '-eu', '-o', 'pipefail', '-c', stage.command],
+			stdout=log, stderr=subprocess.STDOUT)
+		self.running[p.pid] = (stage, p, log, digest, time.time())
+
+	def wait(self):
+		'''Wait for a running stage to finish and record the result.'''
+		pid, status = os.wait()
+		if pid not in self.running:
+			return
+		stage, p, log, digest, started = self.running.pop(pid)
+		# the process was reaped by wait
+		p.returncode = exit_code(status)
+		log.close()
+		finished = time.time()
+		if p.returncode == 0:
+			print('%-24s done (%.1fs)' % (stage.name, finished - started))
+			self.done.add(stage.name)
+			if digest is None:
+				# the inputs are there now if the command made them
+				digest = self.inputs_digest(stage)
+			self.db.record_stage(stage.name, 'done', digest, started, finished)
+			return
+		print('%-24s FAILED (exit %d), see %s/%s.log'
+			% (stage.name, p.returncode, log_dir, stage.name))
+		self.failed.append(stage.name)
+		self.db.record_stage(stage.name, 'failed', digest, started, finished)
+		# as with .DELETE_ON_ERROR, do not leave partial outputs
+		for output in stage.outputs:
+			if os.path.exists(output):
+				os.remove(output)
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+'''Look up proteins in the lookup index of the protein tree (see
+build-lookup-index.py), by accession or IRI, without loading the tree.
+
+Each result is a JSON object with the IRI, accession, label, synonyms,
+parent (IRI and label), taxon ID and source database of a class. An accession
+can match several classes (e.g. a protein and the IEDB sources with the same
+accession); an unknown ID has an empty list of matches.
+
+The server answers GET /lookup?id=<ID>&id=<ID>... and POST /lookup with a
+JSON list of IDs, with a JSON object of ID -> list of matches. Recent IDs
+are kept in an LRU cache.
+
+Usage:
+  protein-lookup.py get [--index FILE] <ID>...  print the matches of each ID
+  protein-lookup.py serve [--index FILE] [--host HOST] [--port PORT]'''
+
+import argparse, collections, http.server, json, sqlite3, sys, threading
+from urllib.parse import parse_qs, urlparse
+
+index_file = 'build/protein-lookup.sqlite'
+
+# the most IDs to look up in one query
+batch_size = 500
+
+# the largest POST body, in bytes
+max_body = 16 * 1024 * 1024
+
+columns = ['iri', 'accession', 'label', 'synonyms', 'parent',
+	'parent_label', 'taxon_id', 'source_database']
+
+def main(args):
+	parser = argparse.ArgumentParser(
+		description='Look up proteins in the protein tree index')
+	parser.add_argument('command', choices=['get', 'serve'])
+	parser.add_argument('ids', nargs='*', metavar='ID')
+	parser.add_argument('--index', default=index_file,
+		help='lookup index (default: %(default)s)')
+	parser.add_argument('--host', default='127.0.0.1',
+		help='address to serve on (default: %(default)s)')
+	parser.add_argument('--port', type=int, default=8080,
+		help='port to serve on (default: %(default)s)')
+	parser.add_argument('--cache', type=int, default=100000,
+		help='number of IDs kept in the cache (default: %(default)s)')
+	opts = parser.parse_intermixed_args(args[1:])
+
+	lookup = Lookup(opts.index, opts.cache)
+	if opts.command == 'get':
+		if not opts.ids:
+			parser.error('get needs at least one ID')
+		for key, matches in lookup.get(opts.ids).items():
+			print(json.dumps({'id': key, 'matches': matches}))
+		return
+	server = http.server.ThreadingHTTPServer(
+		(opts.host, opts.port), LookupHandler)
+	server.lookup = lookup
+	print('serving %s on http://%s:%d/lookup'
+		% (opts.index, opts.host, server.server_address[1]))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+
+class Lookup:
+	'''Batch lookups in the index, with an LRU cache of the matches of
+	each ID. Each thread has its own read-only connection.'''
+
+	def __init__(self, path, cache_size=100000):
+		self.path = path
+		self.cache_size = cache_size
+		self.cache = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.local = threading.local()
+		# fail early if there is no index
+		self.connection()
+
+	def connection(self):
+		db = getattr(self.local, 'db', None)
+		if db is None:
+			db = sqlite3.connect('file:%s?mode=ro' % self.path, uri=True)
+			self.local.db = db
+		return db
+
+	def get(self, ids):
+		'''Get a map of ID -> list of matches, in the order of the IDs.'''
+		results = {}
+		missing = []
+		with self.lock:
+			for key in ids:
+				if key in self.cache:
+					self.cache.move_to_end(key)
+					results[key] = self.cache[key]
+				else:
+					results[key] = None
+					missing.append(key)
+		if not missing:
+			return results
+		found = self.query(missing)
+		with self.lock:
+			for key in missing:
+				results[key] = found.get(key, [])
+				self.cache[key] = results[key]
+				self.cache.move_to_end(key)
+			while len(self.cache) > self.cache_size:
+				self.cache.popitem(last=False)
+		return results
+
+	def query(self, ids):
+		'''Look up IDs (accessions or IRIs) in the index. Return a map of ID
+		-> list of matches, for the IDs that were found.'''
+		db = self.connection()
+		found = {}
+		ids = list(dict.fromkeys(ids))
+		for i in range(0, len(ids), batch_size):
+			batch = ids[i:i + batch_size]
+			marks = ', '.join('?' * len(batch))
+			for row in db.execute(
+				'''SELECT c.iri, c.accession, c.label, c.synonyms, c.parent,
+				p.label, c.taxon_id, c.source_database
+				FROM classes c LEFT JOIN classes p ON p.iri = c.parent
+				WHERE c.iri IN (%s) OR c.accession IN (%s)
+				ORDER BY c.iri''' % (marks, marks), batch + batch):
+				match = dict(zip(columns, row))
+				match['synonyms'] = json.loads(match['synonyms'] or '[]')
+				for key in (match['iri'], match['accession']):
+					if key in batch:
+						found.setdefault(key, []).append(match)
+		return found
+
+class LookupHandler(http.server.BaseHTTPRequestHandler):
+	'''Answer lookups as JSON.'''
+
+	def do_GET(self):
+		url = urlparse(self.path)
+		if url.path != '/lookup':
+			self.send_json(404, {'error': 'not found'})
+			return
+		ids = parse_qs(url.query).get('id', [])
+		self.answer(ids)
+
+	def do_POST(self):
+		if urlparse(self.path).path != '/lookup':
+			self.send_json(404, {'error': 'not found'})
+			return
+		length = int(self.headers.get('Content-Length') or 0)
+		if length > max_body:
+			self.send_json(413, {'error': 'request too large'})
+			return
+		try:
+			ids = json.loads(self.rfile.read(length) or b'[]')
+		except ValueError:
+			ids = None
+		if not isinstance(ids, list) \
+		or not all(isinstance(i, str) for i in ids):
+			self.send_json(400, {'error': 'expected a JSON list of IDs'})
+			return
+		self.answer(ids)
+
+	def answer(self, ids):
+		if not ids:
+			self.send_json(400, {'error': 'no IDs given'})
+			return
+		self.send_json(200, self.server.lookup.get(ids))
+
+	def send_json(self, status, value):
+		data = json.dumps(value).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def log_message(self, *args):
+		pass
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+'''Digest manifests of the parent-proteins table. A manifest has one line per
+protein (species ID, accession, database, digest of the whole row), so the
+proteins of the last build can be compared to a new table without keeping a
+copy of the last table. The table is read as bytes, one record at a time, and
+only the first columns are split out; the digest covers the raw record.
+
+Usage: protein_manifest.py <parent-proteins.csv> <manifest>
+Write the manifest of a parent-proteins table.'''
+
+import hashlib, os, sys
+
+import tables, tracing
+
+# the columns that are split out of each record
+columns = ['Accession', 'Database', 'Proteome ID']
+
+def main(args):
+	if len(args) != 3:
+		print(__doc__.split('\n\n')[-1])
+		sys.exit(1)
+	count = write_manifest(args[2], (
+		(species, accession, database, digest) for species, accession,
+		database, digest, _, _ in read_table(args[1])))
+	print('wrote %d protein digests to %s' % (count, args[2]))
+
+def record_digest(record):
+	'''Get the digest of a raw table record.'''
+	return hashlib.blake2b(
+		record.rstrip(b'\r\n'), digest_size=16).hexdigest()
+
+def read_table(table_file):
+	'''Yield (species ID, accession, database, digest, offset, length) for
+	each protein of a parent-proteins table, in table order. Rows without an
+	accession and repeated accessions of a species are skipped.'''
+	if os.path.getsize(table_file) == 0:
+		return
+	projection = tables.Projection(tables.read_header(table_file), columns)
+	seen = {}
+	with open(table_file, 'rb') as f:
+		f.readline()
+		for offset, record in tables.read_records(f):
+			if not record.strip():
+				continue
+			row = projection.row(record)
+			species = row['Proteome ID']
+			accession = row['Accession']
+			if accession == '':
+				continue
+			species_seen = seen.setdefault(species, set())
+			if accession in species_seen:
+				# ERROR!
+				print('Duplicate protein %s for %s' % (accession, species))
+				continue
+			species_seen.add(accession)
+			yield species, accession, row['Database'], record_digest(record), \
+				offset, len(record)
+
+def read_manifest(manifest_file):
+	'''Get a map of species ID -> accession -> (database, digest) from a
+	manifest. A missing or empty manifest has no proteins.'''
+	proteins = {}
+	if not os.path.exists(manifest_file):
+		return proteins
+	with open(manifest_file, 'r') as f:
+		for line in f:
+			fields = line.rstrip('\n').split('\t')
+			if len(fields) != 4:
+				continue
+			species, accession, database, digest = fields
+			proteins.setdefault(species, {})[accession] = (database, digest)
+	return proteins
+
+def write_manifest(manifest_file, entries):
+	'''Write (species ID, accession, database, digest) entries to a manifest
+	in one step. Return the number of entries.'''
+	count = 0
+	tmp_file = manifest_file + '.tmp'
+	with open(tmp_file, 'w') as f:
+		for entry in entries:
+			f.write('\t'.join(entry) + '\n')
+			count += 1
+	os.replace(tmp_file, manifest_file)
+	return count
+
+if __name__ == '__main__':
+	with tracing.script(sys.argv):
+		main(sys.argv)
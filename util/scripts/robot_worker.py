@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+'''Run ROBOT commands in a long-lived JVM (util/RobotWorker.java) so that each
+command does not pay for JVM startup and warm-up. Jobs are sent as lines of
+tab-separated arguments and the worker replies with one line per job.'''
+
+import os, queue, subprocess, threading
+
+# ROBOT as a one-off command and as a worker
+robot_cmd = ['java', '-Xmx8G', '-jar', 'util/robot.jar']
+worker_cmd = ['java', '-Xmx8G', '-cp', 'util/robot.jar' + os.pathsep + 'util',
+	'RobotWorker']
+
+class RobotError(Exception):
+	'''A ROBOT job failed, timed out, or the worker died.'''
+	pass
+
+class RobotWorker:
+	'''A ROBOT JVM that is started on the first job and restarted if it dies
+	or a job runs past its timeout.'''
+
+	def __init__(self, command=None, timeout=3600):
+		self.command = command or worker_cmd
+		self.timeout = timeout
+		self.proc = None
+		self.replies = None
+
+	def start(self):
+		'''Start the JVM and a thread that collects its replies.'''
+		self.proc = subprocess.Popen(
+			self.command,
+			stdin=subprocess.PIPE,
+			stdout=subprocess.PIPE,
+			universal_newlines=True,
+			bufsize=1)
+		self.replies = queue.Queue()
+		reader = threading.Thread(
+			target=read_replies, args=(self.proc.stdout, self.replies))
+		reader.daemon = True
+		reader.start()
+
+	def run(self, args, timeout=None):
+		'''Run one ROBOT command (a list of arguments) and wait for it to
+		finish. Raise RobotError if the command fails.'''
+		if timeout is None:
+			timeout = self.timeout
+		for a in args:
+			if '\t' in a or '\n' in a:
+				raise RobotError('cannot send argument "%s" to ROBOT' % a)
+		if self.proc is None or self.proc.poll() is not None:
+			self.start()
+		try:
+			self.proc.stdin.write('\t'.join(args) + '\n')
+			self.proc.stdin.flush()
+			reply = self.replies.get(timeout=timeout)
+		except queue.Empty:
+			self.kill()
+			raise RobotError('ROBOT job timed out after %d seconds' % timeout)
+		except OSError as e:
+			self.kill()
+			raise RobotError('ROBOT worker died: %s' % e)
+		if reply is None:
+			self.kill()
+			raise RobotError('ROBOT worker died')
+		if reply != 'OK':
+			raise RobotError(reply)
+
+	def stop(self):
+		'''Stop the JVM (it exits by itself when its stdin is closed).'''
+		if self.proc is None:
+			return
+		try:
+			self.proc.stdin.close()
+			self.proc.wait(timeout=10)
+		except (OSError, subprocess.TimeoutExpired):
+			self.proc.kill()
+			self.proc.wait()
+		self.proc = None
+
+	def kill(self):
+		'''Kill the JVM, e.g., when a job is stuck.'''
+		if self.proc is None:
+			return
+		self.proc.kill()
+		self.proc.wait()
+		self.proc = None
+
+def read_replies(stream, replies):
+	'''Put each reply line from the worker on the queue, then None at EOF.'''
+	for line in stream:
+		replies.put(line.rstrip('\n'))
+	replies.put(None)
+
+def run_robot(args, worker=None, retries=1):
+	'''Run a ROBOT command with the worker, or as a one-off process if there
+	is no worker. Failed commands are retried. Raise RobotError if the
+	command still fails.'''
+	for attempt in range(retries + 1):
+		try:
+			if worker is not None:
+				worker.run(args)
+			else:
+				code = subprocess.call(robot_cmd + args)
+				if code != 0:
+					raise RobotError(
+						'ROBOT exited with %d: %s' % (code, ' '.join(args)))
+			return
+		except RobotError:
+			if attempt == retries:
+				raise
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+'''Species shards: split a generated RDF file into one sorted N-Triples file
+per species (proteome ID), so that an incremental build only regenerates the
+shards whose input rows changed. Each shard directory has a manifest with a
+hash of the rows of every shard (and of the script that generated them).
+The shards are then merged into the full output with a streaming union.'''
+
+import collections, hashlib, os, re
+
+import ntriples
+
+manifest_name = 'manifest.tsv'
+
+# number of shard files kept open while writing
+max_open = 64
+
+class ShardWriter:
+	'''Write lines to many shard files, keeping only the most recently used
+	files open. Each shard file is truncated the first time it is written.'''
+
+	def __init__(self, directory, limit=max_open):
+		self.directory = directory
+		self.limit = limit
+		self.files = collections.OrderedDict()
+		self.started = set()
+
+	def write(self, key, line):
+		'''Write a line to the shard for key.'''
+		f = self.files.get(key)
+		if f is None:
+			if len(self.files) >= self.limit:
+				_, oldest = self.files.popitem(last=False)
+				oldest.close()
+			mode = 'a' if key in self.started else 'w'
+			f = open(raw_path(self.directory, key), mode, encoding='utf-8')
+			self.started.add(key)
+			self.files[key] = f
+		else:
+			self.files.move_to_end(key)
+		f.write(line)
+
+	def close(self):
+		'''Close all open shard files.'''
+		for f in self.files.values():
+			f.close()
+		self.files.clear()
+
+def shard_name(key):
+	'''Get a file-safe name for a shard key.'''
+	if key == '':
+		return 'none'
+	return re.sub(r'[^A-Za-z0-9_.-]', '_', key)
+
+def shard_path(directory, key):
+	'''Get the sorted N-Triples file of a shard.'''
+	return '%s/%s.nt.gz' % (directory, shard_name(key))
+
+def raw_path(directory, key):
+	'''Get the unsorted file that a shard is written to.'''
+	return '%s/%s.raw' % (directory, shard_name(key))
+
+def row_digest(row):
+	'''Get a digest of a table row (a dict).'''
+	h = hashlib.sha256()
+	for key in sorted(row):
+		h.update(('%s\t%s\n' % (key, row[key])).encode('utf-8'))
+	return h.digest()
+
+def script_digest(path):
+	'''Get a digest of the script that generates the shards.'''
+	with open(path, 'rb') as f:
+		return hashlib.sha256(f.read()).hexdigest()
+
+def read_manifest(directory):
+	'''Read the manifest of a shard directory: (script digest, map of shard
+	key -> digest of its rows).'''
+	path = '%s/%s' % (directory, manifest_name)
+	version = ''
+	digests = {}
+	if not os.path.exists(path):
+		return version, digests
+	with open(path, 'r') as f:
+		for line in f:
+			fields = line.rstrip('\n').split('\t')
+			if fields[0] == '#version':
+				version = fields[1]
+			elif len(fields) == 2:
+				digests[fields[0]] = fields[1]
+	return version, digests
+
+def write_manifest(directory, version, digests):
+	'''Write the manifest of a shard directory in one step.'''
+	path = '%s/%s' % (directory, manifest_name)
+	tmp = path + '.tmp'
+	with open(tmp, 'w') as f:
+		f.write('#version\t%s\n' % version)
+		for key in sorted(digests):
+			f.write('%s\t%s\n' % (key, digests[key]))
+	os.replace(tmp, path)
+
+def shard_digests(rows, shard_key):
+	'''Get a map of shard key -> digest of the shard's rows, in order.'''
+	hashes = {}
+	for row in rows:
+		key = shard_key(row)
+		h = hashes.get(key)
+		if h is None:
+			h = hashlib.sha256()
+			hashes[key] = h
+		h.update(row_digest(row))
+	return dict((k, h.hexdigest()) for k, h in hashes.items())
+
+def update_shards(directory, read_rows, shard_key, row_triples, version,
+	read_shard_rows=None):
+	'''Bring the shards in a directory up to date with a table.
+
+	read_rows() returns a new iterator over the (included) rows of the
+	table, shard_key(row) gets the shard of a row, and row_triples(row)
+	gets the N-Triples lines of a row. The table is read once to hash the
+	rows of each shard, then the rows of the shards that changed are read
+	again to write them: with read_shard_rows(keys) if given (e.g., from a
+	species index), otherwise from the whole table. Shards of species that
+	are no longer in the table are removed. Return the list of shard
+	files.'''
+	os.makedirs(directory, exist_ok=True)
+	old_version, old_digests = read_manifest(directory)
+	digests = shard_digests(read_rows(), shard_key)
+
+	changed = set()
+	for key, digest in digests.items():
+		if version != old_version or old_digests.get(key) != digest \
+		or not os.path.exists(shard_path(directory, key)):
+			changed.add(key)
+	for key in set(old_digests) - set(digests):
+		if os.path.exists(shard_path(directory, key)):
+			os.remove(shard_path(directory, key))
+	print('%d of %d shards changed in %s'
+		% (len(changed), len(digests), directory))
+
+	if changed:
+		writer = ShardWriter(directory)
+		if read_shard_rows:
+			rows = read_shard_rows(changed)
+		else:
+			rows = read_rows()
+		try:
+			for row in rows:
+				key = shard_key(row)
+				if key in changed:
+					for line in row_triples(row):
+						writer.write(key, line)
+		finally:
+			writer.close()
+		for key in changed:
+			raw = raw_path(directory, key)
+			if os.path.exists(raw):
+				ntriples.write_sorted(ntriples.read_lines(raw),
+					shard_path(directory, key))
+				os.remove(raw)
+			else:
+				# the rows of this shard made no triples
+				ntriples.write_lines([], shard_path(directory, key))
+
+	write_manifest(directory, version, digests)
+	return [shard_path(directory, key) for key in sorted(digests)]
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+'''Read the protein tables (parent-proteins.csv, source-parents.csv, ...)
+without paying for the columns that are not used. Rows are read as bytes and
+only the requested columns are split out and decoded: the fields after the
+last requested column (in these tables, the long Sequence column) are never
+decoded or copied. Quoted fields are read as by the csv module.
+
+A species index maps each species (e.g., proteome ID) to the byte ranges of
+its rows, so that the rows of a few species can be read without reading the
+rest of the table. The index is kept in a <table>.species file and only
+rebuilt when the table changes.'''
+
+import csv, io, os
+
+def read_header(path, delimiter=','):
+	'''Get the list of column names of a table.'''
+	with open(path, 'r', newline='') as f:
+		return next(csv.reader(f, delimiter=delimiter), [])
+
+def read_records(f):
+	'''Yield (offset, bytes) for each record of a binary table file. A record
+	is one line, or several if a quoted field has line breaks.'''
+	offset = f.tell()
+	record = b''
+	for line in f:
+		record += line
+		# an odd number of quotes means a quoted field goes on
+		if record.count(b'"') % 2 == 1:
+			continue
+		yield offset, record
+		offset += len(record)
+		record = b''
+	if record:
+		yield offset, record
+
+def split_record(record, count, delimiter=b','):
+	'''Get the first count fields of a record, as strings. The record is only
+	scanned up to the end of the last of these fields.'''
+	fields = []
+	start = 0
+	while len(fields) < count:
+		value = b''
+		if record.startswith(b'"', start):
+			# a quoted field ends at a quote that is not doubled
+			start += 1
+			while True:
+				end = record.find(b'"', start)
+				if end < 0:
+					value += record[start:]
+					start = len(record)
+					break
+				value += record[start:end]
+				start = end + 1
+				if not record.startswith(b'"', start):
+					break
+				value += b'"'
+				start += 1
+		end = record.find(delimiter, start)
+		if end < 0:
+			value += record[start:].rstrip(b'\r\n')
+			fields.append(value.decode('utf-8'))
+			break
+		value += record[start:end]
+		fields.append(value.decode('utf-8'))
+		start = end + 1
+	return fields
+
+class Projection:
+	'''Turn records of a table into dicts of the requested columns.'''
+
+	def __init__(self, header, columns=None, delimiter=','):
+		if columns is None:
+			columns = header
+		missing = [c for c in columns if c not in header]
+		if missing:
+			raise KeyError('missing columns: %s' % ', '.join(missing))
+		self.columns = list(columns)
+		self.positions = [header.index(c) for c in self.columns]
+		self.count = max(self.positions) + 1 if self.positions else 0
+		self.delimiter = delimiter.encode('utf-8')
+
+	def row(self, record):
+		'''Get the dict of requested columns for a record.'''
+		fields = split_record(record, self.count, self.delimiter)
+		if len(fields) < self.count:
+			fields.extend([''] * (self.count - len(fields)))
+		return dict((c, fields[p]) for c, p in zip(self.columns, self.positions))
+
+def read_rows(path, columns=None, delimiter=','):
+	'''Yield a dict of the requested columns (default: all) for each row of a
+	table.'''
+	projection = Projection(read_header(path, delimiter), columns, delimiter)
+	with open(path, 'rb') as f:
+		f.readline()
+		for offset, record in read_records(f):
+			if record.strip():
+				yield projection.row(record)
+
+def index_path(path):
+	return path + '.species'
+
+def species_index(path, column, delimiter=','):
+	'''Get a map of species (the value of column) -> list of (offset, length)
+	byte ranges of its rows. The index is read from <path>.species if it was
+	built for the same column and the same version of the table.'''
+	stat = os.stat(path)
+	stamp = '%d %d %s' % (stat.st_size, stat.st_mtime_ns, column)
+	index = {}
+	if os.path.exists(index_path(path)):
+		with open(index_path(path), 'r') as f:
+			if f.readline().rstrip('\n') == stamp:
+				for line in f:
+					species, offset, length = line.rstrip('\n').split('\t')
+					index.setdefault(species, []).append(
+						(int(offset), int(length)))
+				return index
+
+	projection = Projection(read_header(path, delimiter), [column], delimiter)
+	with open(path, 'rb') as f:
+		f.readline()
+		last = None
+		for offset, record in read_records(f):
+			if not record.strip():
+				continue
+			species = projection.row(record)[column]
+			ranges = index.setdefault(species, [])
+			if last == species and ranges[-1][0] + ranges[-1][1] == offset:
+				# extend the current run of rows for this species
+				ranges[-1] = (ranges[-1][0], ranges[-1][1] + len(record))
+			else:
+				ranges.append((offset, len(record)))
+			last = species
+
+	tmp = '%s.%d.tmp' % (index_path(path), os.getpid())
+	with open(tmp, 'w') as f:
+		f.write(stamp + '\n')
+		for species, ranges in index.items():
+			for offset, length in ranges:
+				f.write('%s\t%d\t%d\n' % (species, offset, length))
+	os.replace(tmp, index_path(path))
+	return index
+
+def read_species(path, species, column, columns=None, delimiter=','):
+	'''Yield a dict of the requested columns (default: all) for each row of
+	the given species, using the species index. Rows are in table order.'''
+	index = species_index(path, column, delimiter)
+	ranges = sorted(r for s in species for r in index.get(s, []))
+	projection = Projection(read_header(path, delimiter), columns, delimiter)
+	with open(path, 'rb') as f:
+		for offset, length in ranges:
+			f.seek(offset)
+			chunk = io.BytesIO(f.read(length))
+			for _, record in read_records(chunk):
+				if record.strip():
+					yield projection.row(record)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import sys
+
+import ntriples, taxonomy, tracing
+
+# upper-level 'organism', 'root', 'other sequences', and 'unidentified'
+pruned = [
+	'http://purl.obolibrary.org/obo/NCBITaxon_1',
+	'http://purl.obolibrary.org/obo/OBI_0100026',
+	'http://purl.obolibrary.org/obo/NCBITaxon_28384',
+	'http://purl.obolibrary.org/obo/NCBITaxon_32644',
+]
+
+rdf_type = ntriples.iri('http://www.w3.org/1999/02/22-rdf-syntax-ns#type')
+owl_class = ntriples.iri('http://www.w3.org/2002/07/owl#Class')
+subclass_of = ntriples.iri('http://www.w3.org/2000/01/rdf-schema#subClassOf')
+label_of = ntriples.iri('http://www.w3.org/2000/01/rdf-schema#label')
+ncbi_link = ntriples.iri('http://purl.obolibrary.org/obo/NCBITaxon_browser_link')
+iedb_link = ntriples.iri('http://iedb.org/browser-link')
+label_source = ntriples.iri(
+	'http://www.geneontology.org/formats/oboInOwl#hasLabelSource')
+
+def main(args):
+	'''Expects: taxonomy index (see taxonomy.py), missing classes file,
+	output file. Write the missing classes and all of their ancestors as
+	taxon proteins: the upper-level classes are removed, 'protein' is
+	appended to the labels and the label sources are dropped (the same as
+	util/queries/rename.ru).'''
+	index_file = args[1]
+	missing_file = args[2]
+	out_file = args[3]
+
+	index = taxonomy.Taxonomy(index_file)
+	try:
+		skip = set(n for n in (index.find(iri) for iri in pruned)
+			if n is not None)
+		selected = set()
+		with open(missing_file, 'r') as f:
+			for line in f:
+				iri = line.strip()
+				if not iri:
+					continue
+				n = index.find(iri)
+				if n is None:
+					print('Not in the taxonomy: %s' % iri)
+					continue
+				selected.update(index.ancestors(n))
+		selected -= skip
+		count = ntriples.write_sorted(
+			(t for n in selected for t in class_triples(index, n, skip)),
+			out_file)
+	finally:
+		index.close()
+	print('wrote %d taxon protein triples to %s' % (count, out_file))
+
+def class_triples(index, n, skip):
+	'''Get the N-Triples lines of a taxon protein class.'''
+	subject = ntriples.iri(index.iri(n))
+	triples = [ntriples.triple(subject, rdf_type, owl_class)]
+	parent = index.parent(n)
+	if parent is not None and parent not in skip:
+		triples.append(ntriples.triple(
+			subject, subclass_of, ntriples.iri(index.iri(parent))))
+	has_label = index.label(n) is not None
+	for line in index.annotations(n):
+		s, p, o = line[:-3].split(' ', 2)
+		if p == label_source:
+			continue
+		if has_label and p == label_of:
+			# the lexical form of the label, plus ' protein'
+			o = '"%s protein"' % o[1:o.rindex('"')]
+		elif has_label and p == ncbi_link:
+			p = iedb_link
+		triples.append(ntriples.triple(s, p, o))
+	return triples
+
+if __name__ == '__main__':
+	with tracing.script(sys.argv):
+		main(sys.argv)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+'''A compiled, memory-mapped index of a taxonomy (the subspecies tree), so
+that ancestors, labels and annotations of a few classes can be read without
+loading the whole tree.
+
+The index file has a header (magic, number of classes), then one fixed-size
+record per class, sorted by IRI, then a heap of strings. A record holds the
+heap offsets of the class IRI, its label, its rank and its annotations (as
+N-Triples lines), and the record number of its parent (-1 for none). Each
+string in the heap is a 4-byte length followed by UTF-8 bytes.
+
+Usage: taxonomy.py build <owl_file> <index_file>'''
+
+import io, mmap, os, struct, sys
+import xml.etree.ElementTree as ET
+
+import ntriples, tracing
+
+magic = b'TAXIDX1\0'
+header = struct.Struct('<8sQ')
+record = struct.Struct('<qqqqq')
+length = struct.Struct('<I')
+
+# namespaces
+rdf = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+rdfs = 'http://www.w3.org/2000/01/rdf-schema#'
+owl = 'http://www.w3.org/2002/07/owl#'
+xml = 'http://www.w3.org/XML/1998/namespace'
+has_rank = 'http://purl.obolibrary.org/obo/ncbitaxon#has_rank'
+
+# class elements that are not annotations
+logical = set([
+	'{%s}subClassOf' % rdfs,
+	'{%s}equivalentClass' % owl,
+	'{%s}disjointWith' % owl,
+	'{%s}disjointUnionOf' % owl])
+
+def main(args):
+	if len(args) != 4 or args[1] != 'build':
+		print(__doc__.split('\n\n')[-1])
+		sys.exit(1)
+	count = build_index(args[2], args[3])
+	print('indexed %d classes from %s' % (count, args[2]))
+
+def tag_iri(tag):
+	'''Get the IRI of an element tag ({namespace}name).'''
+	return tag[1:].replace('}', '', 1)
+
+def annotation_line(iri, elem):
+	'''Get the N-Triples line of an annotation element of a class.'''
+	predicate = ntriples.iri(tag_iri(elem.tag))
+	resource = elem.get('{%s}resource' % rdf)
+	if resource is not None:
+		obj = ntriples.iri(resource)
+	else:
+		obj = ntriples.literal(
+			elem.text or '', elem.get('{%s}datatype' % rdf))
+		lang = elem.get('{%s}lang' % xml)
+		if lang and not elem.get('{%s}datatype' % rdf):
+			obj = '%s@%s' % (obj, lang)
+	return ntriples.triple(ntriples.iri(iri), predicate, obj)
+
+def read_classes(owl_file):
+	'''Yield (IRI, parent IRI, label, rank, annotation lines) for each named
+	class of an RDF/XML file, one class element at a time.'''
+	depth = 0
+	for event, elem in ET.iterparse(owl_file, events=('start', 'end')):
+		if event == 'start':
+			depth += 1
+			continue
+		depth -= 1
+		if depth != 1:
+			continue
+		iri = elem.get('{%s}about' % rdf)
+		if elem.tag == '{%s}Class' % owl and iri:
+			parent = None
+			label = None
+			rank = None
+			lines = []
+			for child in elem:
+				if child.tag == '{%s}subClassOf' % rdfs:
+					resource = child.get('{%s}resource' % rdf)
+					if parent is None and resource:
+						parent = resource
+				elif child.tag not in logical:
+					if child.tag == '{%s}label' % rdfs and label is None:
+						label = child.text or ''
+					elif tag_iri(child.tag) == has_rank:
+						rank = child.get('{%s}resource' % rdf) or child.text
+					lines.append(annotation_line(iri, child))
+			yield iri, parent, label, rank, ''.join(lines)
+		elem.clear()
+
+def build_index(owl_file, index_file):
+	'''Compile an index of the classes of an RDF/XML taxonomy. Return the
+	number of classes.'''
+	classes = {}
+	for iri, parent, label, rank, lines in read_classes(owl_file):
+		classes[iri] = (parent, label, rank, lines)
+	iris = sorted(classes, key=lambda i: i.encode('utf-8'))
+	numbers = dict((iri, n) for n, iri in enumerate(iris))
+
+	heap = io.BytesIO()
+	def add(value):
+		if value is None:
+			return -1
+		offset = heap.tell()
+		data = value.encode('utf-8')
+		heap.write(length.pack(len(data)))
+		heap.write(data)
+		return offset
+
+	records = []
+	for iri in iris:
+		parent, label, rank, lines = classes[iri]
+		records.append(record.pack(
+			add(iri), numbers.get(parent, -1), add(label), add(rank),
+			add(lines)))
+
+	tmp_file = index_file + '.tmp'
+	with open(tmp_file, 'wb') as f:
+		f.write(header.pack(magic, len(iris)))
+		for r in records:
+			f.write(r)
+		f.write(heap.getvalue())
+	os.replace(tmp_file, index_file)
+	return len(iris)
+
+class Taxonomy:
+	'''A memory-mapped taxonomy index. Classes are referred to by record
+	number.'''
+
+	def __init__(self, index_file):
+		with open(index_file, 'rb') as f:
+			self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		found, self.count = header.unpack_from(self.mm, 0)
+		if found != magic:
+			raise ValueError('%s is not a taxonomy index' % index_file)
+		self.heap = header.size + record.size * self.count
+
+	def close(self):
+		self.mm.close()
+
+	def record(self, n):
+		'''Get the (IRI, parent, label, rank, annotations) offsets of a
+		record.'''
+		return record.unpack_from(self.mm, header.size + record.size * n)
+
+	def string(self, offset):
+		'''Get a string from the heap, or None for offset -1.'''
+		if offset < 0:
+			return None
+		start = self.heap + offset
+		size, = length.unpack_from(self.mm, start)
+		start += length.size
+		return self.mm[start:start + size].decode('utf-8')
+
+	def raw_iri(self, n):
+		'''Get the IRI of a record as bytes (for searching).'''
+		start = self.heap + self.record(n)[0]
+		size, = length.unpack_from(self.mm, start)
+		start += length.size
+		return self.mm[start:start + size]
+
+	def find(self, iri):
+		'''Get the record number of a class IRI, or None if it is not in the
+		index.'''
+		key = iri.encode('utf-8')
+		low, high = 0, self.count
+		while low < high:
+			mid = (low + high) // 2
+			if self.raw_iri(mid) < key:
+				low = mid + 1
+			else:
+				high = mid
+		if low < self.count and self.raw_iri(low) == key:
+			return low
+		return None
+
+	def iri(self, n):
+		return self.string(self.record(n)[0])
+
+	def parent(self, n):
+		'''Get the record number of the parent, or None.'''
+		parent = self.record(n)[1]
+		return None if parent < 0 else parent
+
+	def label(self, n):
+		return self.string(self.record(n)[2])
+
+	def rank(self, n):
+		return self.string(self.record(n)[3])
+
+	def annotations(self, n):
+		'''Get the annotation N-Triples lines of a class.'''
+		return self.string(self.record(n)[4]).splitlines(True)
+
+	def ancestors(self, n):
+		'''Yield the record numbers of the class and all of its ancestors.'''
+		seen = set()
+		while n is not None and n not in seen:
+			seen.add(n)
+			yield n
+			n = self.parent(n)
+
+if __name__ == '__main__':
+	with tracing.script(sys.argv):
+		main(sys.argv)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+'''Structured timing and memory traces. A span is one JSON line with the
+name of a phase, its wall and CPU seconds, the peak RSS of the process, the
+bytes read and written, and any attributes (such as the species key):
+
+	{"name": "extract", "species": "9606-human", "wall": 1.52, ...}
+
+Spans are only written when the TRACE_FILE environment variable is set (the
+Makefile sets it to build/trace.jsonl). Worker processes append to the same
+file, one line per write. Set TRACE_PROFILE to 'cprofile' and/or
+'tracemalloc' (comma-separated) to also profile each script: the cProfile
+stats are written next to the trace file as <script>-<pid>.prof, and the
+tracemalloc peak and top allocation sites are added to the script's span.
+
+Usage: tracing.py report [--top N] [<trace_file>]
+Print the slowest species and scripts, and the total time of each phase.'''
+
+import argparse, contextlib, json, os, resource, sys, time
+
+trace_file = os.environ.get('TRACE_FILE')
+profile = set(p for p in os.environ.get('TRACE_PROFILE', '').split(',') if p)
+
+# number of allocation sites kept with tracemalloc
+top_allocations = 10
+
+def main(args):
+	parser = argparse.ArgumentParser(description='Summarize a trace')
+	parser.add_argument('command', choices=['report'])
+	parser.add_argument('trace_file', nargs='?',
+		default=trace_file or 'build/trace.jsonl')
+	parser.add_argument('--top', type=int, default=10,
+		help='number of species and scripts to show (default: %(default)s)')
+	opts = parser.parse_intermixed_args(args[1:])
+	report(read_spans(opts.trace_file), opts.top)
+
+class Span:
+	'''The values of a running span. Add to bytes_in and bytes_out (or use
+	read() and wrote() with file paths) while it runs.'''
+
+	def __init__(self, name, attrs):
+		self.name = name
+		self.attrs = attrs
+		self.bytes_in = 0
+		self.bytes_out = 0
+
+	def read(self, *paths):
+		'''Count the size of files as bytes in.'''
+		self.bytes_in += file_sizes(paths)
+
+	def wrote(self, *paths):
+		'''Count the size of files as bytes out.'''
+		self.bytes_out += file_sizes(paths)
+
+def file_sizes(paths):
+	'''Get the total size of the files that exist.'''
+	total = 0
+	for path in paths:
+		if path and os.path.isfile(path):
+			total += os.path.getsize(path)
+	return total
+
+def enabled():
+	return trace_file is not None
+
+def max_rss_mb():
+	'''Get the peak RSS of this process in MB.'''
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+@contextlib.contextmanager
+def span(name, **attrs):
+	'''Time the body of a with block as a span.'''
+	s = Span(name, attrs)
+	if not enabled():
+		yield s
+		return
+	start = time.time()
+	wall = time.perf_counter()
+	cpu = time.process_time()
+	error = None
+	try:
+		yield s
+	except BaseException as e:
+		error = '%s: %s' % (type(e).__name__, e)
+		raise
+	finally:
+		record = {
+			'name': name,
+			'pid': os.getpid(),
+			'start': round(start, 3),
+			'wall': round(time.perf_counter() - wall, 4),
+			'cpu': round(time.process_time() - cpu, 4),
+			'max_rss_mb': round(max_rss_mb(), 1),
+			'bytes_in': s.bytes_in,
+			'bytes_out': s.bytes_out,
+		}
+		record.update(s.attrs)
+		if error:
+			record['error'] = error
+		write_span(record)
+
+def write_span(record):
+	'''Append a span to the trace file in one write, so that lines from
+	several processes are not mixed.'''
+	line = (json.dumps(record, sort_keys=True) + '\n').encode('utf-8')
+	os.makedirs(os.path.dirname(os.path.abspath(trace_file)), exist_ok=True)
+	fd = os.open(trace_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+	try:
+		os.write(fd, line)
+	finally:
+		os.close(fd)
+
+@contextlib.contextmanager
+def script(args):
+	'''Trace a whole script run as a span named after the script. Arguments
+	that are files count as bytes in if they exist at the start, and as bytes
+	out if they were written during the run. Profile the run if TRACE_PROFILE
+	is set.'''
+	name = os.path.basename(args[0])
+	if not enabled():
+		yield
+		return
+	started = time.time()
+	inputs = [a for a in args[1:] if os.path.isfile(a)]
+	profiler = None
+	if 'cprofile' in profile:
+		import cProfile
+		profiler = cProfile.Profile()
+	if 'tracemalloc' in profile:
+		import tracemalloc
+		tracemalloc.start()
+	with span(name, script=True, args=args[1:]) as s:
+		s.read(*inputs)
+		try:
+			if profiler is not None:
+				profiler.enable()
+			yield
+		finally:
+			if profiler is not None:
+				profiler.disable()
+			if 'tracemalloc' in profile:
+				add_allocations(s)
+			if profiler is not None:
+				profiler.dump_stats('%s/%s-%d.prof' % (
+					os.path.dirname(os.path.abspath(trace_file)), name,
+					os.getpid()))
+			s.wrote(*[a for a in args[1:] if os.path.isfile(a)
+				and os.path.getmtime(a) >= started])
+
+def add_allocations(s):
+	'''Add the tracemalloc peak and top allocation sites to a span.'''
+	import tracemalloc
+	_, peak = tracemalloc.get_traced_memory()
+	stats = tracemalloc.take_snapshot().statistics('lineno')
+	tracemalloc.stop()
+	s.attrs['traced_peak_mb'] = round(peak / 1024 / 1024, 1)
+	s.attrs['top_allocations'] = [
+		'%s: %.1f MB' % (stat.traceback, stat.size / 1024 / 1024)
+		for stat in stats[:top_allocations]]
+
+def read_spans(path):
+	'''Read the spans of a trace file.'''
+	spans = []
+	with open(path, 'r') as f:
+		for line in f:
+			line = line.strip()
+			if line:
+				try:
+					spans.append(json.loads(line))
+				except ValueError:
+					# a line cut short by a crash
+					continue
+	return spans
+
+def report(spans, top):
+	'''Print the slowest scripts and species, and the totals per phase.'''
+	scripts = [s for s in spans if s.get('script')]
+	scripts.sort(key=lambda s: s['wall'], reverse=True)
+	print('Slowest scripts')
+	print('%10s %10s %10s %12s %12s  %s'
+		% ('wall', 'cpu', 'rss MB', 'MB in', 'MB out', 'script'))
+	for s in scripts[:top]:
+		print('%10.2f %10.2f %10.1f %12.1f %12.1f  %s'
+			% (s['wall'], s['cpu'], s['max_rss_mb'], s['bytes_in'] / 1e6,
+			s['bytes_out'] / 1e6, s['name']))
+
+	# species key -> phase -> wall seconds
+	species = {}
+	for s in spans:
+		key = s.get('species')
+		if key is not None:
+			phases = species.setdefault(key, {})
+			phases[s['name']] = phases.get(s['name'], 0) + s['wall']
+	slowest = sorted(species.items(), key=lambda i: sum(i[1].values()),
+		reverse=True)
+	print('\nSlowest species')
+	print('%10s  %-40s %s' % ('wall', 'species', 'phases'))
+	for key, phases in slowest[:top]:
+		print('%10.2f  %-40s %s' % (sum(phases.values()), key, ', '.join(
+			'%s %.2f' % (p, w) for p, w in sorted(
+				phases.items(), key=lambda i: i[1], reverse=True))))
+
+	# phase -> [count, wall, cpu, bytes in, bytes out]
+	totals = {}
+	for s in spans:
+		if s.get('script'):
+			continue
+		t = totals.setdefault(s['name'], [0, 0, 0, 0, 0])
+		t[0] += 1
+		t[1] += s['wall']
+		t[2] += s['cpu']
+		t[3] += s['bytes_in']
+		t[4] += s['bytes_out']
+	print('\nPhases')
+	print('%8s %10s %10s %12s %12s  %s'
+		% ('count', 'wall', 'cpu', 'MB in', 'MB out', 'phase'))
+	for name, t in sorted(totals.items(), key=lambda i: i[1][1],
+		reverse=True):
+		print('%8d %10.2f %10.2f %12.1f %12.1f  %s'
+			% (t[0], t[1], t[2], t[3] / 1e6, t[4] / 1e6, name))
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -1,116 +1,399 @@
 #!/usr/bin/env python3
 
-import atexit, csv, gzip, os, shutil, sys, subprocess, urllib.request
+import argparse, atexit, csv, gzip, multiprocessing, os, shutil, sys, time
+from concurrent.futures import CancelledError, as_completed
 
-def main(args):
-	'''Usage: update-branches.py <active_proteins> <proteomes>'''
-	global active_proteins, proteome_id_map, progress, complete, \
-	remaining, query_template, proteomes, synonym_map
+import branch_cache, branch_extractor, catalog, downloads, iri_rewrite, \
+	robot_worker, tables, tracing
 
-	active_proteins_file = args[1]
-	proteomes_file = args[2]
+def main(args):
+	'''Usage: update-branches.py [--jobs N] <active_proteins> <proteomes>'''
+	global active_proteins, proteome_id_map, query_template, proteomes, \
+	use_robot, robot_options, protein_changes, cache_index, errors_file
+
+	parser = argparse.ArgumentParser(
+		description='Update the branches of species with active proteins')
+	parser.add_argument('active_proteins_file')
+	parser.add_argument('proteomes_file')
+	parser.add_argument('-j', '--jobs', type=int, default=1,
+		help='number of species to process at once (default: 1)')
+	parser.add_argument('--downloads', type=int, default=4,
+		help='number of proteomes to download at once (default: 4)')
+	parser.add_argument('--uniprot-url', default=downloads.uniprot_base,
+		help='base URL for proteome downloads (default: %(default)s)')
+	parser.add_argument('--delta',
+		help='table of added/removed/changed proteins, used to patch branches')
+	parser.add_argument('--robot', action='store_true',
+		help='build branches with a ROBOT query instead of the native extractor')
+	parser.add_argument('--robot-worker', action='store_true',
+		help='run ROBOT commands in one long-lived JVM per process')
+	parser.add_argument('--robot-timeout', type=int, default=3600,
+		help='seconds before a ROBOT job is stopped (default: 3600)')
+	parser.add_argument('--group',
+		help='only update the species of this group (e.g., virus)')
+	opts = parser.parse_args(args[1:])
+	if opts.group:
+		errors_file = 'update-branches-errors-%s.txt' % opts.group
+	use_robot = opts.robot
+	robot_options = (opts.robot_worker, opts.robot_timeout)
 
 	proteome_id_map = {}
-	active_proteins = get_active_proteins(active_proteins_file)
+	active_proteins = get_active_proteins(opts.active_proteins_file)
 	if active_proteins is None:
 		print('Could not parse active proteins')
 		return
-	proteomes = get_proteomes(active_proteins, proteomes_file)
+	proteomes = get_proteomes(active_proteins, opts.proteomes_file, opts.group)
 	if proteomes is None:
 		print('Could not parse proteomes')
 		return
-	query_template = get_query_template('util/queries/build-branch.rq')
-
-	total = len(proteomes.keys())
+	query_template = get_query_template(branch_cache.branch_template)
+	protein_changes = {}
+	if opts.delta:
+		protein_changes = get_protein_changes(opts.delta)
+	db = catalog.Catalog()
+	cache_index = db.branch_index()
+
+	# resume: skip the species that were done from the same inputs
+	method = 'robot' if use_robot else 'native'
+	species_keys = []
+	pending = []
+	for species_key, proteome in proteomes.items():
+		digest = inputs_digest(species_key, method)
+		if db.is_done(species_key, digest):
+			continue
+		species_keys.append(species_key)
+		pending.append((species_key, proteome['Species ID'], 
+			proteome['Proteome ID'], proteome['Group'], digest))
+	db.start(pending)
+	if len(species_keys) < len(proteomes):
+		print('%d of %d species already done'
+			% (len(proteomes) - len(species_keys), len(proteomes)))
+	template_digest = branch_cache.template_digest()
+
+	total = len(species_keys)
 	complete = 0
-	progress = 0
-	remaining = total
-
-	print('| % DONE | # TO DO | CURRENT SPECIES ')
-	print('|--------|---------|-----------------')
-
-	for k in proteomes.keys():
-		print_progress(k)
-		process_species(k)
-		complete += 1
-		remaining -= 1
-		progress = (complete / total) * 100
-
-def process_species(species_key):
-	'''Process a species from proteomes.tsv. First, fetch the proteome files 
-	from UniProt. Then, generate a TTL file representing the species branch. 
-	Finally, filter the branch proteins to only include active proteins in the 
-	IEDB.'''
-	global active_proteins, proteomes
+	updated = 0
+	start = time.time()
+
+	print('| % DONE | # TO DO |      ETA | LAST FINISHED ')
+	print('|--------|---------|----------|---------------')
+
+	if opts.jobs > 1:
+		pool = multiprocessing.Pool(
+			opts.jobs,
+			initializer=init_worker,
+			initargs=(active_proteins, proteomes, query_template, use_robot, 
+				robot_options, protein_changes, cache_index))
+	else:
+		pool = None
+
+	# proteomes are downloaded ahead of the workers, and each species is
+	# handed to a worker as soon as its download finishes
+	downloader = downloads.Downloader(
+		base_url=opts.uniprot_url, connections=opts.downloads,
+		catalog_file=catalog.catalog_file)
+	species = prefetch_proteomes(downloader, species_keys)
+	if pool is not None:
+		results = pool.imap_unordered(process_species, species)
+	else:
+		results = map(process_species, species)
+
+	completed = False
+	try:
+		# species may finish in any order, so progress is based on counts only
+		for species_key, species_errors, key, digest, started, finished \
+		in results:
+			errors.extend(species_errors)
+			if key is not None:
+				db.done(species_key, key, template_digest, digest, 
+					'%s/branch.ttl' % get_build_dir(species_key), started, 
+					finished, species_errors)
+				updated += 1
+			else:
+				db.failed(species_key, started, finished, species_errors)
+			complete += 1
+			print_progress(complete, total, start, species_key)
+		completed = True
+	finally:
+		if completed:
+			if pool is not None:
+				pool.close()
+				pool.join()
+			downloader.close()
+		else:
+			# stop the species that are queued, so that a resumed run starts
+			# with them; the downloads are stopped first, since the pool
+			# waits for the next species from them
+			downloader.abort()
+			if pool is not None:
+				pool.terminate()
+				pool.join()
+		db.close()
+		if robot is not None:
+			robot.stop()
+		# tell make that the branches need to be merged again
+		if updated:
+			touch(branches_stamp)
+	print()
+
+def prefetch_proteomes(downloader, species_keys):
+	'''Queue the proteome download for every species and yield the species 
+	keys, with the error of the download (or None), in the order that their 
+	downloads finish.'''
+	global proteomes
+
+	futures = {}
+	for species_key in species_keys:
+		proteome = proteomes[species_key]
+		build_dir = get_build_dir(species_key)
+		rdf_out_file = '%s/proteome.rdf.gz' % (build_dir)
+		future = downloader.submit(proteome['Proteome ID'], rdf_out_file)
+		futures[future] = species_key
+	for future in as_completed(futures):
+		species_key = futures[future]
+		error = None
+		try:
+			future.result()
+		except CancelledError:
+			# the run was stopped
+			return
+		except downloads.DownloadError as e:
+			# the worker reports the missing proteome, with the cause
+			error = str(e)
+		yield species_key, error
+
+def inputs_digest(species_key, method):
+	'''Get a digest of the inputs of a species branch that are known before 
+	its proteome is downloaded: the proteome ID, the active proteins, the 
+	rendered query and the build method.'''
+	proteome = proteomes[species_key]
+	species_id = species_key.split('-')[0]
+	query = render_query(proteome['Species ID'], proteome['Species Label'])
+	return branch_cache.text_digest('\0'.join([
+		proteome['Proteome ID'], 
+		'\n'.join(sorted(set(active_proteins[species_id]))), 
+		query, 
+		method]))
+
+def get_build_dir(species_key):
+	'''Get (and create) the build directory for a species branch, in its group 
+	directory.'''
+	group = proteomes[species_key]['Group']
+	build_dir = 'build/%s/%s' % (group, species_key)
+	os.makedirs(build_dir, exist_ok=True)
+	return build_dir
+
+def init_worker(proteins, species_proteomes, template, robot, robot_opts, 
+	changes, index):
+	'''Set the shared (read-only) state in a worker process.'''
+	global active_proteins, proteomes, query_template, use_robot, \
+	robot_options, protein_changes, cache_index
+	active_proteins = proteins
+	proteomes = species_proteomes
+	query_template = template
+	use_robot = robot
+	robot_options = robot_opts
+	protein_changes = changes
+	cache_index = index
+
+def get_robot():
+	'''Get the ROBOT worker for this process (started on first use), or None 
+	if ROBOT commands should run as separate processes.'''
+	global robot
+	use_worker, timeout = robot_options
+	if not use_worker:
+		return None
+	if robot is None:
+		robot = robot_worker.RobotWorker(timeout=timeout)
+	return robot
+
+def process_species(download):
+	'''Build the branch of a species (see build_species), given its key and 
+	the error of its proteome download (or None). Return the species key, a 
+	list of any errors for this species, the cache key and proteome digest of 
+	the branch (None if there is no branch), and the start and end times.'''
+	species_key, download_error = download
+	species_errors = []
+	started = time.time()
+	key, digest = build_species(species_key, species_errors, download_error)
+	return species_key, species_errors, key, digest, started, time.time()
+
+def build_species(species_key, species_errors, download_error=None):
+	'''Process a species from proteomes.tsv. First, check the proteome fetched 
+	from UniProt. Then, get the TTL file representing the species branch from 
+	the cache, or patch the last branch with the protein changes, or generate 
+	it, and add it to the cache. The branch only includes the proteins that 
+	are active in the IEDB. Any problems are added to species_errors. Return 
+	the cache key and proteome digest of the branch (None if there is no 
+	branch).'''
+	global active_proteins, proteomes, use_robot
 
 	# skip if the species key does not have a proteome ID
 	if not species_key in proteomes:
-		errors.append("MISSING: %s" % species_key)
-		return
-	# put this species branch in its group directory
-	group = proteomes[species_key]['Group']
-	group_dir = 'build/%s' % (group)
-	if not os.path.exists(group_dir):
-		os.mkdir(group_dir)
-	build_dir = '%s/%s' % (group_dir, species_key)
-	if not os.path.exists(build_dir):
-		os.mkdir(build_dir)
-	# download the proteome
+		species_errors.append("MISSING: %s" % species_key)
+		return None, None
+	build_dir = get_build_dir(species_key)
+	# check the downloaded proteome
 	result = fetch_proteome(species_key, build_dir)
 	if not result:
 		# skip if the proteome could not be downloaded
-		errors.append("Could not download proteome for %s" % species_key)
-		return
+		message = "Could not download proteome for %s" % species_key
+		if download_error:
+			message += '\n\tCAUSE: %s' % download_error
+		species_errors.append(message)
+		return None, None
 
 	# get the active proteins for this species
 	species_id = species_key.split('-')[0]
 	species_proteins = active_proteins[species_id]
 
-	# build the branch
-	result = generate_branch(species_key, build_dir)
+	# reuse the branch if it was already built from the same inputs
+	out_file = '%s/branch.ttl' % build_dir
+	gz_proteome_file = '%s/proteome.rdf.gz' % build_dir
+	proteome = proteomes[species_key]
+	query = render_query(proteome['Species ID'], proteome['Species Label'])
+	key = branch_cache.branch_key(gz_proteome_file, species_proteins, query, 
+		'robot' if use_robot else 'native')
+	with tracing.span('cache', species=species_key) as s:
+		s.read(gz_proteome_file)
+		digest = branch_cache.file_digest(gz_proteome_file)
+		hit = branch_cache.get(key, out_file)
+		if hit:
+			s.wrote(out_file)
+	if hit:
+		return key, digest
+
+	# patch the last branch if only a few proteins changed
+	with tracing.span('patch', species=species_key) as s:
+		try:
+			result = patch_branch(species_key, build_dir, species_proteins)
+		except Exception as e:
+			species_errors.append(
+				'Unable to patch branch for %s\n\tCAUSE: %s' % (species_key, e))
+			result = False
+		if result:
+			s.wrote(out_file)
+	if result:
+		branch_cache.put(key, out_file)
+		return key, digest
+
+	# build the branch with only the active proteins
+	if os.path.exists(out_file):
+		os.remove(out_file)
+	result = generate_branch(
+		species_key, build_dir, species_proteins, species_errors)
 	if not result:
-		return
-	# trim non-active proteins from the branch
-	trim_branch(species_key, build_dir, species_proteins)
+		return None, None
+	if use_robot:
+		# trim non-active proteins from the ROBOT branch
+		if not trim_branch(
+			species_key, build_dir, species_proteins, species_errors):
+			return None, None
+	branch_cache.put(key, out_file)
+	return key, digest
+
+def patch_branch(species_key, build_dir, proteins):
+	'''Build the branch.ttl file by removing and adding the changed proteins 
+	of the species in its last branch. This is only done if the last branch 
+	was built by the native extractor from the same proteome and query, and 
+	its proteins match the protein changes. Return True if the branch was 
+	patched.'''
+	global protein_changes, cache_index, use_robot
+
+	species_id = species_key.split('-')[0]
+	if use_robot or species_id not in protein_changes:
+		return False
+	entry = cache_index.get(species_key)
+	if entry is None:
+		return False
+	_, last_key, template_digest, proteome_digest = entry
+	gz_proteome_file = '%s/proteome.rdf.gz' % build_dir
+	if template_digest != branch_cache.template_digest() \
+	or proteome_digest != branch_cache.file_digest(gz_proteome_file):
+		return False
+	last_branch = branch_cache.entry_path(last_key)
+	if not os.path.exists(last_branch) \
+	or not branch_extractor.is_native_branch(last_branch):
+		return False
+
+	added, removed = protein_changes[species_id]
+	accessions = set(p.split(':', 1)[1] for p in proteins 
+		if p.startswith('UniProt:'))
+	last_accessions = (accessions - added) | removed
+	if not branch_extractor.branch_accessions(last_branch) <= last_accessions:
+		# the last branch was not built from the last proteins
+		return False
 
-def fetch_proteome(species_key, build_dir):
-	'''Fetch the proteome files as RDF and FASTA from UniProt for a species.'''
 	proteome = proteomes[species_key]
-	uniprot_id = proteome['Proteome ID']
+	branch_extractor.patch_branch(
+		last_branch, gz_proteome_file, proteome['Species ID'], 
+		proteome['Species Label'], '%s/branch.ttl' % build_dir, 
+		sorted(added), removed)
+	return True
+
+def fetch_proteome(species_key, build_dir):
+	'''Check that the proteome RDF for a species has been fetched from 
+	UniProt. The downloader only puts the file in place once it is complete.'''
 	rdf_out_file = '%s/proteome.rdf.gz' % (build_dir)
-	if os.path.exists(rdf_out_file):
-		return True
-	if not os.path.exists(rdf_out_file):
-		rdf_url = uniprot % (uniprot_id, 'rdf')
-		urllib.request.urlretrieve(rdf_url, rdf_out_file)
 	if not os.path.exists(rdf_out_file):
 		return None
 	return True
 
-def generate_branch(species_key, build_dir):
-	'''Unzip the RDF proteome and build a CONSTRUCT query from a template. 
-	Query the RDF using ROBOT to build a branch.ttl file. Each protein of the 
+def generate_branch(species_key, build_dir, proteins, errors):
+	'''Build a branch.ttl file from the RDF proteome. Each protein of the 
 	species is a node under a 'species protein' root. Proteins with 'features' 
-	will have those features as children.'''
-	global query_template
+	will have those features as children. The native extractor only includes 
+	the active proteins (DATABASE:ACCESSION), while the ROBOT branch includes 
+	all proteins and must be trimmed. Any problems are added to errors.'''
+	global use_robot
 
 	out_file = '%s/branch.ttl' % build_dir
-	# skip if exists
-	if os.path.exists(out_file):
-		return True
-
 	gz_proteome_file = '%s/proteome.rdf.gz' % build_dir
 	if not os.path.exists(gz_proteome_file):
 		errors.append('%s proteome file does not exists' % species_key)
 		return False
+
+	if use_robot:
+		return robot_branch(species_key, build_dir, errors)
+
+	proteome = proteomes[species_key]
+	species_label = proteome['Species Label']
+	species_id = proteome['Species ID']
+
+	# only UniProt proteins can be in the proteome
+	accessions = [p.split(':', 1)[1] for p in proteins 
+		if p.startswith('UniProt:')]
+
+	# stream the branch straight from the gzipped RDF
+	with tracing.span('extract', species=species_key) as s:
+		s.read(gz_proteome_file)
+		try:
+			branch_extractor.extract_branch(gz_proteome_file, species_id, 
+				species_label, out_file, accessions)
+		except Exception as e:
+			errors.append('Unable to construct branch for %s\n\tCAUSE: %s' 
+				% (species_key, e))
+			return False
+		s.wrote(out_file)
+	return True
+
+def robot_branch(species_key, build_dir, errors):
+	'''Unzip the RDF proteome and build a CONSTRUCT query from a template. 
+	Query the RDF using ROBOT to build the branch-full.ttl file, with all 
+	the proteins of the proteome.'''
+	full_file = '%s/branch-full.ttl' % build_dir
+	gz_proteome_file = '%s/proteome.rdf.gz' % build_dir
 	proteome_file = '%s/proteome.rdf' % build_dir
 
 	# unzip the proteome and remove the import statement
 	try:
 		if not os.path.exists(proteome_file):
-			with gzip.open(gz_proteome_file, 'rb') as f_in:
-				with open(proteome_file, 'wb') as f_out:
-					shutil.copyfileobj(f_in, f_out)
+			with tracing.span('gunzip', species=species_key) as s:
+				s.read(gz_proteome_file)
+				with gzip.open(gz_proteome_file, 'rb') as f_in:
+					with open(proteome_file, 'wb') as f_out:
+						shutil.copyfileobj(f_in, f_out)
+				s.wrote(proteome_file)
 	except Exception as e:
 		errors.append(
 			'Unable to unzip proteome for %s\n\tCAUSE: %s' % (species_key, e))
@@ -128,85 +411,82 @@ def generate_branch(species_key, build_dir):
 	# build the query from template
 	query_file = '%s/build-branch.rq' % build_dir
 	with open(query_file, 'w') as f:
-		for line in query_template:
-			if '[TAXON_ID]' in line:
-				line = line.replace('[TAXON_ID]', species_id)
-			elif '[TAXON_LABEL]' in line:
-				if '"' in species_label:
-					species_label = species_label.replace('"', "\\\"")
-				line = line.replace('[TAXON_LABEL]', species_label)
-			f.write(line)
+		f.write(render_query(species_id, species_label))
 
 	# query with ROBOT
-	cmd = query_cmd.format(build_dir)
-	try:
-		code = subprocess.call(cmd, shell=True)
-		if code is not 0:
-			# retry and throw error if not 0
-			subprocess.check_call(cmd, shell=True)
-	except Exception as e:
-		errors.append(
-			'Unable to construct branch for %s\n\tCAUSE: %s' % (species_key, e))
-		os.remove(proteome_file)
-		return False
-
-	lines = []
-	with open(out_file, 'r') as f:
-		for line in f:
-			lines.append(line)
-
-	with open(out_file, 'w') as f:
-		for line in lines:
-			if 'purl.uniprot' in line:
-				line = line.replace('purl.uniprot', 'www.uniprot')
-			f.write(line)
+	raw_file = '%s/branch-raw.ttl' % build_dir
+	cmd = [a.format(build_dir) for a in query_cmd]
+	with tracing.span('query', species=species_key) as s:
+		s.read(proteome_file)
+		try:
+			robot_worker.run_robot(cmd, get_robot())
+		except Exception as e:
+			errors.append('Unable to construct branch for %s\n\tCAUSE: %s' 
+				% (species_key, e))
+			os.remove(proteome_file)
+			return False
+		s.wrote(raw_file)
 
 	# delete the unzipped proteome file and the query
 	os.remove(proteome_file)
 	os.remove(query_file)
 
-	if not os.path.exists(out_file):
+	if not os.path.exists(raw_file):
 		errors.append(
 			'Unable to construct branch for %s' % (species_key))
 		return False
+
+	# use www.uniprot.org IRIs, streaming the query output into the full 
+	# branch, which is then trimmed to branch.ttl
+	with tracing.span('rewrite', species=species_key) as s:
+		s.read(raw_file)
+		iri_rewrite.rewrite_file(raw_file, full_file, ['UNIPROT'])
+		s.wrote(full_file)
+	os.remove(raw_file)
 	return True
 
-def trim_branch(species_key, build_dir, proteins):
-	'''Filter the branch.ttl file to include only active proteins.'''
+def trim_branch(species_key, build_dir, proteins, errors):
+	'''Filter the branch-full.ttl file to include only active proteins. The 
+	trimmed branch replaces branch.ttl only once it is complete. Any problems 
+	are added to errors. Return True if the branch was trimmed.'''
 	active_proteins = '%s/active-proteins.txt' % build_dir
 	with open(active_proteins, 'w') as f:
 		for p in proteins:
 			f.write(p + '\n')
-	cmd = filter_cmd.format(build_dir)
-	try:
-		code = subprocess.call(cmd, shell=True)
-		if code is not 0:
-			# retry and throw error if not 0
-			subprocess.check_call(cmd, shell=True)
-	except Exception as e:
-		errors.append(
-			'Unable to trim branch for %s\n\tCAUSE: %s' % (species_key, e))
-		return
+	cmd = [a.format(build_dir) for a in filter_cmd]
+	with tracing.span('filter', species=species_key) as s:
+		s.read('%s/branch-full.ttl' % build_dir)
+		try:
+			robot_worker.run_robot(cmd, get_robot())
+		except Exception as e:
+			errors.append(
+				'Unable to trim branch for %s\n\tCAUSE: %s' % (species_key, e))
+			return False
+		s.wrote('%s/branch-trimmed.ttl' % build_dir)
+	os.replace('%s/branch-trimmed.ttl' % build_dir, 
+		'%s/branch.ttl' % build_dir)
+	os.remove('%s/branch-full.ttl' % build_dir)
 	#os.remove(active_proteins)
+	return True
 
-def print_progress(species_key):
-	'''Print the current status of the process.'''
-	global progress, remaining
-
-	if progress < 10:
-		print("| %s%%  |   %d   | %s"
-			% (" {0:.0f}  ".format(progress), 
-				remaining,  
-				species_key), end='\r')
-	else:
-		print("| %s%%  |   %d   | %s"
-			% (" {0:.0f} ".format(progress), 
-				remaining,  
-				species_key), end='\r')
-	sys.stdout.write("\033[K")
-
-def get_proteomes(active_proteins, proteomes_file):
-	''''''
+def print_progress(complete, total, start, species_key):
+	'''Print the aggregate status of the process. The estimated time remaining 
+	is based on the average time per finished species since the start.'''
+	progress = (complete / total) * 100
+	elapsed = time.time() - start
+	remaining = total - complete
+	# hours are not wrapped at a day, full rebuilds take several
+	minutes, seconds = divmod(int(elapsed / complete * remaining), 60)
+	hours, minutes = divmod(minutes, 60)
+	eta = '%d:%02d:%02d' % (hours, minutes, seconds)
+	sys.stdout.write('\033[K')
+	print('| %5.1f%% | %7d | %8s | %s'
+		% (progress, remaining, eta, species_key), end='\r')
+	sys.stdout.flush()
+
+def get_proteomes(active_proteins, proteomes_file, group=None):
+	'''Get a map of species key -> proteomes table row for the species with 
+	active proteins (only the species of the group, if one is given).'''
 	global proteome_id_map
 
 	if '.tsv' in proteomes_file:
@@ -223,60 +503,104 @@ def get_proteomes(active_proteins, proteomes_file):
 		for row in reader:
 			key = row.pop('Species Key', None)
 			species_id = row['Species ID']
+			if group and row['Group'] != group:
+				continue
 			if species_id in active_proteins.keys():
 				proteomes[key] = row
 				proteome_id_map[species_id] = key
 	return proteomes
 
+def render_query(species_id, species_label):
+	'''Fill in the taxon ID and label in the branch query template.'''
+	global query_template
+
+	lines = []
+	for line in query_template:
+		if '[TAXON_ID]' in line:
+			line = line.replace('[TAXON_ID]', species_id)
+		elif '[TAXON_LABEL]' in line:
+			if '"' in species_label:
+				species_label = species_label.replace('"', "\\\"")
+			line = line.replace('[TAXON_LABEL]', species_label)
+		lines.append(line)
+	return ''.join(lines)
+
 def get_query_template(branch_query_template):
 	'''Read in the query template file to return it as a string.'''
 	with open(branch_query_template, 'r') as f:
 		return f.readlines()
 
+def get_protein_changes(protein_changes_table):
+	'''Generate a map of species ID -> (added, removed) sets of UniProt 
+	accessions based on the protein changes table. Changed proteins are not 
+	included, since only the accessions matter for the branch.'''
+	protein_changes = {}
+	with open(protein_changes_table, 'r') as f:
+		reader = csv.DictReader(f)
+		for row in reader:
+			species_id = row['Species ID']
+			added, removed = protein_changes.setdefault(
+				species_id, (set(), set()))
+			if row['Database'] != 'UniProt':
+				continue
+			if row['Change'] == 'added':
+				added.add(row['Accession'])
+			elif row['Change'] == 'removed':
+				removed.add(row['Accession'])
+	return protein_changes
+
 def get_active_proteins(active_proteins_table):
 	'''Generate a map of species ID -> list of active proteins based on the 
 	active proteins table.'''
 	active_proteins = {}
-	with open(active_proteins_table, 'r') as f:
-		next(f)
-		reader = csv.reader(f)
-		for row in reader:
-			species_id = row[4]
-			protein_id = row[0]
-			database = row[1]
-			if species_id in active_proteins:
-				proteins = active_proteins[species_id]
-			else:
-				proteins = []
-			proteins.append('%s:%s' % (database, protein_id))
-			active_proteins[species_id] = proteins
+	columns = ['Accession', 'Database', 'Proteome ID']
+	for row in tables.read_rows(active_proteins_table, columns):
+		species_id = row['Proteome ID']
+		protein_id = row['Accession']
+		database = row['Database']
+		if species_id in active_proteins:
+			proteins = active_proteins[species_id]
+		else:
+			proteins = []
+		proteins.append('%s:%s' % (database, protein_id))
+		active_proteins[species_id] = proteins
 	return active_proteins
 
-# Track all errors
+# Track all errors (collected from each species)
 errors = []
-
-# UniProt reference proteome download
-uniprot = 'http://www.uniprot.org/uniprot/?query=proteome:%s\
-&compress=yes&force=true&format=%s'
-
-# ROBOT commands
-query_cmd = 'java -Xmx8G -jar util/robot.jar query \
- --tdb true --input {0}/proteome.rdf \
- --query {0}/build-branch.rq {0}/branch.ttl'
-merge_cmd = 'java -Xmx8G -jar util/robot.jar merge \
- --input {0}/branch.ttl --input {0}/synonyms.ttl --output {0}/branch.ttl'
-filter_cmd = 'java -Xmx8G -jar util/robot.jar \
- --prefix \'UniProt: http://www.uniprot.org/uniprot/"\' filter \
- --input {0}/branch.ttl --term-file {0}/active-proteins.txt \
- --select "self ancestors descendants annotations" --output {0}/branch.ttl'
-
-# Setting for large tables
-csv.field_size_limit(sys.maxsize)
+errors_file = 'update-branches-errors.txt'
+# touched when any branch is updated (a prerequisite of build/branches.nt.gz)
+branches_stamp = 'build/branches.stamp'
+
+# ROBOT commands (arguments after 'java -jar robot.jar')
+query_cmd = ['query', '--tdb', 'true', '--input', '{0}/proteome.rdf',
+	'--query', '{0}/build-branch.rq', '{0}/branch-raw.ttl']
+filter_cmd = ['--prefix', 'UniProt: http://www.uniprot.org/uniprot/',
+	'filter', '--input', '{0}/branch-full.ttl',
+	'--term-file', '{0}/active-proteins.txt',
+	'--select', 'self ancestors descendants annotations',
+	'--output', '{0}/branch-trimmed.ttl']
+
+# species ID -> (added, removed) accessions, see get_protein_changes()
+protein_changes = {}
+# last branch of each species, see catalog.Catalog.branch_index()
+cache_index = {}
+
+# ROBOT worker for this process, see get_robot()
+robot = None
+robot_options = (False, None)
+
+def touch(path):
+	'''Set the modification time of a file to now, creating it if needed.'''
+	with open(path, 'a'):
+		pass
+	os.utime(path)
 
 def on_exit():
-	'''Write any errors on exit.'''
+	'''Write any errors on exit. The errors of each species are also kept in 
+	the catalog (see catalog.py status).'''
 	if len(errors) > 0:
-		with open('update-branches-errors.txt', 'w') as f:
+		with open(errors_file, 'w') as f:
 			for e in errors:
 				f.write(e + '\n')
 	print('%d errors' % len(errors))
@@ -284,6 +608,7 @@ def on_exit():
 # execute
 if __name__ == '__main__':
 	atexit.register(on_exit)
-	main(sys.argv)	
+	with tracing.script(sys.argv):
+		main(sys.argv)	
 
 